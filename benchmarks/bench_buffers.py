@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Measure StackedBuffers push throughput for various context sizes.
+
+The stacked buffers are configured like Sgrep would configure them for
+'-l N -t N' on a single line search, and fed a fixed number of lines.
+Throughput should stay flat as N grows.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from sgrep.StackedBuffers import StackedBuffers
+
+
+DEFAULT_CONTEXT_SIZES = [1, 10, 100, 500, 1000, 5000]
+
+
+def bench_push(context_size: int, nb_lines: int) -> float:
+    """
+    Push 'nb_lines' lines through a leading/search/trailing stack
+    :param context_size: number of lines of leading and trailing context
+    :param nb_lines: number of lines to push
+    :return: lines pushed per second
+    """
+    stacked_buffers = StackedBuffers([context_size, 1, context_size])
+    line = "x" * 80 + "\n"
+
+    start = time.perf_counter()
+    for _ in range(nb_lines):
+        stacked_buffers.push(line)
+    elapsed = time.perf_counter() - start
+
+    return nb_lines / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='StackedBuffers push benchmark')
+    parser.add_argument("--lines", "-n",
+                        dest="nb_lines",
+                        default=500000,
+                        type=int,
+                        help="Number of lines to push for each context size")
+    parser.add_argument("context_sizes",
+                        nargs="*",
+                        type=int,
+                        default=DEFAULT_CONTEXT_SIZES,
+                        help="Leading/trailing context sizes to measure")
+    args = parser.parse_args()
+
+    print(f"{'context':>8} {'lines/s':>12}")
+    for context_size in args.context_sizes:
+        print(f"{context_size:>8} {bench_push(context_size, args.nb_lines):>12.0f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
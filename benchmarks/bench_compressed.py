@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Compare searching a compressed log with '--log file.gz' against piping
+'zcat file.gz' (or 'bzcat', 'xzcat') into sgrep's stdin.
+
+A log is generated, compressed with each format, and both pipelines are
+timed on it for every engine. The decompressor command must be installed
+for its pipeline to be measured.
+"""
+import argparse
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SGREP = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "sgrep.py"))
+
+FORMATS = {
+    "gz": (gzip, "zcat"),
+    "bz2": (bz2, "bzcat"),
+    "xz": (lzma, "xzcat")
+}
+
+
+def write_log(path: str, module, nb_lines: int) -> None:
+    with module.open(path, "wt") as fd:
+        for i in range(nb_lines):
+            fd.write(f"2023-02-12 10:{i // 60 % 60:02}:{i % 60:02} INFO worker {i % 16} handled request {i} "
+                     f"in {i % 1000} ms\n")
+
+
+def run_time(command: str) -> float:
+    """
+    :return: best wall clock time of 3 runs of the shell 'command', in seconds
+    """
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.run(command, shell=True, check=True, stdout=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compressed log search benchmark')
+    parser.add_argument("--lines", "-n",
+                        dest="nb_lines",
+                        default=1000000,
+                        type=int,
+                        help="Number of lines of the generated log")
+    parser.add_argument("--pattern", "-p",
+                        dest="pattern",
+                        default="request 123456 ",
+                        help="Literal pattern to search for")
+    parser.add_argument("formats",
+                        nargs="*",
+                        help=f"Compression formats to measure among {', '.join(FORMATS)}, defaults to all of them")
+    args = parser.parse_args()
+    for fmt in args.formats:
+        if fmt not in FORMATS:
+            parser.error(f"unknown format '{fmt}'")
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print(f"{'format':>6} {'engine':>7} {'--log':>8} {'pipe':>8}")
+        for fmt in args.formats or list(FORMATS):
+            module, decompressor = FORMATS[fmt]
+            path = os.path.join(tmp_dir, f"bench.log.{fmt}")
+            write_log(path, module, args.nb_lines)
+            for engine in ["stream", "block"]:
+                sgrep = f"{sys.executable} {SGREP} --engine {engine} '{args.pattern}'"
+                direct = run_time(f"{sgrep} --log {path}")
+                if shutil.which(decompressor):
+                    pipe = f"{run_time(f'{decompressor} {path} | {sgrep}'):>8.3f}"
+                else:
+                    pipe = f"{'n/a':>8}"
+                print(f"{fmt:>6} {engine:>7} {direct:>8.3f} {pipe}")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Measure the cost of '--follow': CPU used while the followed file is idle,
+and latency between a matching line being appended and sgrep outputting it.
+
+sgrep is started on an empty file for each poll interval. It is left idle to
+measure its CPU time, then matching lines are appended one at a time and the
+time until each one shows up on sgrep's stdout is recorded.
+"""
+import argparse
+import os
+import random
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+SGREP = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "sgrep.py"))
+
+DEFAULT_POLL_INTERVALS = [0.01, 0.05, 0.25, 1.0]
+
+
+def children_cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def bench_follow(path: str, poll_interval: float, idle_time: float, nb_matches: int) -> (float, float):
+    """
+    :return: (idle CPU time in % of a core, average match latency in ms)
+    """
+    with open(path, "w"):
+        pass
+    process = subprocess.Popen([sys.executable, SGREP, "--follow", "--poll-interval", str(poll_interval),
+                                "--follow-timeout", "0", "--log", path, "match"],
+                               stdout=subprocess.PIPE, text=True)
+    try:
+        # Let the interpreter start before measuring
+        time.sleep(1)
+        latencies = []
+        with open(path, "a") as fd:
+            for i in range(nb_matches):
+                # Don't write in sync with the polling
+                time.sleep(random.uniform(0, poll_interval))
+                start = time.perf_counter()
+                fd.write(f"match {i}\n")
+                fd.flush()
+                process.stdout.readline()
+                process.stdout.readline()
+                latencies.append(time.perf_counter() - start)
+        time.sleep(idle_time)
+    finally:
+        process.send_signal(signal.SIGINT)
+        process.communicate()
+
+    # Startup cost is included, run the idle phase long enough to make it negligible
+    cpu = children_cpu_time()
+    return cpu, sum(latencies) / len(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Follow mode benchmark')
+    parser.add_argument("--idle", "-i",
+                        dest="idle_time",
+                        default=10.0,
+                        type=float,
+                        help="Seconds sgrep is left idle for each poll interval")
+    parser.add_argument("--matches", "-m",
+                        dest="nb_matches",
+                        default=20,
+                        type=int,
+                        help="Number of matching lines appended to measure latency")
+    parser.add_argument("poll_intervals",
+                        nargs="*",
+                        type=float,
+                        default=DEFAULT_POLL_INTERVALS,
+                        help="Poll intervals to measure, in seconds")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print(f"{'poll (s)':>9} {'CPU (s)':>9} {'CPU %':>7} {'latency (ms)':>13}")
+        previous_cpu = children_cpu_time()
+        for poll_interval in args.poll_intervals:
+            start = time.perf_counter()
+            cpu, latency = bench_follow(os.path.join(tmp_dir, "follow.log"), poll_interval, args.idle_time,
+                                        args.nb_matches)
+            cpu, previous_cpu = cpu - previous_cpu, cpu
+            elapsed = time.perf_counter() - start
+            print(f"{poll_interval:>9.2f} {cpu:>9.3f} {cpu / elapsed:>7.2%} {latency:>13.1f}")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
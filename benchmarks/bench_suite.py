@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: StackedBuffers.push, Sgrep.run with every engine on literal,
+regex and multiline patterns and various context sizes, and the command line
+tool end to end, all on a log written by loggen.py.
+
+Each case runs in its own process so its peak RSS can be measured, the best time
+of '--repeat' runs is kept. Results are printed, written to a JSON file with
+'--output', and compared against a previous results file with '--baseline':
+cases slower than the baseline by more than '--tolerance' are reported as
+regressions and make the suite exit with 1.
+
+    benchmarks/bench_suite.py -o baseline.json
+    ... change things ...
+    benchmarks/bench_suite.py --baseline baseline.json
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS isn't measured
+    resource = None
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from loggen import DISTRIBUTIONS, NEEDLE, generate_log
+
+SGREP = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "sgrep.py"))
+
+PATTERNS = {
+    "literal": [f"ERROR {NEEDLE}", False, 1],
+    "regex": [r"ERROR sgrep-\w+ id=\d+", True, 1],
+    # No literal to rule windows out with, the regex runs on every window
+    "regex-nolit": [r"(?i)error SGREP-bench id=\d+", True, 1],
+    "multiline": [f"failed\ncaused by {NEEDLE}", False, 2],
+    "multiline-regex": [r"id=\d+ failed\ncaused by \S+", True, 2]
+}
+
+CONTEXT_SIZES = [0, 5]
+
+
+def make_cases() -> []:
+    """
+    :return: list of cases, dicts with at least a 'name' and a 'kind'
+    """
+    cases = [{"name": f"push/ctx{n}", "kind": "push", "context": n} for n in [1, 10, 100]]
+    for engine in ["stream", "block", "mmap"]:
+        for pattern in PATTERNS:
+            for context in CONTEXT_SIZES:
+                cases.append({"name": f"run/{engine}/{pattern}/ctx{context}", "kind": "run", "engine": engine,
+                              "pattern": pattern, "context": context})
+    for name, options in [["stream", ["--engine", "stream"]],
+                          ["block", ["--engine", "block"]],
+                          ["mmap", ["--engine", "mmap"]],
+                          ["mmap-ctx5", ["--engine", "mmap", "-l", "5", "-t", "5"]],
+                          ["mmap-count", ["--engine", "mmap", "--count"]]]:
+        cases.append({"name": f"cli/{name}", "kind": "cli", "options": options})
+    return cases
+
+
+def _count_lines(path: str) -> int:
+    nb_lines = 0
+    with open(path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(1024 * 1024), b""):
+            nb_lines += chunk.count(b"\n")
+    return nb_lines
+
+
+def _peak_rss_kb(children: bool) -> (None, int):
+    """
+    :param children: peak RSS of the largest child process waited for, of this process otherwise
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _run_push(case: dict, nb_lines: int) -> None:
+    from sgrep.StackedBuffers import StackedBuffers
+    stacked_buffers = StackedBuffers([case["context"], 1, case["context"]])
+    line = "x" * 99 + "\n"
+    for _ in range(nb_lines):
+        stacked_buffers.push(line)
+
+
+def _run_search(case: dict, path: str) -> None:
+    from sgrep.FileSearch import ENGINES
+    pattern, regex, search_ctx_size = PATTERNS[case["pattern"]]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with open(path, "rb" if case["engine"] == "mmap" else "r") as fd:
+            grepper = ENGINES[case["engine"]](fd, case["context"], search_ctx_size, case["context"])
+            grepper.set_show_markers(False)
+            grepper.setup(pattern, regex, False)
+            grepper.run()
+
+
+def _run_cli(case: dict, path: str) -> None:
+    subprocess.run([sys.executable, SGREP] + case["options"] + [PATTERNS["literal"][0], path],
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def run_case(case: dict, path: str, repeat: int) -> dict:
+    """
+    Run 'case' on the log 'path', in the current process
+    :return: dict of the measures
+    """
+    nb_lines = _count_lines(path)
+    size = os.path.getsize(path)
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if case["kind"] == "push":
+            _run_push(case, nb_lines)
+        elif case["kind"] == "run":
+            _run_search(case, path)
+        else:
+            _run_cli(case, path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        "seconds": best,
+        "lines_per_s": nb_lines / best,
+        "mb_per_s": size / 1000000 / best,
+        "peak_rss_kb": _peak_rss_kb(children=case["kind"] == "cli")
+    }
+
+
+def run_case_process(case: dict, path: str, repeat: int) -> dict:
+    """
+    Run 'case' in a new process, so the peak RSS is its own
+    """
+    completed = subprocess.run([sys.executable, __file__, "--worker", json.dumps(case), "--repeat", str(repeat), path],
+                               check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(completed.stdout)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> []:
+    """
+    :return: names of the cases slower than in 'baseline' by more than 'tolerance'
+    """
+    regressions = []
+    print(f"\n{'case':<36} {'baseline MB/s':>14} {'MB/s':>10} {'change':>8}")
+    for name, measures in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["mb_per_s"], measures["mb_per_s"]
+        change = after / before - 1
+        flag = ""
+        if change < -tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<36} {before:>14.1f} {after:>10.1f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='sgrep benchmark suite')
+    parser.add_argument("--size-mb",
+                        dest="size_mb",
+                        default=10,
+                        type=float,
+                        help="Approximate size of the generated log, in MB")
+    parser.add_argument("--line-length",
+                        dest="line_length",
+                        default=100,
+                        type=int,
+                        help="Mean line length of the generated log")
+    parser.add_argument("--distribution",
+                        dest="distribution",
+                        default="lognormal",
+                        choices=DISTRIBUTIONS,
+                        help="Distribution of the line lengths of the generated log")
+    parser.add_argument("--match-density",
+                        dest="match_density",
+                        default=0.001,
+                        type=float,
+                        help="Fraction of the lines of the generated log starting a pair of matching lines")
+    parser.add_argument("--seed",
+                        dest="seed",
+                        default=0,
+                        type=int,
+                        help="Random seed of the generated log")
+    parser.add_argument("--repeat",
+                        dest="repeat",
+                        default=3,
+                        type=int,
+                        help="Number of runs of each case, the best time is kept")
+    parser.add_argument("--filter", "-k",
+                        dest="filters",
+                        default=[],
+                        action="append",
+                        help="Only run the cases whose name holds this string, can be repeated")
+    parser.add_argument("--output", "-o",
+                        dest="output",
+                        default=None,
+                        help="JSON file to write the results to")
+    parser.add_argument("--baseline",
+                        dest="baseline",
+                        default=None,
+                        help="JSON results file to compare against")
+    parser.add_argument("--tolerance",
+                        dest="tolerance",
+                        default=0.1,
+                        type=float,
+                        help="Slowdown over the baseline reported as a regression, 0.1 for 10%%")
+    parser.add_argument("--worker",
+                        dest="worker",
+                        default=None,
+                        help=argparse.SUPPRESS)
+    parser.add_argument("log",
+                        nargs="?",
+                        default=None,
+                        help="Log to search instead of generating one")
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_case(json.loads(args.worker), args.log, args.repeat)))
+        return 0
+
+    cases = [c for c in make_cases() if not args.filters or any(f in c["name"] for f in args.filters)]
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = args.log
+        log_args = None
+        if path is None:
+            path = os.path.join(tmp_dir, "bench.log")
+            log_args = {"size": int(args.size_mb * 1000000), "mean_line_length": args.line_length,
+                        "distribution": args.distribution, "match_density": args.match_density, "seed": args.seed}
+            nb_lines, nb_matches = generate_log(path, **log_args)
+            print(f"Generated {nb_lines} lines, {nb_matches} matches, {os.path.getsize(path)} bytes")
+
+        results = {}
+        print(f"{'case':<36} {'seconds':>8} {'lines/s':>12} {'MB/s':>8} {'peak RSS KB':>12}")
+        for case in cases:
+            measures = run_case_process(case, path, args.repeat)
+            results[case["name"]] = measures
+            print(f"{case['name']:<36} {measures['seconds']:>8.3f} {measures['lines_per_s']:>12.0f} "
+                  f"{measures['mb_per_s']:>8.1f} {measures['peak_rss_kb'] or 'n/a':>12}")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    if args.output is not None:
+        with open(args.output, "w") as fd:
+            json.dump({
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "log": log_args or {"path": os.path.abspath(path)},
+                "repeat": args.repeat,
+                "results": results
+            }, fd, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as fd:
+            baseline = json.load(fd)
+        if baseline.get("log") != (log_args or {"path": os.path.abspath(path)}):
+            print("WARNING: the baseline was measured on another log", file=sys.stderr)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
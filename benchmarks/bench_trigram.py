@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Measure the trigram index on a generated corpus: build time, index size and
+query speedup over a full scan of the file with the mmap engine.
+
+The corpus mimics application logs: timestamps, levels, host and user names,
+request ids and a few rare error messages. Each query is run once without the
+index and once with it, the output of both runs must be the same.
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SGREP = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "sgrep.py"))
+
+QUERIES = [
+    ["rare literal", ["OutOfMemoryError"]],
+    ["request id", ["req=7f3a9c"]],
+    ["regex with literal", ["-r", r"user=alice\d+ .*status=503"]],
+    ["many literals", ["-e", "OutOfMemoryError", "-e", "deadlock detected"]],
+    ["common literal", ["INFO"]]
+]
+
+
+def write_corpus(path: str, size_mb: int) -> None:
+    rng = random.Random(0)
+    levels = ["INFO"] * 8 + ["WARN", "DEBUG"]
+    users = [f"{name}{i}" for name in ["alice", "bob", "carol", "dave"] for i in range(50)]
+    lines = []
+    for i in range(20000):
+        line = f"2023-02-12 10:{i // 600 % 60:02}:{i // 10 % 60:02}.{i % 1000:03} {rng.choice(levels)} " \
+               f"host{rng.randrange(64):02} req={rng.getrandbits(48):012x} user={rng.choice(users)} " \
+               f"status={rng.choice([200, 200, 200, 404, 503])} took {rng.randrange(5000)}ms\n"
+        lines.append(line)
+    chunk = "".join(lines).encode()
+    with open(path, "wb") as fd:
+        for i in range(size_mb * 1024 * 1024 // len(chunk) + 1):
+            fd.write(chunk.replace(b"req=", b"req=%x" % (i % 16), 1))
+            if i % 97 == 0:
+                fd.write(b"2023-02-12 11:00:00.000 ERROR host07 java.lang.OutOfMemoryError: heap\n")
+            if i % 389 == 0:
+                fd.write(b"2023-02-12 11:00:00.000 ERROR host11 deadlock detected\n")
+        fd.write(b"2023-02-12 12:00:00.000 INFO host01 req=7f3a9c user=zed status=200 took 1ms\n")
+
+
+def run_query(path: str, args: []) -> (float, bytes):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, SGREP, "--engine", "mmap"] + args + [path],
+                            check=True, stdout=subprocess.PIPE).stdout
+    return time.perf_counter() - start, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trigram index benchmark')
+    parser.add_argument("--size", "-s",
+                        dest="size_mb",
+                        default=2048,
+                        type=int,
+                        help="Size of the generated corpus in MB")
+    parser.add_argument("--jobs", "-j",
+                        dest="jobs",
+                        default=os.cpu_count() or 1,
+                        type=int,
+                        help="Number of processes building the index")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, "corpus.log")
+        write_corpus(path, args.size_mb)
+        size = os.path.getsize(path)
+
+        full_scans = [run_query(path, query) for _, query in QUERIES]
+
+        start = time.perf_counter()
+        subprocess.run([sys.executable, SGREP, "index", "--jobs", str(args.jobs), path],
+                       check=True, stdout=subprocess.DEVNULL)
+        build_time = time.perf_counter() - start
+        index_size = os.path.getsize(path + ".sgtri")
+
+        print(f"corpus: {size / 1024 ** 2:.0f} MB, index: {index_size / 1024 ** 2:.2f} MB "
+              f"({index_size / size:.2%}), built in {build_time:.2f}s with {args.jobs} jobs")
+        print(f"{'query':<20} {'full scan':>10} {'indexed':>10} {'speedup':>8}")
+        for (name, query), (full_time, full_output) in zip(QUERIES, full_scans):
+            indexed_time, indexed_output = run_query(path, query)
+            if indexed_output != full_output:
+                raise Exception(f"Output differs for '{name}'")
+            print(f"{name:<20} {full_time:>9.2f}s {indexed_time:>9.2f}s {full_time / indexed_time:>7.1f}x")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
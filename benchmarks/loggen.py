@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic log generator for the benchmarks.
+
+Lines look like application logs: a timestamp, a level, a host and filler words,
+their length following a configurable distribution. A fraction of the lines, the
+match density, are replaced by a pair of lines the benchmark patterns look for:
+
+    ... ERROR sgrep-bench id=1234 failed
+    caused by sgrep-bench worker 7
+
+The same arguments and seed always produce the same file.
+"""
+import argparse
+import random
+import sys
+
+NEEDLE = "sgrep-bench"
+
+DISTRIBUTIONS = ["fixed", "uniform", "lognormal"]
+
+# Filler lines are cut from this text, it holds neither the needle nor newlines
+WORDS = ["request", "handled", "user", "session", "cache", "miss", "hit", "queue", "worker", "latency",
+         "upstream", "timeout", "retry", "connection", "pool", "database", "query", "index", "shard", "replica"]
+
+
+def _line_length(rng: random.Random, distribution: str, mean: int) -> int:
+    if distribution == "fixed":
+        return mean
+    if distribution == "uniform":
+        return rng.randint(mean // 2, mean * 3 // 2)
+    # Mostly short lines with a long tail, like real logs
+    return min(int(rng.lognormvariate(0, 0.5) * mean / 1.13), mean * 20)
+
+
+def generate_log(path: str, size: int, mean_line_length: int = 100, distribution: str = "lognormal",
+                 match_density: float = 0.001, seed: int = 0) -> (int, int):
+    """
+    Write a log of about 'size' bytes to 'path'
+    :param mean_line_length: mean length of the lines, newline included
+    :param distribution: distribution of the line lengths, see DISTRIBUTIONS
+    :param match_density: probability for a line to start a pair of matching lines
+    :return: (number of lines, number of matching line pairs)
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise Exception(f"Unknown line length distribution: {distribution}")
+
+    rng = random.Random(seed)
+    filler = " ".join([rng.choice(WORDS) for _ in range(100000)])
+    levels = ["INFO"] * 8 + ["WARN", "DEBUG"]
+
+    nb_lines = 0
+    nb_matches = 0
+    written = 0
+    with open(path, "w", encoding="utf-8", newline="\n") as fd:
+        while written < size:
+            lines = []
+            for _ in range(10000):
+                i = nb_lines + len(lines)
+                prefix = f"2023-02-12 {i // 3600000 % 24:02}:{i // 60000 % 60:02}:{i // 1000 % 60:02}.{i % 1000:03} " \
+                         f"{rng.choice(levels)} host{rng.randrange(64):02} "
+                if rng.random() < match_density:
+                    lines.append(f"{prefix}ERROR {NEEDLE} id={rng.randrange(10000)} failed\n")
+                    lines.append(f"caused by {NEEDLE} worker {rng.randrange(16)}\n")
+                    nb_matches += 1
+                    continue
+                start = rng.randrange(len(filler) // 2)
+                length = max(0, _line_length(rng, distribution, mean_line_length) - len(prefix) - 1)
+                lines.append(prefix + filler[start:start + length] + "\n")
+            chunk = "".join(lines)
+            fd.write(chunk)
+            written += len(chunk)
+            nb_lines += len(lines)
+    return nb_lines, nb_matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic log generator')
+    parser.add_argument("--size-mb",
+                        dest="size_mb",
+                        default=10,
+                        type=float,
+                        help="Approximate size of the log, in MB")
+    parser.add_argument("--line-length",
+                        dest="line_length",
+                        default=100,
+                        type=int,
+                        help="Mean line length")
+    parser.add_argument("--distribution",
+                        dest="distribution",
+                        default="lognormal",
+                        choices=DISTRIBUTIONS,
+                        help="Distribution of the line lengths")
+    parser.add_argument("--match-density",
+                        dest="match_density",
+                        default=0.001,
+                        type=float,
+                        help="Fraction of the lines starting a pair of matching lines")
+    parser.add_argument("--seed",
+                        dest="seed",
+                        default=0,
+                        type=int,
+                        help="Random seed")
+    parser.add_argument("path",
+                        help="Log file to write")
+    args = parser.parse_args()
+
+    nb_lines, nb_matches = generate_log(args.path, int(args.size_mb * 1000000), args.line_length,
+                                        args.distribution, args.match_density, args.seed)
+    print(f"{args.path}: {nb_lines} lines, {nb_matches} matches")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,20 +6,43 @@ to be matched in a text file.
 Note that grep/egrep may offer similar functionalities, but the
 regex support is experimental at the time this tool was written.
 """
-from sgrep.Sgrep import Sgrep
+from sgrep.FileSearch import *
+from sgrep.Server import *
 
 import argparse
+import cProfile
+import glob
 import os
+import signal
 import sys
+import time
 
 
-def parse_cmdline():
+def parse_cmdline(argv: (None, []) = None):
+    """
+    :param argv: command line arguments, those of the process if None
+    """
+    argv = sys.argv[1:] if argv is None else argv
     parser = argparse.ArgumentParser(description='Smart log grepper')
 
     parser.add_argument("--log",
                         dest="logfile",
                         default=None,
-                        help="Filename to read data from, if not used, reads data from stdin")
+                        help="Filename to read data from, if neither this nor 'paths' are used, reads data from stdin. "
+                             "gzip, bzip2 and xz compressed files are decompressed on the fly")
+
+    parser.add_argument("--recursive", "-R",
+                        dest="recursive",
+                        default=False,
+                        action="store_true",
+                        help="Search files in the directories given, recursively")
+
+    parser.add_argument("--jobs", "-j",
+                        dest="jobs",
+                        default=os.cpu_count() or 1,
+                        type=int,
+                        help="Number of processes searching files in parallel when there are many, defaults to the "
+                             "number of CPUs")
 
     parser.add_argument("--ctx-tags",
                         dest="context_tags",
@@ -33,6 +56,13 @@ def parse_cmdline():
                         action="store_true",
                         help="Pattern given is a regular expression")
 
+    parser.add_argument("--ignore-case", "-i",
+                        dest="ignore_case",
+                        default=False,
+                        action="store_true",
+                        help="Ignore case: literal patterns are compared to lowercased lines, only ASCII letters "
+                             "being lowercased in bytes mode, regexes are compiled with 're.IGNORECASE'")
+
     parser.add_argument("--leading-lines", "-l",
                         dest="leading_lines",
                         default=Sgrep.DEFAULT_CONTEXT_LEADING_LINES,
@@ -60,19 +90,192 @@ def parse_cmdline():
                         type=int,
                         help="If specified, overrides the matching buffer number of lines set based on the pattern number of '\n'")
 
+    parser.add_argument("--line-number", "-n",
+                        dest="line_number",
+                        default=False,
+                        action="store_true",
+                        help="Prefix output lines with their line number, followed by ':' for the search context "
+                             "and '-' for the leading and trailing context. With '--follow', the lines already in "
+                             "the file are counted first")
+
+    parser.add_argument("--index",
+                        dest="index",
+                        default=False,
+                        action="store_true",
+                        help="Keep an index of the line starts of searched files next to them ('<file>%s'), "
+                             "extended when files grow. Used by the mmap engine to find line numbers and by "
+                             "'--split' to give each process the same number of lines" % LineIndex.SUFFIX)
+
+    parser.add_argument("--split",
+                        dest="split",
+                        default=1,
+                        type=int,
+                        help="Search a single large file with this many processes, each one checking a range of the "
+                             "file. Implies '--engine mmap'")
+
+    parser.add_argument("--engine",
+                        dest="engine",
+                        default="stream",
+                        choices=["stream", "block", "mmap"],
+                        help="'stream' reads and matches line by line, 'block' searches large blocks at once and only "
+                             "rebuilds context around hits, which is much faster on large inputs with few matches. "
+                             "'mmap' searches the memory mapped '--log' file as bytes, it falls back to 'stream' "
+                             "when reading from stdin or a pipe. Defaults to 'stream'")
+
+    parser.add_argument("--follow", "-F",
+                        dest="follow",
+                        default=False,
+                        action="store_true",
+                        help="Keep searching the lines appended to the file, like 'tail -f', until interrupted. "
+                             "Rotated and truncated files are followed from their start")
+
+    parser.add_argument("--poll-interval",
+                        dest="poll_interval",
+                        default=FollowedFile.DEFAULT_POLL_INTERVAL,
+                        type=float,
+                        help="Seconds between checks for new lines with '--follow', defaults to %.2f" %
+                             FollowedFile.DEFAULT_POLL_INTERVAL)
+
+    parser.add_argument("--follow-timeout",
+                        dest="follow_timeout",
+                        default=FollowSgrep.DEFAULT_IDLE_TIMEOUT,
+                        type=float,
+                        help="With '--follow', matches still waiting for trailing lines are output once no line was "
+                             "appended for this many seconds, defaults to %.1f" % FollowSgrep.DEFAULT_IDLE_TIMEOUT)
+
+    parser.add_argument("--bytes", "-b",
+                        dest="bytes_mode",
+                        default=False,
+                        action="store_true",
+                        help="Search the raw bytes of the input instead of decoded text, only the emitted lines are "
+                             "decoded. Always the case with '--engine mmap'")
+
+    parser.add_argument("--encoding",
+                        dest="encoding",
+                        default=None,
+                        help="Encoding of the input, defaults to the locale encoding in text mode and to "
+                             f"'{MmapSgrep.DEFAULT_ENCODING}' in bytes mode")
+
+    parser.add_argument("--errors",
+                        dest="errors",
+                        default=None,
+                        choices=["strict", "replace", "ignore", "backslashreplace", "surrogateescape"],
+                        help="How undecodable bytes are handled, defaults to 'strict' in text mode and to 'replace' "
+                             "in bytes mode")
+
+    parser.add_argument("--stats",
+                        dest="stats",
+                        default=False,
+                        action="store_true",
+                        help="Print search statistics on stderr: windows skipped, lines and bytes read, time "
+                             "spent reading, moving buffers, matching, outputting and scanning, throughput and "
+                             "peak memory")
+
+    parser.add_argument("--profile",
+                        dest="profile",
+                        default=None,
+                        help="Profile the search with cProfile and dump the statistics to this file, for 'pstats' "
+                             "or 'snakeviz'. Worker processes of '-j' and '--split' aren't profiled")
+
+    parser.add_argument("--output-format",
+                        dest="output_format",
+                        default="text",
+                        choices=list(SINKS.keys()),
+                        help="'text' outputs matches separated by blank lines, 'jsonl' one JSON object per match and "
+                             "'nul' is the same as 'text' with matches terminated by a NUL character. Defaults to "
+                             "'text'")
+
+    parser.add_argument("--group-contexts", "-g",
+                        dest="group_contexts",
+                        default=False,
+                        action="store_true",
+                        help="Merge matches whose lines overlap or are adjacent into a single group of lines, each "
+                             "line being output once and groups being separated by '--', like grep does. "
+                             "'--stats' reports the output bytes saved")
+
+    parser.add_argument("--count",
+                        dest="count",
+                        default=False,
+                        action="store_true",
+                        help="Only output the number of matches of each file")
+
+    parser.add_argument("--files-with-matches",
+                        dest="files_with_matches",
+                        default=False,
+                        action="store_true",
+                        help="Only output the name of the files holding a match, the search of a file stops at "
+                             "its first match")
+
+    parser.add_argument("--max-count",
+                        dest="max_count",
+                        default=None,
+                        type=int,
+                        help="Stop searching a file after this many matches")
+
+    parser.add_argument("--since",
+                        dest="since",
+                        default=None,
+                        help="Only search the lines logged at or after this time, in the '--time-format' format or "
+                             "ISO 8601 ('2023-02-12 10:00'). The lines of the file must be in time order: the window "
+                             "is found by bisecting the file instead of reading it. Needs an uncompressed regular "
+                             "file, implies '--engine mmap'. Leading context is still read before the window")
+
+    parser.add_argument("--until",
+                        dest="until",
+                        default=None,
+                        help="Only search the lines logged at or before this time, like '--since'")
+
+    parser.add_argument("--time-regex",
+                        dest="time_regex",
+                        default=TimeRange.DEFAULT_TIMESTAMP_REGEX,
+                        help="Regex finding the timestamp of a line for '--since' and '--until', its first group if "
+                             "it has one. Lines without one belong to the previous timestamped line. Defaults to "
+                             "ISO 8601 like timestamps")
+
+    parser.add_argument("--time-format",
+                        dest="time_format",
+                        default=None,
+                        help="'strptime' format of the timestamps, like '%%d/%%b/%%Y:%%H:%%M:%%S %%z'. Defaults to "
+                             "ISO 8601")
+
+    parser.add_argument("--pattern", "-e",
+                        dest="patterns",
+                        default=[],
+                        action="append",
+                        help="Pattern to search for, can be repeated to search for many patterns in a single pass. "
+                             "Matches are then tagged with the patterns found. 'grep_pattern' must be omitted")
+
+    parser.add_argument("--patterns-file", "-f",
+                        dest="patterns_file",
+                        default=None,
+                        help="File holding patterns to search for, one per line, like '-e'")
+
     parser.add_argument("grep_pattern",
+                        nargs="?",
                         default=None,
                         help="Grepping pattern, no need to double escape characters (be wary of shell expansion though!)")
 
-    parser.epilog = """NOTES
+    parser.add_argument("paths",
+                        nargs="*",
+                        default=[],
+                        help="Files, directories (with '--recursive') or glob patterns to search. When more than one "
+                             "file is searched, output lines are prefixed with the file name")
 
-TODO...
+    parser.epilog = f"""NOTES
+
+'{os.path.basename(sys.argv[0])} index FILE...' builds trigram indexes speeding up later searches of
+files which don't change anymore, see '{os.path.basename(sys.argv[0])} index --help'. Use '-e index'
+to search for the 'index' pattern.
+
+'{os.path.basename(sys.argv[0])} serve' keeps running and searches for 'sgrepc.py', which takes the same
+arguments as this tool, saving the startup time of every search, see
+'{os.path.basename(sys.argv[0])} serve --help'.
 """
-    if len(sys.argv) == 1:
+    if not argv:
         parser.print_help()
         sys.exit(0)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # error checking
     if args.captured_only and not args.regex:
@@ -83,38 +286,325 @@ TODO...
         print("ERROR: Leading/trailing lines of context must be >0")
         sys.exit(1)
 
-    if args.logfile is not None and not os.path.exists(args.logfile):
-        print(f"ERROR: {args.logfile} does not exist!")
+    if args.poll_interval <= 0 or args.follow_timeout < 0:
+        print("ERROR: Poll interval must be >0 and follow timeout >=0")
+        sys.exit(1)
+
+    if args.max_count is not None and args.max_count < 0:
+        print("ERROR: Max count must be >=0")
+        sys.exit(1)
+
+    if (args.count or args.files_with_matches) and (args.follow or args.group_contexts or
+                                                   args.output_format != "text"):
+        print("ERROR: '--count' and '--files-with-matches' can't be used with '--follow', '-g' or another "
+              "output format than 'text'")
+        sys.exit(1)
+
+    if args.split > 1 and (args.files_with_matches or args.max_count is not None):
+        print("ERROR: '--split' can't be used with '--files-with-matches' or '--max-count'")
+        sys.exit(1)
+
+    args.time_range = None
+    if args.since is not None or args.until is not None:
+        if args.follow:
+            print("ERROR: '--since' and '--until' can't be used with '--follow'")
+            sys.exit(1)
+        try:
+            args.time_range = TimeRange(args.since, args.until, args.time_regex, args.time_format)
+        except Exception as e:
+            print(f"ERROR: {str(e)}")
+            sys.exit(1)
+
+    if args.jobs < 1 or args.split < 1:
+        print("ERROR: Number of jobs/split ranges must be >0")
+        sys.exit(1)
+
+    if args.patterns_file is not None:
+        with open(args.patterns_file, "r") as fd:
+            args.patterns.extend([line.rstrip("\n") for line in fd if line.rstrip("\n")])
+
+    if args.patterns:
+        # No positional pattern, it's a path
+        if args.grep_pattern is not None:
+            args.paths.insert(0, args.grep_pattern)
+        args.grep_pattern = args.patterns[0] if len(args.patterns) == 1 else args.patterns
+    elif args.grep_pattern is None:
+        print("ERROR: No pattern given!")
         sys.exit(1)
+    else:
+        args.patterns = [args.grep_pattern]
+
+    if args.group_contexts and (args.captured_only or args.context_tags or args.output_format != "text"):
+        print("ERROR: '-g' can't be used with '-c', '--ctx-tags' or another output format than 'text'")
+        sys.exit(1)
+
+    if args.group_contexts and args.split > 1:
+        # Each process would only group the matches of its range
+        print("ERROR: '-g' can't be used with '--split'")
+        sys.exit(1)
+
+    if args.captured_only and len(args.patterns) > 1:
+        print("ERROR: '-c' can only be used with a single pattern")
+        sys.exit(1)
+
+    if args.logfile is not None:
+        if not os.path.exists(args.logfile):
+            print(f"ERROR: {args.logfile} does not exist!")
+            sys.exit(1)
+        # A file name, not a glob
+        args.paths.insert(0, glob.escape(args.logfile))
+
+    for path in args.paths:
+        if not any(c in path for c in "*?[") and not os.path.exists(path):
+            print(f"ERROR: {path} does not exist!")
+            sys.exit(1)
+
+    if args.multiline:
+        args.search_ctx_size = args.multiline
+    else:
+        args.search_ctx_size = max([p.count('\n') for p in args.patterns] + [1])
 
     return args
 
 
-def main():
-    args = parse_cmdline()
+def parse_index_cmdline(argv: []):
+    parser = argparse.ArgumentParser(prog=f"{os.path.basename(sys.argv[0])} index",
+                                     description="Build the trigram index of files which won't change anymore, "
+                                                 "like archived logs. The index is saved next to each file "
+                                                 f"('<file>{TrigramIndex.SUFFIX}'). Searches of an indexed file with "
+                                                 "'--engine mmap' or '--bytes' only scan the blocks which can hold "
+                                                 "a match. "
+                                                 "The index is ignored once the file changes.")
+
+    parser.add_argument("--block-size",
+                        dest="block_size",
+                        default=TrigramIndex.DEFAULT_BLOCK_SIZE,
+                        type=int,
+                        help="Approximate size in bytes of the blocks trigrams are indexed for, defaults to %u" %
+                             TrigramIndex.DEFAULT_BLOCK_SIZE)
+
+    parser.add_argument("--recursive", "-R",
+                        dest="recursive",
+                        default=False,
+                        action="store_true",
+                        help="Index files in the directories given, recursively")
 
+    parser.add_argument("--jobs", "-j",
+                        dest="jobs",
+                        default=os.cpu_count() or 1,
+                        type=int,
+                        help="Number of processes indexing blocks in parallel, defaults to the number of CPUs")
+
+    parser.add_argument("paths",
+                        nargs="+",
+                        help="Files, directories (with '--recursive') or glob patterns to index")
+
+    args = parser.parse_args(argv)
+    if args.block_size <= 0 or args.jobs < 1:
+        print("ERROR: Block size and number of jobs must be >0")
+        sys.exit(1)
+    return args
+
+
+def index_main(argv: []) -> int:
+    args = parse_index_cmdline(argv)
     try:
-        if args.logfile:
-            stream = open(args.logfile, "r")
-        else:
-            stream = sys.stdin
+        for path in expand_paths(args.paths, args.recursive):
+            if detect_compression(path) is not None:
+                raise Exception(f"{path}: compressed files can't be indexed")
+            start = time.perf_counter()
+            index = TrigramIndex.build(path, args.block_size, args.jobs)
+            index.save()
+            print(f"{path}: {index.nb_blocks} blocks, {index.nb_trigrams} trigrams, "
+                  f"{os.path.getsize(index.index_path)} bytes, {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f"Tool failed with:\n{str(e)}")
+        return 1
+    return 0
+
+
+def parse_serve_cmdline(argv: []):
+    parser = argparse.ArgumentParser(prog=f"{os.path.basename(sys.argv[0])} serve",
+                                     description="Keep running and search for 'sgrepc.py', which takes the same "
+                                                 "arguments as this tool. Searches are run one at a time, the "
+                                                 "compiled patterns and the indexes of the files searched are "
+                                                 "kept for the next searches. Searches of stdin, '--follow' and "
+                                                 "'--profile' are run by 'sgrepc.py' itself, like all searches "
+                                                 "when no server is listening. Stops on SIGINT or SIGTERM.")
 
-        if args.multiline:
-            search_ctx_size = args.multiline
-        elif '\n' in args.grep_pattern:
-            search_ctx_size = args.grep_pattern.count('\n')
+    parser.add_argument("--socket",
+                        dest="socket_path",
+                        default=default_socket_path(),
+                        help=f"Unix socket to listen on, only accessible by the current user, defaults to "
+                             f"'${SOCKET_ENV}' or to '%(default)s'")
+
+    parser.add_argument("--file-cache",
+                        dest="file_cache",
+                        default=FileCache.DEFAULT_SIZE,
+                        type=int,
+                        help="Number of files whose indexes are kept loaded, defaults to %u" % FileCache.DEFAULT_SIZE)
+
+    args = parser.parse_args(argv)
+    if args.file_cache <= 0:
+        print("ERROR: Number of cached files must be >0")
+        sys.exit(1)
+    return args
+
+
+def run_query(argv: [], cache: FileCache) -> (None, int):
+    """
+    Run a search sent to 'serve', like 'main' does
+    :param argv: command line arguments of the search
+    :return: exit code, None if the client must run the search itself
+    """
+    if argv[:1] in (["index"], ["serve"]):
+        return None
+    try:
+        args = parse_cmdline(argv)
+    except SystemExit as e:
+        return e.code
+    if not args.paths or args.follow or args.profile is not None:
+        # stdin is the client's, following never ends and profiling is for the search process
+        return None
+
+    # The output is the same, searching files one by one in this process uses the cache
+    args.jobs = 1
+    try:
+        failed = search(args, cache)
+    except Exception as e:
+        print(f"Tool failed with:\n{str(e)}")
+        return 1
+    if args.output_format == "text":
+        print("Done!")
+    return failed
+
+
+def serve_main(argv: []) -> int:
+    args = parse_serve_cmdline(argv)
+    cache = FileCache(args.file_cache)
+    try:
+        server = QueryServer(args.socket_path, lambda query_argv: run_query(query_argv, cache))
+    except Exception as e:
+        print(f"Tool failed with:\n{str(e)}")
+        return 1
+
+    # Stop the same way on SIGTERM and SIGINT
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        print(f"Listening on {args.socket_path}")
+        sys.stdout.flush()
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def search_many(args, paths: [], cache: (None, FileCache) = None) -> int:
+    failed = 0
+    for path, output, error in search_files(paths, args, args.jobs, cache, capture=False):
+        sys.stdout.write(output)
+        if error is not None:
+            print(f"ERROR: {path}: {error}", file=sys.stderr)
+            failed = 1
+    return failed
+
+
+def search_split(args, path: str) -> int:
+    failed = 0
+    nb_matches = 0
+    for output, error in search_file_split(path, args, args.split):
+        if args.count:
+            # Each range was counted on its own
+            nb_matches += int(output) if output else 0
         else:
-            search_ctx_size = 1
+            sys.stdout.write(output)
+        if error is not None:
+            print(f"ERROR: {path}: {error}", file=sys.stderr)
+            failed = 1
+    if args.count:
+        print(nb_matches)
+    return failed
+
 
-        grepper = Sgrep(stream, args.leading_lines, search_ctx_size, args.trailing_lines)
-        grepper.set_show_markers(args.context_tags)
-        grepper.setup(args.grep_pattern, args.regex, args.captured_only)
+def search_follow(args, path: str) -> int:
+    grepper, stream = open_grepper(path, args)
+    with stream:
+        # Stop following on interruption, matches waiting for context are still output
+        signal.signal(signal.SIGINT, lambda signum, frame: stream.stop())
+        signal.signal(signal.SIGTERM, lambda signum, frame: stream.stop())
         grepper.run()
+    report_stats(grepper, path)
+    if args.stats:
+        print(f"{path}: polls: {stream.polls}, rotations: {stream.rotations}, truncations: {stream.truncations}",
+              file=sys.stderr)
+    return 0
+
+
+def broken_pipe() -> int:
+    """
+    The reader of stdout went away, like 'head' does: stop quietly. stdout is pointed to
+    /dev/null so flushing it at exit doesn't fail again.
+    :return: exit code of a process killed by SIGPIPE
+    """
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    return 128 + signal.SIGPIPE
+
+
+def search(args, cache: (None, FileCache) = None) -> int:
+    paths = expand_paths(args.paths, args.recursive)
+    if args.follow:
+        if len(paths) != 1 or args.split > 1:
+            raise Exception("'--follow' needs a single file to search")
+        return search_follow(args, paths[0])
+    if args.split > 1:
+        if len(paths) != 1 or not os.path.isfile(paths[0]):
+            raise Exception("'--split' needs a single regular file to search")
+        return search_split(args, paths[0])
+    if len(paths) > 1 or args.recursive:
+        return search_many(args, paths, cache)
+
+    name = paths[0] if paths else "<stdin>"
+    grepper, stream = open_grepper(paths[0] if paths else None, args, cache)
+    with stream:
+        run_grepper(grepper, name, args, prefix=False)
+    report_stats(grepper, name)
+    return 0
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "index":
+        return index_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        return serve_main(sys.argv[2:])
+
+    args = parse_cmdline()
+
+    profiler = None
+    if args.profile is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        failed = search(args)
+    except BrokenPipeError:
+        return broken_pipe()
     except Exception as e:
         print(f"Tool failed with:\n{str(e)}")
         return 1
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
 
-    print("Done!")
+    if args.output_format == "text":
+        try:
+            print("Done!")
+            sys.stdout.flush()
+        except BrokenPipeError:
+            return broken_pipe()
+    return failed
 
 
 if __name__ == "__main__":
@@ -0,0 +1,317 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from sgrep.Sgrep import *
+
+from collections import deque
+
+import asyncio
+import codecs
+import locale
+import time
+
+
+class AsyncLineReader:
+    """
+    Async 'readline' over an asyncio.StreamReader or an async iterator of str or bytes.
+
+    The data doesn't need to come in lines, like what is received from a socket: it is
+    split on newlines and lines are returned once complete. Bytes are decoded when text
+    is expected, '\\r\\n' line ends being translated like text files do.
+    """
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, source, binary: bool = False, encoding: (None, str) = None, errors: (None, str) = None):
+        """
+        :param source: asyncio.StreamReader, or async iterator of str or bytes
+        :param binary: return bytes lines, str lines otherwise
+        :param encoding: encoding of the bytes read when returning str lines, defaults to the locale encoding
+        :param errors: how undecodable bytes are handled, see 'bytes.decode'
+        """
+        self._reader = source if isinstance(source, asyncio.StreamReader) else None
+        self._iterator = None if self._reader is not None else source.__aiter__()
+        self._binary = binary
+        self._decoder = None if binary else codecs.getincrementaldecoder(
+            encoding or locale.getpreferredencoding(False))(errors or "strict")
+        self._newline = b"\n" if binary else "\n"
+        self._partial = self._newline[:0]
+        self._lines = deque()
+        self._eof = False
+
+    async def _read(self) -> (None, str, bytes):
+        """
+        :return: next chunk of data, None at the end of the stream
+        """
+        if self._reader is not None:
+            return await self._reader.read(self.READ_SIZE) or None
+        try:
+            return await self._iterator.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def _add(self, data: (str, bytes)) -> None:
+        if isinstance(data, bytes) and self._decoder is not None:
+            data = self._decoder.decode(data)
+        elif isinstance(data, str) and self._binary:
+            raise Exception("Text read from a stream searched as bytes!")
+
+        lines = (self._partial + data).split(self._newline)
+        self._partial = lines.pop()
+        for line in lines:
+            if not self._binary and line.endswith("\r"):
+                line = line[:-1]
+            self._lines.append(line + self._newline)
+
+    def readline_nowait(self) -> (None, str, bytes):
+        """
+        :return: next line if already read, None if it must be awaited with 'readline'
+        """
+        return self._lines.popleft() if self._lines else None
+
+    async def readline(self) -> (str, bytes):
+        """
+        :return: next line, an empty one at the end of the stream
+        """
+        while not self._lines and not self._eof:
+            data = await self._read()
+            if data is not None:
+                self._add(data)
+                continue
+            if self._decoder is not None:
+                self._partial += self._decoder.decode(b"", final=True)
+            if self._partial:
+                # Last line, without a newline
+                self._lines.append(self._partial)
+            self._eof = True
+        return self._lines.popleft() if self._lines else self._newline[:0]
+
+
+class AsyncHookedStream:
+    """
+    AsyncLineReader reporting its reads to hooks, the time spent waiting for data included
+    """
+    def __init__(self, stream: AsyncLineReader, hooks: SearchHooks):
+        self._stream = stream
+        self._hooks = hooks
+
+    def readline_nowait(self) -> (None, str, bytes):
+        start = time.perf_counter()
+        line = self._stream.readline_nowait()
+        if line is not None:
+            self._hooks.on_read(1, len(line), time.perf_counter() - start)
+        return line
+
+    async def readline(self) -> (str, bytes):
+        start = time.perf_counter()
+        line = await self._stream.readline()
+        self._hooks.on_read(1 if line else 0, len(line), time.perf_counter() - start)
+        return line
+
+
+class AsyncStreamParser(StreamParser):
+    """
+    StreamParser reading lines from an AsyncLineReader, 'tick' and 'prime_buffers' are coroutines
+    """
+    def set_hooks(self, hooks: SearchHooks) -> None:
+        self._stream = AsyncHookedStream(self._stream, hooks)
+        untimed_tick = self.tick
+
+        async def tick() -> bool:
+            start = time.perf_counter()
+            more = await untimed_tick()
+            hooks.on_tick(time.perf_counter() - start)
+            return more
+        self.tick = tick
+
+    async def prime_buffers(self) -> None:
+        while True:
+            await self.tick()
+
+            if self._stacked_buffers.get_buffer(StreamParser.SEARCH_BUFFER).is_full:
+                break
+
+            if self.eof and self._stacked_buffers.get_buffer(StreamParser.TRAILING_BUFFER).is_empty:
+                break
+
+    async def tick(self) -> bool:
+        if not self.eof:
+            # Most lines were already read with the previous ones, don't wait for them
+            line = self._stream.readline_nowait()
+            self._last_read = line if line is not None else await self._stream.readline()
+
+        self._stacked_buffers.push(self._last_read)
+
+        return not self._stacked_buffers.is_empty
+
+
+class AsyncSgrep(Sgrep):
+    """
+    Sgrep for asyncio, searching an asyncio.StreamReader or an async iterator of str or bytes.
+
+    Buffers and matchers are Sgrep's, only reading lines awaits: a single event loop can
+    search many streams at once, like the output of subprocesses or sockets, each search
+    awaiting its own data. 'run', 'count' are coroutines and 'matches' an async generator,
+    see 'merged_matches' to get the matches of many searches as they're found.
+    """
+    STREAM_PARSER = AsyncStreamParser
+
+    def __init__(self, stream, leading_ctx_size, search_ctx_size, trailing_ctx_size, encoding=None, errors="strict",
+                 text_encoding=None):
+        """
+        :param stream: asyncio.StreamReader, or async iterator of str or bytes
+        :param encoding: if set, bytes read are searched without being decoded, like Sgrep does.
+                         Otherwise they're decoded with 'text_encoding' before being searched.
+        :param errors: how decoding errors are handled, see 'bytes.decode'
+        :param text_encoding: encoding of the bytes read when they're searched as text, defaults to the
+                              locale encoding
+        """
+        if encoding is not None and text_encoding is not None:
+            raise Exception("Bytes searched as bytes aren't decoded, 'text_encoding' can't be given with 'encoding'")
+        reader = AsyncLineReader(stream, binary=encoding is not None, encoding=text_encoding, errors=errors)
+        super(AsyncSgrep, self).__init__(reader, leading_ctx_size, search_ctx_size, trailing_ctx_size, encoding, errors)
+
+    def _prime(self) -> None:
+        # Priming awaits lines, done by '_run'
+        pass
+
+    async def run(self) -> None:
+        """
+        Search the whole stream, matches are output or saved as they're found
+        :return:
+        """
+        start = time.perf_counter()
+        try:
+            async for _ in self._run():
+                if self._max_count_reached():
+                    break
+            if not self._save_match_flag:
+                self._output(self._sink.finish)
+        finally:
+            if not self._save_match_flag:
+                self._output(self._sink.flush)
+            if self._hooks is not None:
+                self._hooks.on_search_end(time.perf_counter() - start)
+
+    async def count(self) -> int:
+        """
+        Search the whole stream, only counting the matches, see 'Sgrep.count'
+        :return: number of matches
+        """
+        self._count_only = True
+        start = time.perf_counter()
+        try:
+            async for _ in self._run():
+                if self._max_count_reached():
+                    break
+        finally:
+            self._count_only = False
+            if self._hooks is not None:
+                self._hooks.on_search_end(time.perf_counter() - start)
+        if self._max_count is not None:
+            return min(self._nb_matches, self._max_count)
+        return self._nb_matches
+
+    async def matches(self):
+        """
+        Search the whole stream, yielding each match once found, see 'Sgrep.matches'
+        :return: async generator of Match
+        """
+        start = time.perf_counter()
+        pending = []
+        process_match = self._process_match
+
+        def add_match(leading, match_str, trailing, patterns, line_number):
+            pending.append(Match(leading, match_str, trailing, patterns,
+                                 line_number if self._show_line_numbers else None))
+        self._process_match = add_match
+        try:
+            async for _ in self._run():
+                for match in pending:
+                    yield match
+                pending.clear()
+                if self._max_count_reached():
+                    return
+        finally:
+            self._process_match = process_match
+            if self._hooks is not None:
+                self._hooks.on_search_end(time.perf_counter() - start)
+
+    async def _run(self):
+        """
+        Search the whole stream, processing matches as they're found
+        :return: async generator yielding after matches were processed
+        """
+        await self._parser.prime_buffers()
+        while True:
+            match_str = self._grepper(*self._search_ctx.span)
+            if match_str is not None:
+                if self._count_only:
+                    self._emit(None, match_str, None)
+                else:
+                    self._emit(self._leading_ctx.buffer_str, match_str, self._trailing_ctx.buffer_str,
+                               self._parser.search_line + 1 if self._line_numbers else None)
+                yield
+            await self._parser.tick()
+            if self._search_ctx.is_empty:
+                break
+
+        if self._stats is not None:
+            self._stats.windows = self._stats.checked
+
+
+async def merged_matches(greppers: dict, queue_size: int = 1000):
+    """
+    Search many streams concurrently, yielding their matches as they're found.
+    Searches wait when 'queue_size' matches weren't consumed yet. Leaving the
+    iteration early cancels the searches still running.
+    :param greppers: AsyncSgrep set up, by key
+    :param queue_size: maximum number of matches found but not consumed yet
+    :return: async generator of (key, Match)
+    """
+    queue = asyncio.Queue(queue_size)
+    done = object()
+
+    async def search(key, grepper: AsyncSgrep) -> None:
+        try:
+            async for match in grepper.matches():
+                await queue.put((key, match))
+        except Exception as e:
+            await queue.put((key, e))
+        else:
+            await queue.put((key, done))
+
+    tasks = [asyncio.create_task(search(key, grepper)) for key, grepper in greppers.items()]
+    try:
+        running = len(tasks)
+        while running:
+            key, match = await queue.get()
+            if isinstance(match, Match):
+                yield key, match
+            elif match is done:
+                running -= 1
+            else:
+                raise match
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,144 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import json
+import os
+import signal
+import socket
+import sys
+
+
+# Protocol of 'sgrep serve': the client sends a single JSON line, {"argv": [...], "cwd": "..."},
+# the command line arguments of the search and the directory they're relative to. The server
+# answers with JSON lines, frames:
+#   {"stdout": "..."}, {"stderr": "..."}    output of the search, in order
+#   {"exit": 0}                             last frame, exit code of the search
+#   {"local": true}                         last frame, the client must run the search itself
+SOCKET_ENV = "SGREP_SOCKET"
+
+
+def default_socket_path() -> str:
+    """
+    :return: socket 'sgrep serve' listens on by default, '$SGREP_SOCKET' if set, a socket in
+             a directory of the user in the runtime or temporary directory otherwise. The
+             directory is created private to the user by the server, see 'make_socket_directory'
+    """
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    directory = os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR") or "/tmp"
+    return os.path.join(directory, f"sgrep-{os.getuid()}", "sgrep.sock")
+
+
+def make_socket_directory(socket_path: str) -> None:
+    """
+    Create the directory of 'socket_path' if it doesn't exist, accessible by the user only.
+    Another user could have created it first in a shared directory like /tmp: an existing
+    directory must belong to the user, or to root like /tmp itself.
+    """
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    if os.stat(directory).st_uid not in (os.getuid(), 0):
+        raise Exception(f"{directory} belongs to another user")
+
+
+def check_socket_owner(socket_path: str) -> None:
+    """
+    Make sure the server listening on 'socket_path' is the user's: another user could have
+    created the socket first, and would then get the searches and the paths they're run on.
+    :raises PermissionError: if the socket belongs to another user
+    """
+    if os.stat(socket_path).st_uid != os.getuid():
+        raise PermissionError(f"{socket_path} belongs to another user")
+
+
+def write_frame(wfile, frame: dict) -> None:
+    wfile.write(json.dumps(frame).encode() + b"\n")
+
+
+def query(argv: [], socket_path: (None, str) = None, cwd: (None, str) = None):
+    """
+    Send a search to 'sgrep serve'. The connection is made on the first iteration,
+    OSError is raised if there is no server listening, PermissionError if the socket isn't the user's.
+    :param argv: command line arguments of the search, as given to 'sgrep.py'
+    :param cwd: directory the paths of 'argv' are relative to, the current one if None
+    :return: generator of the frames of the response
+    """
+    socket_path = socket_path or default_socket_path()
+    check_socket_owner(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({"argv": argv, "cwd": cwd or os.getcwd()}).encode() + b"\n")
+        with sock.makefile("rb") as rfile:
+            for line in rfile:
+                yield json.loads(line)
+
+
+def _broken_pipe() -> int:
+    # Same as 'sgrep.py', stop quietly once the reader of stdout went away
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    return 128 + signal.SIGPIPE
+
+
+def main(argv: [], sgrep_path: str) -> int:
+    """
+    Run a search with 'sgrep serve', writing out its output as it comes. The search is run
+    by 'sgrep_path' in its own process instead when there is no server listening or when
+    the server can't run it, like searches of stdin.
+    :param argv: command line arguments of the search
+    :param sgrep_path: path of 'sgrep.py'
+    :return: exit code of the search
+    """
+    frames = query(argv)
+    try:
+        for frame in frames:
+            if "stdout" in frame:
+                sys.stdout.write(frame["stdout"])
+            elif "stderr" in frame:
+                sys.stdout.flush()
+                sys.stderr.write(frame["stderr"])
+            elif "exit" in frame:
+                sys.stdout.flush()
+                return frame["exit"]
+            elif frame.get("local"):
+                break
+        else:
+            raise ConnectionResetError()
+    except BrokenPipeError:
+        return _broken_pipe()
+    except (FileNotFoundError, ConnectionRefusedError):
+        # No server listening
+        pass
+    except PermissionError as e:
+        print(f"WARNING: Not using the server: {str(e)}", file=sys.stderr)
+    except ConnectionResetError:
+        sys.stdout.flush()
+        print("ERROR: The server closed the connection before the end of the search", file=sys.stderr)
+        return 1
+    finally:
+        frames.close()
+
+    os.execv(sys.executable, [sys.executable, sgrep_path] + argv)
@@ -0,0 +1,109 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from sgrep.LineIndex import *
+from sgrep.TrigramIndex import *
+
+from collections import OrderedDict
+
+import os
+
+
+class FileCache:
+    """
+    Indexes of the most recently searched files, kept loaded by a long running process
+    searching the same files again and again, like 'sgrep serve'.
+
+    Line indexes are brought up to date on every use, which only reads what was appended
+    to the file. Trigram indexes are reloaded when the file or its sidecar file changed.
+    Files are told apart by their absolute path, the working directory may change between
+    searches.
+    """
+    DEFAULT_SIZE = 64
+
+    def __init__(self, size: int = DEFAULT_SIZE):
+        """
+        :param size: number of files whose indexes are kept
+        """
+        self._size = size
+        # (kind, absolute path) -> (validity key, index), least recently used first
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, kind: str, path: str, key: tuple):
+        """
+        :return: (found, index) cached for 'path' with the validity 'key'
+        """
+        entry = self._entries.get((kind, path))
+        if entry is None or entry[0] != key:
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end((kind, path))
+        self.hits += 1
+        return True, entry[1]
+
+    def _store(self, kind: str, path: str, key: tuple, index) -> None:
+        self._entries[(kind, path)] = (key, index)
+        self._entries.move_to_end((kind, path))
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+    def line_index(self, path: str) -> LineIndex:
+        """
+        Same as 'LineIndex.for_file'
+        :return: up to date LineIndex of 'path'
+        """
+        path = os.path.abspath(path)
+        found, index = self._lookup("line", path, ())
+        if not found:
+            index = LineIndex.for_file(path)
+        elif index.update():
+            try:
+                index.save()
+            except OSError:
+                # Read only location, the index is only kept in memory
+                pass
+        self._store("line", path, (), index)
+        return index
+
+    def trigram_index(self, path: str) -> (None, TrigramIndex):
+        """
+        Same as 'TrigramIndex.for_file'
+        :return: index of 'path' if it has an up to date one, None otherwise
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        try:
+            index_stat = os.stat(path + TrigramIndex.SUFFIX)
+            key = (stat.st_size, stat.st_mtime_ns, index_stat.st_size, index_stat.st_mtime_ns)
+        except FileNotFoundError:
+            key = (stat.st_size, stat.st_mtime_ns)
+        found, index = self._lookup("trigram", path, key)
+        if not found:
+            index = TrigramIndex.for_file(path)
+            self._store("trigram", path, key, index)
+        return index
@@ -0,0 +1,340 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from sgrep.FileCache import *
+from sgrep.Follow import *
+from sgrep.Sgrep import *
+from sgrep.TimeRange import *
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import bz2
+import contextlib
+import copy
+import glob
+import gzip
+import io
+import lzma
+import os
+import sys
+
+
+ENGINES = {
+    "stream": Sgrep,
+    "block": BlockSgrep,
+    "mmap": MmapSgrep,
+    "follow": FollowSgrep
+}
+
+
+# Index files kept next to the files searched
+SIDECAR_SUFFIXES = (LineIndex.SUFFIX, TrigramIndex.SUFFIX)
+
+# Compressed files are recognized by their magic bytes
+COMPRESSIONS = [
+    (b"\x1f\x8b", gzip),
+    (b"BZh", bz2),
+    (b"\xfd7zXZ\x00", lzma)
+]
+
+# Decompressed data is read in large chunks, the decompressors default to small reads
+DECOMPRESSION_BUFFER_SIZE = 1024 * 1024
+
+
+def detect_compression(path: str):
+    """
+    :return: module to decompress 'path' with, None if it isn't compressed
+    """
+    with open(path, "rb") as fd:
+        magic = fd.read(max([len(m) for m, _ in COMPRESSIONS]))
+    for m, module in COMPRESSIONS:
+        if magic.startswith(m):
+            return module
+    return None
+
+
+def open_file(path: str, binary: bool, encoding: (None, str) = None, errors: (None, str) = None):
+    """
+    Open 'path' for reading, compressed files being transparently decompressed while read
+    :param binary: open in binary mode, text mode otherwise
+    :return: file object
+    """
+    module = detect_compression(path)
+    if module is None:
+        if binary:
+            return open(path, "rb")
+        return open(path, "r", encoding=encoding, errors=errors)
+
+    stream = io.BufferedReader(module.open(path, "rb"), buffer_size=DECOMPRESSION_BUFFER_SIZE)
+    if binary:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding, errors=errors)
+
+
+def expand_paths(paths: [], recursive: bool) -> []:
+    """
+    Expand globs and, if 'recursive', directories into the list of files to search. Use
+    'glob.escape' on a file name which mustn't be expanded.
+    Directories are walked in sorted order so the result is deterministic.
+    :param paths: files, directories or glob patterns
+    :param recursive: walk directories
+    :return: list of file paths
+    """
+    files = []
+    for path in paths:
+        # Existing files are searched even if their name looks like a glob
+        if not os.path.exists(path) and any(c in path for c in "*?["):
+            matched = sorted(glob.glob(path, recursive=True))
+            if not matched:
+                raise Exception(f"{path} doesn't match any file!")
+        else:
+            matched = [path]
+
+        for p in matched:
+            if not os.path.isdir(p):
+                files.append(p)
+            elif not recursive:
+                raise Exception(f"{p} is a directory, use '--recursive' to search it")
+            else:
+                for dirpath, dirnames, filenames in os.walk(p):
+                    dirnames.sort()
+                    files.extend([os.path.join(dirpath, f) for f in sorted(filenames)
+                                  if not f.endswith(SIDECAR_SUFFIXES)])
+    return files
+
+
+def open_grepper(path: (None, str), options, cache: (None, FileCache) = None) -> (Sgrep, object):
+    """
+    Open 'path' and create the grepper configured by the command line 'options'.
+    :param path: file to search, stdin if None
+    :param options: parsed command line arguments, with the 'search_ctx_size' attribute added
+    :param cache: where to get the indexes of 'path' from, they're loaded from their sidecar files if None
+    :return: (grepper, stream), the stream must be closed by the caller
+    """
+    engine = options.engine
+    if options.follow:
+        if path is None or not os.path.isfile(path) or detect_compression(path) is not None:
+            raise Exception("'--follow' needs an uncompressed regular file")
+        engine = "follow"
+    elif options.time_range is not None:
+        if path is None or not os.path.isfile(path) or detect_compression(path) is not None:
+            raise Exception("'--since' and '--until' need an uncompressed regular file")
+        # The window is found by bisecting the file, only its lines are then searched in place
+        engine = "mmap"
+    elif engine == "mmap" and (path is None or not os.path.isfile(path)):
+        # Only regular files can be mapped
+        engine = "stream"
+    elif engine == "mmap" and detect_compression(path) is not None:
+        # Search the decompressed data in blocks instead, still as bytes
+        engine = "block"
+
+    trigram_index = None
+    # Only searches already made with bytes semantics use the index, so it doesn't change what matches.
+    # Indexes are built from the file's raw bytes, which aren't what is searched in compressed files
+    if (engine == "mmap" or (options.bytes_mode and engine != "follow")) and path is not None and \
+            os.path.isfile(path) and detect_compression(path) is None:
+        trigram_index = cache.trigram_index(path) if cache is not None else TrigramIndex.for_file(path)
+        if trigram_index is not None:
+            # Indexed files are searched where the index points to, which needs random access
+            engine = "mmap"
+
+    if engine == "mmap" or options.bytes_mode:
+        engine_args = {
+            "encoding": options.encoding or MmapSgrep.DEFAULT_ENCODING,
+            "errors": options.errors or "replace"
+        }
+    else:
+        engine_args = {}
+
+    if engine == "follow":
+        stream = FollowedFile(path, binary=bool(engine_args), encoding=options.encoding, errors=options.errors,
+                              poll_interval=options.poll_interval, count_lines=options.line_number)
+        engine_args["idle_timeout"] = options.follow_timeout
+    elif engine_args:
+        stream = open_file(path, binary=True) if path else sys.stdin.buffer
+    elif path:
+        stream = open_file(path, binary=False, encoding=options.encoding, errors=options.errors)
+    else:
+        stream = sys.stdin
+        if options.encoding or options.errors:
+            stream.reconfigure(encoding=options.encoding, errors=options.errors)
+
+    leading_lines, trailing_lines = options.leading_lines, options.trailing_lines
+    if options.count or options.files_with_matches:
+        # Context isn't output, only the trailing lines being there or not changes the windows checked
+        leading_lines, trailing_lines = 0, min(trailing_lines, 1)
+
+    try:
+        grepper = ENGINES[engine](stream, leading_lines, options.search_ctx_size, trailing_lines, **engine_args)
+        if options.group_contexts:
+            grepper.set_output_sink(GroupedTextSink(file_name=path))
+        else:
+            grepper.set_output_sink(SINKS[options.output_format](file_name=path))
+        grepper.set_show_markers(options.context_tags)
+        grepper.set_line_numbers(options.line_number)
+        if engine == "mmap" and options.index:
+            grepper.set_line_index(cache.line_index(path) if cache is not None else LineIndex.for_file(path))
+        if trigram_index is not None:
+            grepper.set_trigram_index(trigram_index)
+        if options.time_range is not None:
+            grepper.set_range(*options.time_range.byte_range(stream))
+        if options.stats:
+            grepper.enable_stats()
+        grepper.set_max_count(1 if options.files_with_matches else options.max_count)
+        grepper.setup(options.grep_pattern, options.regex, options.captured_only, options.ignore_case)
+    except Exception:
+        stream.close()
+        raise
+    return grepper, stream
+
+
+def run_grepper(grepper: Sgrep, name: str, options, prefix: bool) -> None:
+    """
+    Search with 'grepper', outputting the matches, their number or 'name' if there are
+    any, depending on the command line 'options'
+    :param name: name of the file searched
+    :param prefix: prefix the number of matches with 'name'
+    """
+    if options.files_with_matches:
+        if grepper.count():
+            print(name)
+    elif options.count:
+        nb_matches = grepper.count()
+        print(f"{name}:{nb_matches}" if prefix else nb_matches)
+    else:
+        grepper.run()
+
+
+def report_stats(grepper: Sgrep, name: str) -> None:
+    """
+    Print the statistics gathered by 'grepper', if enabled, on stderr
+    """
+    if grepper.stats is not None:
+        print(f"{name}: {grepper.stats.report()}", file=sys.stderr)
+        output_report = grepper.output_sink.report()
+        if output_report is not None:
+            print(f"{name}: {output_report}", file=sys.stderr)
+
+
+def search_file(path: str, options, file_range: (None, tuple) = None, prefix: bool = True,
+                cache: (None, FileCache) = None, capture: bool = True) -> (str, (None, str)):
+    """
+    Search a single file, output lines being prefixed with the file name.
+    Runs in worker processes, so the output is captured and handed back.
+    :param file_range: (start, end) byte range of the windows to check, needs the mmap engine
+    :param prefix: prefix output lines with the file name
+    :param cache: see 'open_grepper'
+    :param capture: capture the output, it's written to stdout as the search goes otherwise
+    :return: (output, error message or None), output is empty when not captured
+    """
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output) if capture else contextlib.nullcontext():
+            grepper, stream = open_grepper(path, options, cache)
+            with stream:
+                if prefix:
+                    grepper.set_output_prefix(f"{path}:")
+                if file_range is not None:
+                    grepper.set_range(*file_range)
+                run_grepper(grepper, path, options, prefix)
+            report_stats(grepper, path)
+    except ConnectionError:
+        # The output went away, which the next files can't be written to either
+        raise
+    except Exception as e:
+        return output.getvalue(), str(e)
+    return output.getvalue(), None
+
+
+def split_file(path: str, nb_ranges: int, start: int = 0, end: (None, int) = None) -> []:
+    """
+    Split a file into at most 'nb_ranges' byte ranges of similar size, aligned on line starts
+    :param start: offset of a line start, where the first range starts
+    :param end: offset of a line start where the last range ends, the file size if None
+    :return: list of (start, end)
+    """
+    end = os.path.getsize(path) if end is None else end
+    bounds = [start]
+    with open(path, "rb") as fd:
+        for i in range(1, nb_ranges):
+            fd.seek(max(start + (end - start) * i // nb_ranges, bounds[-1]))
+            if fd.tell() > 0:
+                # Move to the start of the next line
+                fd.seek(fd.tell() - 1)
+                fd.readline()
+            if bounds[-1] < fd.tell() < end:
+                bounds.append(fd.tell())
+    bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def search_file_split(path: str, options, jobs: int, prefix: bool = False):
+    """
+    Search a single regular file with 'jobs' worker processes, each checking the windows
+    starting in its own range of the file. The file is memory mapped by every worker so
+    the leading and trailing context of windows close to a range boundary is read across it.
+    Output is the same as searching the whole file at once with the mmap engine.
+    :return: generator of (output, error message or None), in file order
+    """
+    if detect_compression(path) is not None:
+        raise Exception(f"{path} is compressed, it can't be split")
+
+    options = copy.copy(options)
+    options.engine = "mmap"
+    start, end = 0, os.path.getsize(path)
+    if options.time_range is not None:
+        with open(path, "rb") as fd:
+            start, end = options.time_range.byte_range(fd)
+        # Only the window is split, workers don't need to look for it again
+        options.time_range = None
+    if options.index:
+        # Split on exact line counts, workers then load the updated index
+        ranges = [(max(s, start), min(e, end)) for s, e in LineIndex.for_file(path).split(jobs)
+                  if s < end and e > start] or [(start, end)]
+    else:
+        ranges = split_file(path, jobs, start, end)
+    if len(ranges) <= 1:
+        yield search_file(path, options, ranges[0], prefix)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(search_file, repeat(path), repeat(options), ranges, repeat(prefix))
+
+
+def search_files(paths: [], options, jobs: int, cache: (None, FileCache) = None, capture: bool = True):
+    """
+    Search files, spreading them over 'jobs' worker processes.
+    :param cache: see 'open_grepper', only used when searching in this process
+    :param capture: see 'search_file', only used when searching in this process: the output
+                    is then written as it's found instead of being held until the file is done
+    :return: generator of (path, output, error message or None), in 'paths' order
+    """
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield (path,) + search_file(path, options, cache=cache, capture=capture)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for path, result in zip(paths, executor.map(search_file, paths, repeat(options))):
+            yield (path,) + result
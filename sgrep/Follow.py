@@ -0,0 +1,326 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from sgrep.Sgrep import *
+
+from bisect import bisect_right
+import locale
+import os
+import time
+
+
+class FollowedFile:
+    """
+    Read only stream over a growing file, like 'tail -f'.
+
+    'readline' waits for complete lines, polling the file every 'poll_interval' seconds
+    once its end is reached. Rotation is detected by the path pointing to another inode,
+    the new file then being read from its start, and truncation by the file getting
+    smaller than what was read. 'readline' only returns an empty line once 'stop' is called.
+
+    'line_number' maps the lines read to their line number in the file they were read from:
+    those of a rotated file, or of a truncated one, start over from its first line.
+    """
+    DEFAULT_POLL_INTERVAL = 0.25
+
+    def __init__(self, path: str, binary: bool = False, encoding: (None, str) = None, errors: (None, str) = None,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, from_start: bool = False,
+                 count_lines: bool = False):
+        """
+        :param binary: return bytes lines, decoded str lines otherwise
+        :param from_start: read the file from its start instead of only following what gets appended
+        :param count_lines: count the lines of the file already there, for 'line_number' to number the
+        lines following them. Otherwise they're not read and lines are numbered from where following started
+        """
+        if poll_interval <= 0:
+            raise Exception(f"Invalid poll interval: {poll_interval}")
+        self._path = path
+        self._binary = binary
+        self._encoding = encoding or locale.getpreferredencoding(False)
+        self._errors = errors or "strict"
+        self._poll_interval = poll_interval
+
+        self._fd = None
+        self._stat = None
+        self._offset = 0
+        self._partial = b""
+        self._stopped = False
+
+        # Number of lines read, and for each file read from: the index of its first line read and its
+        # line number in that file, starting at 0
+        self._nb_lines = 0
+        self._origin_lines = []
+        self._origin_numbers = []
+        self._count_lines = count_lines
+        self._open(seek_end=not from_start)
+
+        # Called once the file went idle for 'idle_timeout' seconds
+        self._idle_callback = None
+        self._idle_timeout = None
+        self._last_data = time.monotonic()
+        self._idle_notified = False
+
+        self.polls = 0
+        self.rotations = 0
+        self.truncations = 0
+
+    def _open(self, seek_end: bool) -> None:
+        self._fd = open(self._path, "rb")
+        self._stat = os.fstat(self._fd.fileno())
+        self._offset = self._fd.seek(0, os.SEEK_END) if seek_end else 0
+        self._start_numbering(self._count_newlines(self._offset) if self._count_lines else 0)
+
+    def _count_newlines(self, size: int) -> int:
+        """
+        :return: number of newlines in the first 'size' bytes of the file, read from 'size' on afterwards
+        """
+        nb_newlines = 0
+        self._fd.seek(0)
+        while self._fd.tell() < size:
+            block = self._fd.read(min(1024 * 1024, size - self._fd.tell()))
+            if not block:
+                break
+            nb_newlines += block.count(b"\n")
+        self._fd.seek(size)
+        return nb_newlines
+
+    def _start_numbering(self, line_number: int) -> None:
+        """
+        Number the lines read from now on from 'line_number'
+        """
+        # The partial line left is still returned first, it belongs to the previous file
+        self._origin_lines.append(self._nb_lines + (1 if self._partial else 0))
+        self._origin_numbers.append(line_number)
+
+    def line_number(self, line: int) -> int:
+        """
+        :param line: index of a line returned by 'readline', starting at 0
+        :return: line number of that line in the file it was read from, starting at 0
+        """
+        i = bisect_right(self._origin_lines, line) - 1
+        return self._origin_numbers[i] + line - self._origin_lines[i]
+
+    def set_idle_callback(self, callback, timeout: float) -> None:
+        """
+        Call 'callback' when no complete line was read for 'timeout' seconds, once per idle period
+        """
+        self._idle_callback = callback
+        self._idle_timeout = timeout
+
+    def stop(self) -> None:
+        """
+        Make 'readline' return what is left of the current line, then empty lines.
+        Can be called from a signal handler or another thread.
+        """
+        self._stopped = True
+
+    def close(self) -> None:
+        self._fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def readline(self) -> (str, bytes):
+        while True:
+            data = self._fd.readline()
+            if data:
+                self._offset += len(data)
+                self._partial += data
+                if data.endswith(b"\n"):
+                    return self._take_line()
+                # Incomplete line, the rest isn't written yet
+                continue
+
+            if self._stopped:
+                return self._take_line()
+
+            if self._reopen_if_moved():
+                if self._partial:
+                    # The previous file ended without a newline
+                    self._partial += b"\n"
+                    return self._take_line()
+                continue
+
+            self._wait()
+
+    def _take_line(self) -> (str, bytes):
+        line = self._partial
+        self._partial = b""
+        if line:
+            self._nb_lines += 1
+        self._last_data = time.monotonic()
+        self._idle_notified = False
+        if self._binary:
+            return line
+        if line.endswith(b"\r\n"):
+            line = line[:-2] + b"\n"
+        return line.decode(self._encoding, self._errors)
+
+    def _reopen_if_moved(self) -> bool:
+        """
+        :return: True if the file was rotated or truncated, reading then restarts from its start
+        """
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            # Rotated, the new file isn't created yet
+            return False
+
+        if (stat.st_ino, stat.st_dev) != (self._stat.st_ino, self._stat.st_dev):
+            self._fd.close()
+            self._open(seek_end=False)
+            self.rotations += 1
+            return True
+
+        if stat.st_size < self._offset:
+            self._offset = self._fd.seek(0)
+            self._start_numbering(0)
+            self.truncations += 1
+            return True
+        return False
+
+    def _wait(self) -> None:
+        if self._idle_callback is not None and not self._idle_notified and \
+                time.monotonic() - self._last_data >= self._idle_timeout:
+            self._idle_notified = True
+            self._idle_callback()
+        self.polls += 1
+        time.sleep(self._poll_interval)
+
+
+class FollowSgrep(Sgrep):
+    """
+    Engine following a growing file, see FollowedFile.
+
+    Windows are checked like Sgrep does, as soon as their trailing context is complete.
+    When the file goes idle for 'idle_timeout' seconds, the windows still waiting for
+    lines are checked with the context read so far and their matches emitted right away,
+    so a match close to the end of a quiet log isn't held back indefinitely.
+    """
+    DEFAULT_IDLE_TIMEOUT = 1.0
+
+    def __init__(self, stream: FollowedFile, leading_ctx_size, search_ctx_size, trailing_ctx_size,
+                 encoding=None, errors="strict", idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        """
+        :param idle_timeout: seconds without new lines before emitting the matches of incomplete windows
+        """
+        super(FollowSgrep, self).__init__(stream, leading_ctx_size, search_ctx_size, trailing_ctx_size,
+                                          encoding, errors)
+        if idle_timeout < 0:
+            raise Exception(f"Invalid idle timeout: {idle_timeout}")
+        self._followed_file = stream
+        self._leading_ctx_size = leading_ctx_size
+        self._search_ctx_size = search_ctx_size
+        self._trailing_ctx_size = trailing_ctx_size
+
+        # Line index of the search buffer start, and of the first window not checked yet
+        self._search_line = 0
+        self._next_window = 0
+        # Line index of the windows emitted before their context was complete
+        self._emitted_early = set()
+
+        stream.set_idle_callback(self._check_pending, idle_timeout)
+
+    def _prime(self) -> None:
+        # Priming waits for lines, done by 'run'
+        pass
+
+    def _emit(self, leading, match_str, trailing, line_number: (None, int) = None) -> None:
+        super(FollowSgrep, self)._emit(leading, match_str, trailing, line_number)
+        if not self._save_match_flag:
+            # The next match may come much later. What the sink holds back, like the trailing context
+            # of grouped output, waits for the next window to be checked: see '_check_pending'
+            self._sink.flush()
+
+    def _check_pending(self) -> None:
+        """
+        Check the windows waiting for more lines, with the context read so far
+        """
+        if self._search_ctx.is_empty and self._trailing_ctx_size > 0:
+            text, start, end = self._trailing_ctx.span
+        else:
+            text, start, end = self._search_ctx.span
+        if self._trailing_ctx_size > 0:
+            end = self._trailing_ctx.span[2]
+        floor = self._leading_ctx.span[1] if not self._leading_ctx.is_empty else start
+
+        line_starts = []
+        pos = start
+        while pos < end:
+            line_starts.append(pos)
+            newline = text.find(self._newline, pos, end)
+            pos = newline + 1 if newline != -1 else end
+        line_starts.append(end)
+
+        for i in range(len(line_starts) - 1):
+            line = self._search_line + i
+            if line < self._next_window or line in self._emitted_early:
+                continue
+            window_start = line_starts[i]
+            window_end = line_starts[min(i + self._search_ctx_size, len(line_starts) - 1)]
+            match_str = self._grepper(text, window_start, window_end)
+            if match_str is None:
+                continue
+
+            leading_start = window_start
+            for _ in range(self._leading_ctx_size):
+                if leading_start <= floor:
+                    break
+                newline = text.rfind(self._newline, floor, leading_start - 1)
+                leading_start = newline + 1 if newline != -1 else floor
+            trailing_end = line_starts[min(i + self._search_ctx_size + self._trailing_ctx_size, len(line_starts) - 1)]
+            self._emitted_early.add(line)
+            self._emit(text[leading_start:window_start], match_str, text[window_end:trailing_end],
+                       self._followed_file.line_number(line) + 1 if self._line_numbers else None)
+
+        if not self._save_match_flag:
+            # All the windows holding the lines read were checked, nothing needs to be held back
+            self._output(self._sink.finish)
+
+    def _run(self):
+        """
+        Matches emitted early are processed from within 'readline', they're only handed over
+        by 'matches' after the next line is read
+        """
+        self._parser.prime_buffers()
+        while True:
+            if self._search_line in self._emitted_early:
+                self._emitted_early.discard(self._search_line)
+            else:
+                match_str = self._grepper(*self._search_ctx.span)
+                if match_str is not None:
+                    self._emit(self._leading_ctx.buffer_str, match_str, self._trailing_ctx.buffer_str,
+                               self._followed_file.line_number(self._search_line) + 1 if self._line_numbers
+                               else None)
+            self._next_window = self._search_line + 1
+            yield
+            self._parser.tick()
+            self._search_line += 1
+            if self._search_ctx.is_empty:
+                break
+
+        if self._stats is not None:
+            self._stats.windows = self._search_line
@@ -0,0 +1,194 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+import os
+import struct
+import sys
+import zlib
+
+
+class LineIndex:
+    """
+    Offsets of the line starts of a file, kept in a sidecar file next to it ('app.log.sgidx').
+
+    The index records the size and modification time of the file it was built from, and
+    a checksum of its last bytes. When the file only grew since, the index is extended
+    by reading the new bytes only. Any other change rebuilds it from scratch.
+
+    Offsets are those of the line starts: 0 and the offset following every newline.
+    """
+    SUFFIX = ".sgidx"
+    MAGIC = b"SGIDX\x01\x00\x00"
+    # Indexed file size, mtime in ns, number of offsets, checksum of the indexed file tail
+    HEADER = struct.Struct("<QqQI")
+    TAIL_SIZE = 4096
+    READ_SIZE = 1024 * 1024
+
+    def __init__(self, path: str):
+        self._path = path
+        self._offsets = array("Q", [0])
+        self._size = 0
+        self._mtime_ns = 0
+        self._tail_crc = zlib.crc32(b"")
+
+    @classmethod
+    def for_file(cls, path: str):
+        """
+        Get the up to date index of 'path', loading, extending or building its sidecar file as needed
+        :return: LineIndex
+        """
+        index = cls(path)
+        loaded = index.load()
+        if index.update() or not loaded:
+            try:
+                index.save()
+            except OSError:
+                # Read only location, the index is only used for this run
+                pass
+        return index
+
+    @property
+    def index_path(self) -> str:
+        return self._path + self.SUFFIX
+
+    @property
+    def size(self) -> int:
+        """
+        Size of the file when it was last indexed
+        """
+        return self._size
+
+    @property
+    def nb_lines(self) -> int:
+        if self._offsets[-1] == self._size:
+            # The file ends with a newline, or is empty
+            return len(self._offsets) - 1
+        return len(self._offsets)
+
+    def line_number(self, offset: int) -> int:
+        """
+        :param offset: byte offset in the indexed part of the file
+        :return: index of the line holding 'offset', starting at 0
+        """
+        return bisect_right(self._offsets, offset) - 1
+
+    def line_start(self, line: int) -> int:
+        """
+        :param line: line index, starting at 0
+        :return: byte offset of the line start
+        """
+        return self._offsets[line]
+
+    def split(self, nb_ranges: int) -> []:
+        """
+        Split the file into at most 'nb_ranges' byte ranges holding the same number of lines
+        :return: list of (start, end)
+        """
+        nb_lines = self.nb_lines
+        bounds = [0]
+        for i in range(1, nb_ranges):
+            start = self._offsets[nb_lines * i // nb_ranges]
+            if bounds[-1] < start < self._size:
+                bounds.append(start)
+        bounds.append(self._size)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def load(self) -> bool:
+        """
+        Load the sidecar file, if any
+        :return: True if it was loaded
+        """
+        try:
+            with open(self.index_path, "rb") as fd:
+                if fd.read(len(self.MAGIC)) != self.MAGIC:
+                    return False
+                size, mtime_ns, nb_offsets, tail_crc = self.HEADER.unpack(fd.read(self.HEADER.size))
+                offsets = array("Q")
+                offsets.fromfile(fd, nb_offsets)
+        except (OSError, EOFError, struct.error):
+            return False
+
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        self._offsets, self._size, self._mtime_ns, self._tail_crc = offsets, size, mtime_ns, tail_crc
+        return True
+
+    def save(self) -> None:
+        offsets = self._offsets
+        if sys.byteorder == "big":
+            offsets = array("Q", offsets)
+            offsets.byteswap()
+        # Don't leave a partial index behind if interrupted
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as fd:
+            fd.write(self.MAGIC)
+            fd.write(self.HEADER.pack(self._size, self._mtime_ns, len(offsets), self._tail_crc))
+            offsets.tofile(fd)
+        os.replace(tmp_path, self.index_path)
+
+    def update(self) -> bool:
+        """
+        Bring the index up to date with the file
+        :return: True if the index changed
+        """
+        with open(self._path, "rb") as fd:
+            stat = os.fstat(fd.fileno())
+            if stat.st_size == self._size and stat.st_mtime_ns == self._mtime_ns:
+                return False
+
+            if stat.st_size < self._size or self._read_tail_crc(fd, self._size) != self._tail_crc:
+                # Not simply appended to, start over
+                self._offsets = array("Q", [0])
+                self._size = 0
+
+            self._extend(fd, stat.st_size)
+            self._mtime_ns = stat.st_mtime_ns
+            self._tail_crc = self._read_tail_crc(fd, self._size)
+        return True
+
+    def _read_tail_crc(self, fd, size: int) -> int:
+        start = max(0, size - self.TAIL_SIZE)
+        fd.seek(start)
+        return zlib.crc32(fd.read(size - start))
+
+    def _extend(self, fd, size: int) -> None:
+        """
+        Index the lines between the indexed size and 'size'
+        """
+        fd.seek(self._size)
+        offset = self._size
+        while offset < size:
+            block = fd.read(min(self.READ_SIZE, size - offset))
+            if not block:
+                break
+            # Offset after each newline of the block, the last part doesn't end with one
+            line_starts = accumulate([len(line) + 1 for line in block.split(b"\n")[:-1]], initial=offset)
+            # Skip the block offset itself, not a line start unless already indexed as one
+            next(line_starts)
+            self._offsets.extend(line_starts)
+            offset += len(block)
+        self._size = offset
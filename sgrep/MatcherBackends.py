@@ -0,0 +1,253 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from sgrep.Patterns import *
+
+from abc import ABC, abstractmethod
+
+import re
+
+try:
+    import regex
+except ImportError:
+    # Optional, patterns 're' can't compile are then rejected
+    regex = None
+
+
+class MatcherBackend(ABC):
+    """
+    Finds the patterns searched for in a text, str or bytes. The engines find hits over
+    whole blocks and confirm windows with the same backend, so any backend can be used
+    by any engine. See 'select_backend'.
+    """
+    NAME = None
+
+    def __init__(self):
+        # Length of the longest occurrence, None if unbounded: an occurrence starting
+        # before 'end' is then found searching up to 'end + max_length - 1'
+        self.max_length = None
+
+    @property
+    def name(self) -> str:
+        return self.NAME
+
+    @abstractmethod
+    def find(self, text, start: int, end: int) -> int:
+        """
+        :return: offset of the leftmost occurrence held by 'text[start:end]', -1 if there is none
+        """
+
+    def required_literals(self) -> []:
+        """
+        :return: literals found in the raw text of every occurrence, like 'Patterns.required_literals'
+        """
+        return []
+
+
+class LiteralBackend(MatcherBackend):
+    """
+    Single literal, found with 'str.find'
+    """
+    NAME = "literal"
+
+    def __init__(self, literal):
+        super(LiteralBackend, self).__init__()
+        self.literal = literal
+        self.max_length = len(literal)
+
+    def find(self, text, start: int, end: int) -> int:
+        return text.find(self.literal, start, end)
+
+    def required_literals(self) -> []:
+        return [self.literal]
+
+
+class LiteralsBackend(MatcherBackend):
+    """
+    Several literals found in a single pass, see 'literals_regex'
+    """
+    NAME = "literals"
+
+    def __init__(self, literals: []):
+        super(LiteralsBackend, self).__init__()
+        self.literals = literals
+        self.max_length = max([len(literal) for literal in literals])
+        self._regex = literals_regex(literals)
+
+    def find(self, text, start: int, end: int) -> int:
+        # Escaped literals have no anchors or lookarounds, no need to slice the text
+        m = self._regex.search(text, start, end)
+        return m.start() if m else -1
+
+
+class IgnoreCaseBackend(MatcherBackend):
+    """
+    Finds literals ignoring case: the text is lowercased and searched by a literal backend
+    created for the lowercased literals. Text and literals are lowercased the same way, by
+    'lower', so lowercasing keeps offsets. Bytes only get their ASCII letters lowercased.
+    'str.lower' depends on the context for the final sigma, 'ς' and 'σ' are both made 'σ'.
+
+    The block engines search the same text for hits and then confirm windows in it, the
+    text is lowercased once per block: large ranges are kept lowercased for the next calls.
+    """
+    NAME = "ignore-case"
+    # Ranges at least this large are kept, smaller ones are windows which aren't searched again
+    KEEP_SIZE = 64 * 1024
+
+    def __init__(self, backend: MatcherBackend):
+        """
+        :param backend: literal backend for the lowercased literals
+        """
+        super(IgnoreCaseBackend, self).__init__()
+        self.max_length = backend.max_length
+        self._backend = backend
+        # Lowercased 'text[start:start + len(lowered)]' of the last large range searched
+        self._text = None
+        self._start = 0
+        self._lowered = None
+
+    @property
+    def name(self) -> str:
+        return f"{self._backend.name} {self.NAME}"
+
+    @staticmethod
+    def lower(text):
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # 'İ' is the only character lowercased into 2, keep offsets
+            lowered = text.replace("\u0130", "i").lower()
+        if isinstance(lowered, str):
+            # 'Σ' is lowercased into 'ς' at the end of words only, which a lone 'Σ' pattern isn't
+            lowered = lowered.replace("\u03c2", "\u03c3")
+        return lowered
+
+    def find(self, text, start: int, end: int) -> int:
+        if text is not self._text or start < self._start or end > self._start + len(self._lowered):
+            if end - start < self.KEEP_SIZE:
+                lowered = self.lower(text[start:end])
+                hit = self._backend.find(lowered, 0, len(lowered))
+                return hit + start if hit != -1 else -1
+            self._text, self._start, self._lowered = text, start, self.lower(text[start:end])
+        hit = self._backend.find(self._lowered, start - self._start, end - self._start)
+        return hit + self._start if hit != -1 else -1
+
+
+class RegexBackend(MatcherBackend):
+    """
+    Regexes compiled by 're'. Their patterns are analysed, see 'Patterns', so the engines
+    can skip the windows which can't match.
+    """
+    NAME = "re"
+    MODULE = re
+
+    def __init__(self, patterns: [], flags: int):
+        """
+        :param patterns: str or bytes regexes
+        :param flags: 're' flags
+        """
+        super(RegexBackend, self).__init__()
+        self.regexes = [self.MODULE.compile(p, flags) for p in patterns]
+        # Regex matching at the leftmost position any of the regexes matches at, None if there is none
+        self.regex = self.regexes[0] if len(patterns) == 1 else self._combine(patterns, flags)
+
+    @staticmethod
+    def _combine(patterns: [], flags: int):
+        return combine_regexes(patterns, flags)
+
+    def find(self, text, start: int, end: int) -> int:
+        # Anchors and lookarounds look at the searched text only
+        search_buf = text[start:end]
+        if self.regex is not None:
+            m = self.regex.search(search_buf)
+            return m.start() + start if m else -1
+        hits = [m.start() for m in [r.search(search_buf) for r in self.regexes] if m]
+        return min(hits) + start if hits else -1
+
+    def required_literals(self) -> []:
+        return required_literals(self.regex) if self.regex is not None else []
+
+    def first_line_regex(self):
+        """
+        :return: see 'Patterns.first_line_regex', None if there is none
+        """
+        return first_line_regex(self.regex) if self.regex is not None else None
+
+    def match_starts_regex(self):
+        """
+        :return: see 'Patterns.match_starts_regex', None if there is none
+        """
+        return match_starts_regex(self.regex) if self.regex is not None else None
+
+
+class RegexModuleBackend(RegexBackend):
+    """
+    Regexes compiled by the third-party 'regex' module, for the patterns 're' can't compile
+    like '\\p{Lu}' classes or variable length lookbehinds. They can't be analysed.
+    """
+    NAME = "regex"
+    MODULE = regex
+
+    @staticmethod
+    def _combine(patterns: [], flags: int):
+        return None
+
+    def required_literals(self) -> []:
+        return []
+
+    def first_line_regex(self):
+        return None
+
+    def match_starts_regex(self):
+        return None
+
+
+def _literal_backend(literals: []) -> MatcherBackend:
+    return LiteralBackend(literals[0]) if len(literals) == 1 else LiteralsBackend(literals)
+
+
+def select_backend(patterns: [], regex_flag: bool, ignore_case: bool = False, flags: int = 0) -> MatcherBackend:
+    """
+    Pick the fastest backend finding any of 'patterns':
+    - literals are found with 'str.find', several of them at once with a trie regex.
+    - literals ignoring case are found the same way in lowercased text: lowercasing is a
+      single fast pass, while 're.IGNORECASE' slows every step of a regex search down.
+      Literals without cased characters are found as they are.
+    - regexes are compiled by 're', whose patterns can be analysed to skip windows, or by
+      the 'regex' module when 're' can't compile them, if it's installed.
+    :param patterns: str or bytes patterns
+    :param regex_flag: 'patterns' are regexes
+    :param ignore_case: ignore case, 'flags' must then hold 're.IGNORECASE' for regexes
+    :param flags: 're' flags of the regexes
+    :return: MatcherBackend
+    """
+    if not regex_flag:
+        if ignore_case and any([p.lower() != p.upper() for p in patterns]):
+            return IgnoreCaseBackend(_literal_backend([IgnoreCaseBackend.lower(p) for p in patterns]))
+        return _literal_backend(patterns)
+
+    try:
+        return RegexBackend(patterns, flags)
+    except re.error:
+        if regex is None:
+            raise
+    return RegexModuleBackend(patterns, flags)
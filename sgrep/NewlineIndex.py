@@ -0,0 +1,115 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+try:
+    import numpy
+except ImportError:
+    # Optional, newlines are then found by splitting the text
+    numpy = None
+
+
+def _numpy_line_starts(text, start: int, end: int) -> array:
+    if isinstance(text, str):
+        chunk = text[start:end]
+        if chunk.isascii():
+            data = numpy.frombuffer(chunk.encode("ascii"), dtype=numpy.uint8)
+        else:
+            # A code unit per character, offsets stay character offsets
+            data = numpy.frombuffer(chunk.encode("utf-32-le", "surrogatepass"), dtype="<u4")
+    else:
+        data = numpy.frombuffer(text, dtype=numpy.uint8, count=end - start, offset=start)
+    line_starts = numpy.flatnonzero(data == ord("\n")) + (start + 1)
+    return array("q", line_starts.astype(numpy.int64).tobytes())
+
+
+def _split_line_starts(text, start: int, end: int) -> array:
+    newline = "\n" if isinstance(text, str) else b"\n"
+    line_starts = accumulate([len(line) + 1 for line in text[start:end].split(newline)[:-1]], initial=start)
+    # Skip 'start' itself, not a line start unless it follows a newline outside of the range
+    next(line_starts)
+    return array("q", line_starts)
+
+
+class NewlineIndex:
+    """
+    Newlines of a range of a text, str, bytes or memory map, to move over lines and count
+    them with bisections instead of scanning the text for each of them. Used by the block
+    engines once a range holds enough matches to rebuild the context of.
+
+    Newlines are found with NumPy when it's installed, by splitting the range otherwise.
+    The offsets following each newline, line starts, are kept in an array.
+    """
+    # Bytes indexed for the cost of moving over a line with 'find'
+    LINE_MOVE_BYTES = 512 if numpy is not None else 64
+
+    def __init__(self, text, start: int, end: int):
+        """
+        :param start: start of the range indexed
+        :param end: end of the range indexed
+        """
+        self._start = start
+        self._end = end
+        self._text_size = len(text)
+        if numpy is not None:
+            self._line_starts = _numpy_line_starts(text, start, end)
+        else:
+            self._line_starts = _split_line_starts(text, start, end)
+
+    def forward_lines(self, pos: int, nb_lines: int) -> (None, int):
+        """
+        Move forward from 'pos' by 'nb_lines' lines, stopping at the end of the text
+        :return: offset of the line start reached, None if that takes newlines which aren't indexed
+        """
+        if not self._start <= pos <= self._end:
+            return None
+        i = bisect_right(self._line_starts, pos) + nb_lines - 1
+        if i < len(self._line_starts):
+            return self._line_starts[i] if nb_lines else pos
+        return self._text_size if self._end == self._text_size else None
+
+    def back_lines(self, pos: int, nb_lines: int, floor: int) -> (None, int):
+        """
+        Move back from line start 'pos' by 'nb_lines' lines, not going before 'floor'
+        :return: offset of the line start reached, None if that takes newlines which aren't indexed
+        """
+        if not nb_lines or pos <= floor:
+            return pos if not nb_lines else floor
+        if pos > self._end + 1:
+            return None
+        # Line starts before 'pos' follow the newlines before the one ending the previous line
+        i = bisect_left(self._line_starts, pos) - nb_lines
+        if i >= 0:
+            return self._line_starts[i] if self._line_starts[i] > floor else floor
+        return floor if self._start <= floor else None
+
+    def count(self, start: int, end: int) -> (None, int):
+        """
+        :return: number of newlines in [start, end), None if they aren't all indexed
+        """
+        if start < self._start or end > self._end:
+            return None
+        return bisect_right(self._line_starts, end) - bisect_right(self._line_starts, start)
@@ -0,0 +1,318 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from abc import ABC, abstractmethod
+
+import json
+import sys
+
+
+class OutputSink(ABC):
+    """
+    Formats matches and writes them to stdout.
+
+    Formatted matches are encoded into a reusable buffer which is only written out once
+    it holds 'buffer_size' bytes, or when flushed. Line buffered stdouts, like terminals,
+    get the output as it's written instead. The buffer goes straight to the binary
+    'sys.stdout.buffer', or is decoded back for text only streams like io.StringIO.
+    stdout is looked up when flushing so redirecting it keeps working.
+    """
+    DEFAULT_BUFFER_SIZE = 256 * 1024
+    # Get the line number of every match, even when they're not shown
+    NEEDS_LINE_NUMBERS = False
+
+    def __init__(self, file_name: (None, str) = None, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        """
+        :param file_name: name of the file searched, for sinks outputting it
+        """
+        self._file_name = file_name
+        self._buffer_size = buffer_size
+        self._buffer = bytearray()
+        self.written_bytes = 0
+        # stdout last checked for line buffering, and whether it is
+        self._checked_stdout = None
+        self._line_buffered = False
+
+        # Set by Sgrep, see 'configure'
+        self._show_markers = True
+        self._prefix = ""
+        self._same_line_number = False
+        self._line_numbers = False
+
+    def configure(self, show_markers: bool, prefix: str, same_line_number: bool, line_numbers: bool = False) -> None:
+        """
+        :param show_markers: show markers delimiting the contexts
+        :param prefix: prefix of every output line
+        :param same_line_number: the search context lines all get the window line number, like captured groups
+        :param line_numbers: show line numbers, matches come without them otherwise unless NEEDS_LINE_NUMBERS is set
+        """
+        self._show_markers = show_markers
+        self._prefix = prefix
+        self._same_line_number = same_line_number
+        self._line_numbers = line_numbers
+
+    @abstractmethod
+    def write_match(self, leading: str, match_str: str, trailing: str, patterns: (None, list) = None,
+                    line_number: (None, int) = None) -> None:
+        """
+        Format a match and write it out, see 'Sgrep'
+        :param patterns: patterns matched, for sinks showing them
+        :param line_number: number of the first line of 'match_str', None if lines aren't numbered
+        """
+
+    def report(self) -> (None, str):
+        """
+        :return: statistics about the output, None if there are none
+        """
+        return None
+
+    def _write(self, text: str) -> None:
+        encoded = text.encode(*self._codec())
+        self.written_bytes += len(encoded)
+        self._buffer += encoded
+        if len(self._buffer) >= self._buffer_size or self._stdout_line_buffered():
+            self.flush()
+
+    def _stdout_line_buffered(self) -> bool:
+        """
+        :return: True if stdout is line buffered or a terminal, someone is then waiting for each match
+        """
+        stdout = sys.stdout
+        if stdout is not self._checked_stdout:
+            self._checked_stdout = stdout
+            try:
+                self._line_buffered = bool(getattr(stdout, "line_buffering", False) or stdout.isatty())
+            except (AttributeError, ValueError):
+                self._line_buffered = False
+        return self._line_buffered
+
+    @staticmethod
+    def _codec() -> (str, str):
+        """
+        :return: (encoding, errors) of stdout, text only streams get whatever they're given
+        """
+        if getattr(sys.stdout, "buffer", None) is None:
+            return "utf-8", "surrogatepass"
+        return sys.stdout.encoding, sys.stdout.errors
+
+    def flush(self) -> None:
+        """
+        Write out the buffered output. BrokenPipeError is raised once stdout is closed.
+        """
+        if not self._buffer:
+            return
+        stdout = sys.stdout
+        binary_stdout = getattr(stdout, "buffer", None)
+        try:
+            if binary_stdout is not None:
+                # Keep the order with what was printed to the text stream
+                stdout.flush()
+                binary_stdout.write(self._buffer)
+                binary_stdout.flush()
+            else:
+                stdout.write(self._buffer.decode(*self._codec()))
+        finally:
+            # Dropped on errors too, stdout can't take it anyway
+            del self._buffer[:]
+
+    def finish(self) -> None:
+        """
+        Write out everything, including what's held back waiting for the next match.
+        Called once the search is over, more matches may still come in follow mode.
+        """
+        self.flush()
+
+
+class TextSink(OutputSink):
+    """
+    Human readable output, each match followed by a blank line
+    """
+    MATCH_END = "\n"
+
+    @staticmethod
+    def _number_lines(text: str, first_line: int, separator: str, same_number: bool = False) -> str:
+        return "\n".join([f"{first_line if same_number else first_line + i}{separator}{line}"
+                          for i, line in enumerate(text.split("\n"))])
+
+    def write_match(self, leading: str, match_str: str, trailing: str, patterns: (None, list) = None,
+                    line_number: (None, int) = None) -> None:
+        self._write(self._format_match(leading, match_str, trailing, patterns, line_number))
+
+    def _format_match(self, leading: str, match_str: str, trailing: str, patterns: (None, list),
+                      line_number: (None, int)) -> str:
+        # Contexts made of empty lines are still output
+        has_leading, has_trailing = bool(leading), bool(trailing)
+        leading, match_str, trailing = leading.rstrip("\n"), match_str.rstrip("\n"), trailing.rstrip("\n")
+        if line_number is not None:
+            trailing_line = line_number + match_str.count("\n") + 1
+            if has_leading:
+                leading = self._number_lines(leading, line_number - leading.count("\n") - 1, "-")
+            # Captured groups all come from the window, they get its line number
+            match_str = self._number_lines(match_str, line_number, ":", self._same_line_number)
+            if has_trailing:
+                trailing = self._number_lines(trailing, trailing_line, "-")
+
+        parts = []
+        if patterns is not None:
+            parts.append(f"<patterns: {', '.join([repr(p) for p in patterns])}>")
+        if has_leading:
+            if self._show_markers:
+                parts.append("<lead ctx>")
+            parts.append(leading)
+        if self._show_markers:
+            parts.append("<search ctx>")
+        parts.append(match_str)
+        if has_trailing:
+            if self._show_markers:
+                parts.append("<trailing ctx>")
+            parts.append(trailing)
+        if self._show_markers:
+            parts.append("<end grep>")
+
+        text = "\n".join(parts)
+        if self._prefix:
+            text = self._prefix + text.replace("\n", "\n" + self._prefix)
+        return text + "\n" + self.MATCH_END
+
+
+class NulSink(TextSink):
+    """
+    Same as TextSink, matches being terminated by a NUL character instead of a blank line,
+    for 'xargs -0' and the like
+    """
+    MATCH_END = "\0"
+
+
+class GroupedTextSink(TextSink):
+    """
+    Text output merging matches whose lines overlap or are adjacent into a single group,
+    like grep does: every line is output once and groups are separated by '--'.
+    Markers and pattern tags aren't shown, neither can captured groups be.
+
+    Only the trailing context of the last match is kept, some of its lines may turn out
+    to be search context lines of the next match. Memory use doesn't depend on the size
+    of the groups.
+    """
+    NEEDS_LINE_NUMBERS = True
+    SEPARATOR = "--"
+
+    def __init__(self, file_name: (None, str) = None, buffer_size: int = OutputSink.DEFAULT_BUFFER_SIZE):
+        super(GroupedTextSink, self).__init__(file_name, buffer_size)
+        # Line number of the first line not output yet, None before the first group
+        self._next_line = None
+        # Trailing context lines held back, starting at '_next_line'
+        self._held = []
+        # Bytes TextSink would have output
+        self.ungrouped_bytes = 0
+
+    @staticmethod
+    def _lines(text: str) -> []:
+        lines = text.split("\n")
+        if lines[-1] == "":
+            lines.pop()
+        return lines
+
+    def _write_line(self, line_number: int, separator: str, line: str) -> None:
+        if self._line_numbers:
+            self._write(f"{self._prefix}{line_number}{separator}{line}\n")
+        else:
+            self._write(f"{self._prefix}{line}\n")
+
+    def _write_held(self, end: int) -> None:
+        """
+        Output the held lines before line 'end' as context, the other ones are dropped
+        """
+        for line in self._held[:max(0, end - self._next_line)]:
+            self._write_line(self._next_line, "-", line)
+            self._next_line += 1
+        self._held = []
+
+    def write_match(self, leading: str, match_str: str, trailing: str, patterns: (None, list) = None,
+                    line_number: (None, int) = None) -> None:
+        self.ungrouped_bytes += len(TextSink._format_match(self, leading, match_str, trailing, patterns,
+                                                            line_number if self._line_numbers else None)
+                                    .encode(*self._codec()))
+
+        leading_lines = self._lines(leading)
+        first_line = line_number - len(leading_lines)
+        if self._next_line is None:
+            self._next_line = first_line
+        elif first_line > self._next_line + len(self._held):
+            # Apart from the previous group
+            self._write_held(self._next_line + len(self._held))
+            self._write(self.SEPARATOR + "\n")
+            self._next_line = first_line
+        else:
+            # Held lines from the window on are output with this match
+            self._write_held(line_number)
+
+        for i, line in enumerate(leading_lines):
+            if first_line + i >= self._next_line:
+                self._write_line(first_line + i, "-", line)
+        self._next_line = max(self._next_line, line_number)
+
+        # The empty search buffer of empty streams is still output
+        match_lines = self._lines(match_str) or [""]
+        for i, line in enumerate(match_lines):
+            if line_number + i >= self._next_line:
+                self._write_line(line_number + i, ":", line)
+        window_end = line_number + len(match_lines)
+        self._held = self._lines(trailing)[max(0, self._next_line - window_end):]
+        self._next_line = max(self._next_line, window_end)
+
+    def finish(self) -> None:
+        if self._next_line is not None:
+            self._write_held(self._next_line + len(self._held))
+        super(GroupedTextSink, self).finish()
+
+    def report(self) -> (None, str):
+        saved = self.ungrouped_bytes - self.written_bytes
+        ratio = saved / self.ungrouped_bytes if self.ungrouped_bytes else 0.0
+        return f"output bytes: {self.written_bytes}, without grouping: {self.ungrouped_bytes}, " \
+               f"saved: {saved} ({ratio:.1%})"
+
+
+class JsonLinesSink(OutputSink):
+    """
+    One JSON object per match and per line. Contexts are output as read, newlines included.
+    """
+    def write_match(self, leading: str, match_str: str, trailing: str, patterns: (None, list) = None,
+                    line_number: (None, int) = None) -> None:
+        record = {}
+        if self._file_name is not None:
+            record["file"] = self._file_name
+        if line_number is not None:
+            record["line"] = line_number
+        record["leading"] = leading
+        record["match"] = match_str
+        record["trailing"] = trailing
+        if patterns is not None:
+            record["patterns"] = patterns
+        self._write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+SINKS = {
+    "text": TextSink,
+    "jsonl": JsonLinesSink,
+    "nul": NulSink
+}
@@ -0,0 +1,265 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import functools
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    # Python < 3.11
+    import sre_parse
+
+# Analyses and compiled regexes are kept for the most recent patterns, so a long running
+# process searching for the same patterns again, like 'sgrep serve', only parses them once
+PATTERN_CACHE_SIZE = 512
+
+
+def _as_pattern_type(text: str, pattern_type: type):
+    return text if pattern_type is str else text.encode()
+
+
+def literals_regex(literals: [], flags: int = 0) -> re.Pattern:
+    """
+    Compile literals into a single regex matching any of them. Literals are first
+    arranged in a trie so common prefixes are factored out: the regex engine then
+    follows a single branch per position, like an Aho-Corasick automaton would,
+    instead of trying every literal in turn.
+    :param literals: str or bytes literals
+    :param flags: regex flags
+    :return: compiled regex
+    """
+    return _literals_regex(tuple(literals), flags)
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _literals_regex(literals: tuple, flags: int) -> re.Pattern:
+    pattern_type = type(literals[0])
+    end_of_literal = None
+
+    trie = {}
+    for literal in literals:
+        node = trie
+        for i in range(len(literal)):
+            node = node.setdefault(literal[i:i+1], {})
+        node[end_of_literal] = True
+
+    def _trie_pattern(node) -> str:
+        branches = [re.escape(k) + _trie_pattern(v)
+                    for k, v in sorted([kv for kv in node.items() if kv[0] is not end_of_literal])]
+        if not branches:
+            return _as_pattern_type("", pattern_type)
+        if len(branches) == 1 and end_of_literal not in node:
+            return branches[0]
+        alternation = _as_pattern_type("(?:", pattern_type) + \
+            _as_pattern_type("|", pattern_type).join(branches) + \
+            _as_pattern_type(")", pattern_type)
+        if end_of_literal in node:
+            alternation += _as_pattern_type("?", pattern_type)
+        return alternation
+
+    return re.compile(_trie_pattern(trie), flags)
+
+
+def _has_group_references(parsed) -> bool:
+    for op, av in parsed:
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            return True
+        for arg in (av if isinstance(av, (tuple, list)) else [av]):
+            if isinstance(arg, sre_parse.SubPattern) and _has_group_references(arg):
+                return True
+            if isinstance(arg, (tuple, list)):
+                for sub in arg:
+                    if isinstance(sub, sre_parse.SubPattern) and _has_group_references(sub):
+                        return True
+    return False
+
+
+def combine_regexes(patterns: [], flags: int = 0) -> (None, re.Pattern):
+    """
+    Combine regexes into a single alternation, so a text is scanned once for all of them.
+    The alternation matches at the leftmost position any of the regexes matches at.
+    Patterns using group references can't be combined since group numbers are shifted,
+    neither can patterns using global inline flags or clashing group names.
+    :param patterns: str or bytes regexes
+    :param flags: regex flags
+    :return: compiled regex, None if the patterns can't be combined
+    """
+    return _combine_regexes(tuple(patterns), flags)
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _combine_regexes(patterns: tuple, flags: int) -> (None, re.Pattern):
+    pattern_type = type(patterns[0])
+    try:
+        for pattern in patterns:
+            if _has_group_references(sre_parse.parse(pattern, flags)):
+                return None
+        return re.compile(_as_pattern_type("|", pattern_type).join(
+            [_as_pattern_type("(?:", pattern_type) + p + _as_pattern_type(")", pattern_type) for p in patterns]),
+            flags)
+    except re.error:
+        return None
+
+
+def _collect_required_literals(parsed, literals: [], pattern_type: type) -> None:
+    run = []
+
+    def flush():
+        if run:
+            literals.append("".join(map(chr, run)) if pattern_type is str else bytes(run))
+            run.clear()
+
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(av)
+            continue
+        flush()
+        if op is sre_parse.SUBPATTERN:
+            group, add_flags, del_flags, sub = av
+            if not add_flags & re.IGNORECASE:
+                _collect_required_literals(sub, literals, pattern_type)
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) or op is getattr(sre_parse, "POSSESSIVE_REPEAT", None):
+            min_repeat, max_repeat, sub = av
+            if min_repeat >= 1:
+                _collect_required_literals(sub, literals, pattern_type)
+        elif op is getattr(sre_parse, "ATOMIC_GROUP", None):
+            _collect_required_literals(av, literals, pattern_type)
+    flush()
+
+
+def required_literals(regex: re.Pattern) -> []:
+    """
+    Find literal substrings every match of 'regex' contains. Only sequences of literal
+    characters on the mandatory path of the pattern are kept: alternations, character sets,
+    optional parts and lookarounds are skipped, as are case insensitive parts.
+    :param regex: compiled regex
+    :return: list of str or bytes literals, empty if none could be found
+    """
+    return list(_required_literals(regex))
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _required_literals(regex: re.Pattern) -> tuple:
+    if regex.flags & re.IGNORECASE:
+        return ()
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except re.error:
+        return ()
+    if parsed.state.flags & re.IGNORECASE:
+        return ()
+
+    literals = []
+    _collect_required_literals(parsed, literals, type(regex.pattern))
+    return tuple(literals)
+
+
+def _iter_ops(parsed):
+    """
+    :return: generator of the (op, av) of 'parsed' and of all its subpatterns
+    """
+    for op, av in parsed:
+        yield op, av
+        for arg in (av if isinstance(av, (tuple, list)) else [av]):
+            if isinstance(arg, sre_parse.SubPattern):
+                yield from _iter_ops(arg)
+            elif isinstance(arg, (tuple, list)):
+                for sub in arg:
+                    if isinstance(sub, sre_parse.SubPattern):
+                        yield from _iter_ops(sub)
+
+
+def _parse_ops(regex: re.Pattern) -> (None, []):
+    """
+    :return: list of the (op, av) of 'regex' and of all its subpatterns, None if it can't be parsed
+    """
+    try:
+        return list(_iter_ops(sre_parse.parse(regex.pattern, regex.flags)))
+    except re.error:
+        return None
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def first_line_regex(regex: re.Pattern) -> (None, re.Pattern):
+    """
+    Wrap 'regex' so that 'match(text, pos, endpos)', 'pos' being a line start, only tries it
+    at the positions of the line starting at 'pos'. It matches when searching 'text[pos:endpos]'
+    finds a match starting on its first line, with the same groups, without trying the
+    positions of the following lines. Patterns looking before the start of the text
+    ('\\A', lookbehinds...) can't be wrapped, nor can verbose ones.
+    :param regex: compiled regex
+    :return: compiled regex, None if 'regex' can't be wrapped
+    """
+    if regex.flags & re.VERBOSE:
+        return None
+    ops = _parse_ops(regex)
+    if ops is None:
+        return None
+    for op, av in ops:
+        if op is sre_parse.AT and (av is sre_parse.AT_BEGINNING_STRING or
+                                   (av is sre_parse.AT_BEGINNING and not regex.flags & re.MULTILINE)):
+            return None
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) and av[0] < 0:
+            return None
+        if op is sre_parse.SUBPATTERN and av[2] & re.MULTILINE:
+            return None
+
+    pattern_type = type(regex.pattern)
+    # Global inline flags must stay at the start, they're in 'regex.flags' anyway
+    pattern = re.sub(_as_pattern_type(r"\A(?:\(\?[aiLmsux]+\))+", pattern_type), _as_pattern_type("", pattern_type),
+                     regex.pattern)
+    try:
+        return re.compile(_as_pattern_type(r"[^\n]*?(?=[^\n])(?:", pattern_type) + pattern +
+                          _as_pattern_type(")", pattern_type), regex.flags)
+    except re.error:
+        return None
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def match_starts_regex(regex: re.Pattern) -> (None, re.Pattern):
+    """
+    Get a regex finding, in a whole text, all the positions 'regex' can match at when
+    searching a part of it: a match in 'text[pos:endpos]' is always found searching
+    'text' from 'pos' up to 'endpos' too, 'pos' being a line start. Used to jump to
+    the windows which can match instead of checking them all.
+    Only possible when matches only depend on the characters they consume: patterns
+    holding '\\A', '$', '\\Z', '\\B', negative lookarounds, atomic groups or possessive
+    repeats may match a part of the text and not the whole text.
+    :param regex: compiled regex
+    :return: compiled regex, None if there is none
+    """
+    ops = _parse_ops(regex)
+    if ops is None:
+        return None
+    for op, av in ops:
+        if op is sre_parse.AT and av in (sre_parse.AT_BEGINNING_STRING, sre_parse.AT_END, sre_parse.AT_END_STRING,
+                                         sre_parse.AT_NON_BOUNDARY):
+            return None
+        if op is sre_parse.ASSERT_NOT or op is getattr(sre_parse, "ATOMIC_GROUP", None) or \
+                op is getattr(sre_parse, "POSSESSIVE_REPEAT", None):
+            return None
+        if op is sre_parse.SUBPATTERN and av[2] & re.MULTILINE:
+            return None
+    # '^' matches at the start of the part searched, which is a line start
+    return re.compile(regex.pattern, regex.flags | re.MULTILINE)
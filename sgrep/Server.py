@@ -0,0 +1,202 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from sgrep.Client import *
+
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+
+
+class FrameWriter(io.TextIOBase):
+    """
+    Text stream sending what's written to it as frames of the 'sgrep serve' protocol,
+    '{name: text}', once it holds 'buffer_size' characters or a newline if 'line_buffering',
+    or when flushed.
+    """
+    DEFAULT_BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, wfile, name: str, buffer_size: int = DEFAULT_BUFFER_SIZE, line_buffering: bool = False,
+                 flush_first=None):
+        """
+        :param wfile: binary stream of the connection
+        :param name: name of the frames, 'stdout' or 'stderr'
+        :param flush_first: writer flushed before this one, so the client gets the output in order
+        """
+        super().__init__()
+        self._wfile = wfile
+        self._name = name
+        self._buffer_size = buffer_size
+        self._line_buffering = line_buffering
+        self._flush_first = flush_first
+        self._parts = []
+        self._size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self._buffer_size or (self._line_buffering and "\n" in text):
+            self.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        if not self._parts:
+            return
+        if self._flush_first is not None:
+            self._flush_first.flush()
+        text = "".join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        write_frame(self._wfile, {self._name: text})
+
+
+class _ConnectionOutput:
+    """
+    Binary output of a connection, shut down once writing to it timed out: the client stopped
+    reading, part of a frame may have been sent and nothing else must be
+    """
+    def __init__(self, wfile, connection: socket.socket):
+        self._wfile = wfile
+        self._connection = connection
+
+    def write(self, data: bytes) -> int:
+        try:
+            return self._wfile.write(data)
+        except socket.timeout:
+            with contextlib.suppress(OSError):
+                self._connection.shutdown(socket.SHUT_RDWR)
+            raise ConnectionAbortedError("The client stopped reading the output")
+
+
+class _QueryHandler(socketserver.StreamRequestHandler):
+    def setup(self) -> None:
+        self.timeout = self.server.query_timeout
+        super().setup()
+        self._output = _ConnectionOutput(self.wfile, self.connection)
+
+    def handle(self) -> None:
+        try:
+            line = self.rfile.readline()
+            if not line:
+                return
+            self.connection.settimeout(self.server.output_timeout)
+            # Searches change the working directory and redirect stdout, they're run one at a time
+            with self.server.search_lock:
+                cwd = os.getcwd()
+                try:
+                    self._handle_query(line)
+                finally:
+                    os.chdir(cwd)
+        except (ConnectionError, socket.timeout):
+            # The client went away, like 'head' does, or didn't send its query in time
+            pass
+
+    def _handle_query(self, line: bytes) -> None:
+        try:
+            request = json.loads(line)
+            argv, cwd = request["argv"], request["cwd"]
+            if not isinstance(argv, list):
+                raise TypeError("'argv' must be a list")
+            os.chdir(cwd)
+        except (ValueError, TypeError, KeyError, OSError) as e:
+            write_frame(self._output, {"stderr": f"ERROR: Invalid query: {str(e)}\n"})
+            write_frame(self._output, {"exit": 2})
+            return
+
+        stdout = FrameWriter(self._output, "stdout")
+        stderr = FrameWriter(self._output, "stderr", line_buffering=True, flush_first=stdout)
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            exit_code = self.server.run_query(argv)
+        stderr.flush()
+        stdout.flush()
+        write_frame(self._output, {"local": True} if exit_code is None else {"exit": exit_code})
+
+
+class QueryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Runs the searches sent by 'sgrep.Client' on a Unix socket. The process stays up between
+    searches so interpreter startup and imports are only paid once, and what the searches
+    keep in memory, compiled patterns and file indexes, is reused by the next ones.
+
+    Each connection has its own thread but searches are run one at a time: they change the
+    working directory and redirect stdout. A client gets 'query_timeout' seconds to send its
+    query, and its search is dropped once it didn't read the output for 'output_timeout'
+    seconds, so a stuck client doesn't hold the other ones back for long.
+
+    The socket is only accessible by the user running the server, its directory is created
+    private to the user if it doesn't exist.
+    """
+    QUERY_TIMEOUT = 5.0
+    OUTPUT_TIMEOUT = 30.0
+    daemon_threads = True
+    # Stopping doesn't wait for the searches running
+    block_on_close = False
+
+    def __init__(self, socket_path: str, run_query, query_timeout: float = QUERY_TIMEOUT,
+                 output_timeout: float = OUTPUT_TIMEOUT):
+        """
+        :param socket_path: socket to listen on, replaced if it's left over by a server which is gone
+        :param run_query: function running a search, called with its command line arguments.
+                          Returns the exit code, None if the client must run the search itself.
+        :param query_timeout: seconds a client has to send its query
+        :param output_timeout: seconds a client can go without reading the output of its search
+        """
+        self.run_query = run_query
+        self.query_timeout = query_timeout
+        self.output_timeout = output_timeout
+        self.search_lock = threading.Lock()
+        make_socket_directory(socket_path)
+        self._remove_stale_socket(socket_path)
+        umask = os.umask(0o077)
+        try:
+            super().__init__(socket_path, _QueryHandler)
+        finally:
+            os.umask(umask)
+
+    @staticmethod
+    def _remove_stale_socket(socket_path: str) -> None:
+        try:
+            if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                raise Exception(f"{socket_path} exists and isn't a socket")
+        except FileNotFoundError:
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(socket_path)
+            except ConnectionRefusedError:
+                os.remove(socket_path)
+                return
+        raise Exception(f"A server is already listening on {socket_path}")
+
+    def server_close(self) -> None:
+        super().server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.server_address)
@@ -21,9 +21,19 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
+from sgrep.LineIndex import *
+from sgrep.MatcherBackends import *
+from sgrep.NewlineIndex import *
+from sgrep.OutputSinks import *
+from sgrep.Patterns import *
 from sgrep.StackedBuffers import *
+from sgrep.TrigramIndex import *
+from sgrep.Stats import *
 
+import mmap
+import os
 import re
+import time
 
 
 class StreamParser:
@@ -31,7 +41,11 @@ class StreamParser:
     SEARCH_BUFFER = 1
     TRAILING_BUFFER = 2
 
-    def __init__(self, stream, leading_ctx_size, search_ctx_size, trailing_ctx_size):
+    def __init__(self, stream, leading_ctx_size, search_ctx_size, trailing_ctx_size, binary=False):
+        """
+        :param stream: stream to read lines from
+        :param binary: the stream returns bytes instead of str
+        """
         if leading_ctx_size < 0 or search_ctx_size <= 0 or trailing_ctx_size < 0:
             raise Exception(f"Invalid buffer size parameters: "
                             f"'{leading_ctx_size} < 0 or {search_ctx_size} <= 0 or {trailing_ctx_size} < 0'")
@@ -39,14 +53,30 @@ class StreamParser:
 
         self._stacked_buffers = StackedBuffers([leading_ctx_size,
                                                 search_ctx_size,
-                                                trailing_ctx_size])
+                                                trailing_ctx_size],
+                                               binary)
 
         # Assume stream is not empty so first tick succeeds
         self._last_read = '\n'
 
+    def set_hooks(self, hooks: SearchHooks) -> None:
+        """
+        Report reads and ticks to 'hooks'
+        :return:
+        """
+        self._stream = HookedStream(self._stream, hooks)
+        untimed_tick = self.tick
+
+        def tick() -> bool:
+            start = time.perf_counter()
+            more = untimed_tick()
+            hooks.on_tick(time.perf_counter() - start)
+            return more
+        self.tick = tick
+
     @property
     def eof(self) -> bool:
-        return self._last_read == ''
+        return not self._last_read
 
     def prime_buffers(self) -> None:
         """
@@ -90,29 +120,103 @@ class StreamParser:
     def trailing_buffer(self):
         return self._stacked_buffers.get_buffer(StreamParser.TRAILING_BUFFER)
 
+    @property
+    def search_line(self) -> int:
+        """
+        Index of the first line of the search buffer in the stream, starting at 0
+        """
+        return self._stacked_buffers.nb_pushed - self.search_buffer.nb_entries - self.trailing_buffer.nb_entries
+
+
+class Match:
+    """
+    Match yielded by 'Sgrep.matches'
+    """
+    __slots__ = ("leading", "match", "trailing", "patterns", "line_number")
+
+    def __init__(self, leading: str, match: str, trailing: str, patterns: (None, list) = None,
+                 line_number: (None, int) = None):
+        """
+        :param leading: leading context
+        :param match: search context, or the captured groups
+        :param trailing: trailing context
+        :param patterns: patterns found when searching for several of them, None otherwise
+        :param line_number: line number of the search context if enabled, None otherwise
+        """
+        self.leading = leading
+        self.match = match
+        self.trailing = trailing
+        self.patterns = patterns
+        self.line_number = line_number
+
+    def __repr__(self) -> str:
+        return f"Match({self.leading!r}, {self.match!r}, {self.trailing!r}, {self.patterns!r}, {self.line_number!r})"
+
 
 class Sgrep:
     DEFAULT_CONTEXT_LEADING_LINES = 0
     DEFAULT_CONTEXT_TRAILING_LINES = 0
+    # Moves the lines read through the leading, search and trailing buffers
+    STREAM_PARSER = StreamParser
 
-    def __init__(self, stream, leading_ctx_size, search_ctx_size, trailing_ctx_size):
-        self._parser = StreamParser(stream, leading_ctx_size, search_ctx_size, trailing_ctx_size)
+    def __init__(self, stream, leading_ctx_size, search_ctx_size, trailing_ctx_size, encoding=None, errors="strict"):
+        """
+        :param stream: stream to read lines from
+        :param encoding: if set, 'stream' returns bytes which are searched without being decoded.
+                         Patterns are encoded and only the emitted matches are decoded using 'encoding'.
+        :param errors: how decoding errors are handled, see 'bytes.decode'
+        """
+        self._parser = self.STREAM_PARSER(stream, leading_ctx_size, search_ctx_size, trailing_ctx_size,
+                                          binary=encoding is not None)
 
         self._leading_ctx = self._parser.leading_buffer
         self._search_ctx = self._parser.search_buffer
         self._trailing_ctx = self._parser.trailing_buffer
 
-        self._grep_str = None
+        # Finds the patterns, see 'MatcherBackends'
+        self._backend = None
+        self._find = None
+        self._max_length = None
         self._regex = None
+        # Literal every match of the regex contains, windows lacking it are ruled out without running the regex
+        self._required_literal = None
+        # Multiline regex only tried at the positions of the first line of the windows
+        self._first_line_regex = None
+        # Regex finding where matches can start in a whole block, None if windows must all be checked
+        self._match_starts_regex = None
+        self._regex_flag = False
         self._multiline = search_ctx_size > 1
+
+        # When searching for several patterns at once, matches are tagged with the patterns found
+        self._pattern_names = None
+        self._pattern_backends = None
+        self._patterns = None
+        # Regexes tried in turn when they can't be combined into a single one
+        self._regexes = None
         self._show_captured_regex_only = False
 
         self._grepper = None
-        self._search_buf = None
         self._process_match = None
+
+        # Bytes mode searches undecoded data, only emitted matches are decoded
+        self._newline = '\n' if encoding is None else b'\n'
+        self._encoding = encoding
+        self._errors = errors
         self._saved_matches = []
 
         self._show_markers = True
+        self._output_prefix = ""
+        self._sink = TextSink()
+        # Line numbers are found when shown or when the sink needs them
+        self._show_line_numbers = False
+        self._line_numbers = False
+        self._stats = None
+        self._hooks = None
+        # Matches found so far, the search stops once 'max_count' are found
+        self._nb_matches = 0
+        self._max_count = None
+        # Matches are only counted, without building their context
+        self._count_only = False
         self._save_match_flag = False
         self.set_matches_saving(self._save_match_flag)
 
@@ -123,6 +227,45 @@ class Sgrep:
         :return:
         """
         self._show_markers = flag
+        self._configure_sink()
+
+    def set_output_prefix(self, prefix: str) -> None:
+        """
+        Prefix every line output on stdout, typically with the file name
+        :param prefix: str
+        :return:
+        """
+        self._output_prefix = prefix
+        self._configure_sink()
+
+    def set_output_sink(self, sink: OutputSink) -> None:
+        """
+        Output matches through 'sink' instead of the default TextSink
+        :param sink: OutputSink
+        :return:
+        """
+        self._sink = sink
+        self._configure_sink()
+
+    @property
+    def output_sink(self) -> OutputSink:
+        return self._sink
+
+    def _configure_sink(self) -> None:
+        self._sink.configure(self._show_markers, self._output_prefix, self._show_captured_regex_only,
+                             self._show_line_numbers)
+        self._line_numbers = self._show_line_numbers or self._sink.NEEDS_LINE_NUMBERS
+
+    def set_line_numbers(self, flag: bool) -> None:
+        """
+        Report the line number of matches: output lines are prefixed with their line number,
+        followed by ':' for the search context and '-' for the leading and trailing context.
+        Saved matches get the line number of their search context appended.
+        :param flag: bool
+        :return:
+        """
+        self._show_line_numbers = flag
+        self._configure_sink()
 
     def set_matches_saving(self, flag) -> None:
         """
@@ -136,6 +279,40 @@ class Sgrep:
         else:
             self._process_match = self._print_match
 
+    def set_max_count(self, max_count: (None, int)) -> None:
+        """
+        Stop searching once 'max_count' matches were found
+        :param max_count: None to search the whole stream
+        :return:
+        """
+        if max_count is not None and max_count < 0:
+            raise Exception(f"Invalid max count: {max_count}")
+        self._max_count = max_count
+
+    def set_hooks(self, hooks: SearchHooks) -> None:
+        """
+        Call 'hooks' while searching, must be called before 'setup'
+        :param hooks: SearchHooks
+        :return:
+        """
+        if self._hooks is not None:
+            raise Exception("Hooks are already set!")
+        self._hooks = hooks
+        self._parser.set_hooks(hooks)
+
+    def enable_stats(self) -> Stats:
+        """
+        Gather statistics while searching, must be called before 'setup'
+        :return: Stats, filled by 'run'
+        """
+        self._stats = Stats()
+        self.set_hooks(self._stats)
+        return self._stats
+
+    @property
+    def stats(self) -> (None, Stats):
+        return self._stats
+
     def iter_matches(self) -> str:
         """
         Iterate through the saved matches
@@ -144,105 +321,765 @@ class Sgrep:
         for m in self._saved_matches:
             yield m
 
-    def setup(self, grep_str: str, regex_flag: bool, show_captured_only: bool) -> None:
+    def matches(self):
+        """
+        Search the whole stream, yielding matches while searching instead of outputting or
+        saving them. Matches are handed over as soon as the engine is done with the window
+        or block they were found in, so memory use doesn't grow with the number of matches.
+        Hooks see the time spent by the caller between matches as part of the search.
+        :return: generator of Match
+        """
+        start = time.perf_counter()
+        pending = []
+        process_match = self._process_match
+
+        def add_match(leading, match_str, trailing, patterns, line_number):
+            pending.append(Match(leading, match_str, trailing, patterns,
+                                 line_number if self._show_line_numbers else None))
+        self._process_match = add_match
+        try:
+            for _ in self._run():
+                yield from pending
+                pending.clear()
+                if self._max_count_reached():
+                    return
+            yield from pending
+        finally:
+            self._process_match = process_match
+            if self._hooks is not None:
+                self._hooks.on_search_end(time.perf_counter() - start)
+
+    def setup(self, grep_str: (str, list), regex_flag: bool, show_captured_only: bool,
+              ignore_case: bool = False) -> None:
         """
         Configure the grepping.
-        :param grep_str: string to use for grepping, can be a NON compiled regex
+        :param grep_str: string to use for grepping, can be a NON compiled regex.
+                         A list of strings searches for all of them in a single pass,
+                         each match being tagged with the patterns found.
         :param regex_flag: if 'grep_str' is meant to be compiled as a regex
         :param show_captured_only: If True, only shows captured regex match (regex only)
                                    Regex needs to use capturing groups.
+        :param ignore_case: ignore case, literals are compared lowercased, ASCII letters
+                            only in bytes mode, and regexes use 're.IGNORECASE'
         :return:
         """
-        if grep_str == "":
+        patterns = [grep_str] if isinstance(grep_str, str) else list(grep_str)
+        if not patterns or "" in patterns:
             raise Exception("Empty grep string given to 'setup'!")
 
+        if len(patterns) > 1 and show_captured_only:
+            raise Exception("Captured regex output needs a single pattern!")
+
+        if self._encoding:
+            patterns = [p.encode(self._encoding) for p in patterns]
+
+        self._regex_flag = regex_flag
+        flags = re.DOTALL
+        if self._multiline:
+            flags |= re.MULTILINE
+        if ignore_case:
+            flags |= re.IGNORECASE
+
+        self._patterns = patterns
+        self._backend = select_backend(patterns, regex_flag, ignore_case, flags)
+        if len(patterns) > 1:
+            self._pattern_names = list(grep_str)
+            self._pattern_backends = [select_backend([p], regex_flag, ignore_case, flags) for p in patterns]
+
         if regex_flag:
-            flags = re.DOTALL
+            self._regex = self._backend.regex
+            if self._regex is None:
+                self._regexes = self._backend.regexes
+            if len(patterns) == 1:
+                self._show_captured_regex_only = show_captured_only
+                self._configure_sink()
+                literals = self._backend.required_literals()
+                if literals:
+                    self._required_literal = max(literals, key=len)
+
+        if self._regex is not None:
+            self._match_starts_regex = self._backend.match_starts_regex()
             if self._multiline:
-                flags |= re.MULTILINE
-            self._regex = re.compile(grep_str, flags=flags)
-            self._show_captured_regex_only = show_captured_only
-        else:
-            self._grep_str = grep_str
+                self._first_line_regex = self._backend.first_line_regex()
 
-        self._parser.prime_buffers()
+        self._prime()
         self._attach_grepper()
 
     def _attach_grepper(self) -> None:
-        if self._grep_str:
+        if self._backend is None:
+            raise Exception("You must call 'setup' first!")
+        elif not self._regex_flag:
+            # Bound once, matchers run on every window
+            self._find, self._max_length = self._backend.find, self._backend.max_length
             if self._multiline:
-                self._grepper = self._grep_search_multiline
+                self._grepper = self._literal_search_multiline
             else:
-                self._grepper = self._grep_search
-        elif self._regex:
+                self._grepper = self._literal_search
+        elif self._regexes:
             if self._multiline:
+                self._grepper = self._regexes_search_multiline
+            else:
+                self._grepper = self._regexes_search
+        elif self._regex and self._required_literal:
+            if self._first_line_regex:
+                self._grepper = self._prefiltered_first_line_regex_search
+            elif self._multiline:
+                self._grepper = self._prefiltered_regex_search_multiline
+            else:
+                self._grepper = self._prefiltered_regex_search
+        elif self._regex:
+            if self._first_line_regex:
+                self._grepper = self._first_line_regex_search
+            elif self._multiline:
                 self._grepper = self._regex_search_multiline
             else:
                 self._grepper = self._regex_search
+
+        if self._stats is not None:
+            self._stats.backend = self._backend.name
+            self._stats.required_literal = self._required_literal
+        if self._hooks is not None:
+            self._grepper = self._hooked_matcher(self._grepper)
+
+    def _hooked_matcher(self, matcher):
+        hooks = self._hooks
+
+        def hooked_matcher(text, start, end):
+            start_time = time.perf_counter()
+            match_str = matcher(text, start, end)
+            hooks.on_matcher_call(text, start, end, match_str, time.perf_counter() - start_time)
+            return match_str
+        return hooked_matcher
+
+    def _prime(self) -> None:
+        self._parser.prime_buffers()
+
+    def _save_match(self, leading: str, match_str: str, trailing: str, patterns: (None, list) = None,
+                    line_number: (None, int) = None) -> None:
+        match = [leading, match_str, trailing]
+        if patterns is not None:
+            match.append(patterns)
+        if line_number is not None and self._show_line_numbers:
+            match.append(line_number)
+        self._saved_matches.append(match)
+
+    def _print_match(self, leading: str, match_str: str, trailing: str, patterns: (None, list) = None,
+                     line_number: (None, int) = None) -> None:
+        self._sink.write_match(leading, match_str, trailing, patterns, line_number)
+
+    def _decode(self, data) -> str:
+        if data is None or isinstance(data, str):
+            return data
+        return data.decode(self._encoding, self._errors)
+
+    def _max_count_reached(self) -> bool:
+        return self._max_count is not None and self._nb_matches >= self._max_count
+
+    def _emit(self, leading, match_str, trailing, line_number: (None, int) = None) -> None:
+        if self._max_count_reached():
+            # Found in the same block as the last match processed
+            return
+        self._nb_matches += 1
+        if self._count_only:
+            return
+        if self._hooks is not None:
+            start = time.perf_counter()
+            self._process(leading, match_str, trailing, line_number)
+            self._hooks.on_output(time.perf_counter() - start)
         else:
-            raise Exception("You must call 'setup' first!")
+            self._process(leading, match_str, trailing, line_number)
 
-    def _save_match(self, match_str: str) -> None:
-        self._saved_matches.append([self._leading_ctx.buffer_str,
-                                    match_str,
-                                    self._trailing_ctx.buffer_str])
+    def _process(self, leading, match_str, trailing, line_number: (None, int)) -> None:
+        patterns = None if self._pattern_names is None else self._matching_patterns(match_str)
+        if self._encoding:
+            leading, match_str, trailing = self._decode(leading), self._decode(match_str), self._decode(trailing)
+        self._process_match(leading, match_str, trailing, patterns, line_number)
 
-    def _print_match(self, match_str: str) -> None:
-        if not self._leading_ctx.is_empty:
-            if self._show_markers:
-                print("<lead ctx>")
-            print(self._leading_ctx.buffer_str.rstrip("\n"))
-        if self._show_markers:
-            print("<search ctx>")
-        print(match_str.rstrip("\n"))
-        if not self._trailing_ctx.is_empty:
-            if self._show_markers:
-                print("<trailing ctx>")
-            print(self._trailing_ctx.buffer_str.rstrip("\n"))
+    def _matching_patterns(self, search_buf) -> []:
+        """
+        Find which of the patterns searched for match the search window
+        :return: list of the patterns, as given to 'setup'
+        """
+        first_newline = search_buf.find(self._newline)
+        matching = []
+        for name, backend in zip(self._pattern_names, self._pattern_backends):
+            match_loc = backend.find(search_buf, 0, len(search_buf))
+            if match_loc != -1 and (not self._multiline or match_loc < first_newline):
+                matching.append(name)
+        return matching
+
+    def _captured_str(self, m) -> str:
+        groups = m.groups()
+        if self._encoding:
+            groups = tuple(self._decode(g) for g in groups)
         if self._show_markers:
-            print("<end grep>")
-        print()
+            return "\n".join([f"{i}: {g}" for i, g in enumerate(groups, 1)])
+        return " ".join(groups)
 
-    def _grep_search(self) -> None:
-        if self._grep_str in self._search_buf:
-            self._process_match(self._search_buf)
+    # Matchers look for the pattern in the search window 'text[start:end]' and return
+    # the string to output for the match, None if the window doesn't match.
+    def _literal_search(self, text: str, start: int, end: int) -> (None, str):
+        if self._find(text, start, end) != -1:
+            return text[start:end]
+        return None
 
-    def _grep_search_multiline(self) -> None:
+    def _literal_search_multiline(self, text: str, start: int, end: int) -> (None, str):
         # Make sure we match starting on first line of multi line string
-        first_newline = self._search_buf.find('\n')
-        match_loc = self._search_buf.find(self._grep_str)
-        if match_loc != -1 and match_loc < first_newline:
-            self._process_match(self._search_buf)
+        first_newline = text.find(self._newline, start, end)
+        if first_newline == -1:
+            return None
+        # Occurrences starting on the following lines aren't looked for
+        hit = self._find(text, start, min(end, first_newline + self._max_length - 1))
+        if hit != -1 and hit < first_newline:
+            return text[start:end]
+        return None
+
+    def _regexes_search(self, text: str, start: int, end: int) -> (None, str):
+        search_buf = text[start:end]
+        for regex in self._regexes:
+            if regex.search(search_buf):
+                return search_buf
+        return None
 
-    def _regex_search(self) -> None:
-        m = self._regex.search(self._search_buf)
+    def _regexes_search_multiline(self, text: str, start: int, end: int) -> (None, str):
+        search_buf = text[start:end]
+        first_newline = search_buf.find(self._newline)
+        for regex in self._regexes:
+            m = regex.search(search_buf)
+            if m and m.start() < first_newline:
+                return search_buf
+        return None
+
+    def _regex_search(self, text: str, start: int, end: int) -> (None, str):
+        search_buf = text[start:end]
+        m = self._regex.search(search_buf)
         if m:
             if self._show_captured_regex_only:
-                if self._show_markers:
-                    self._process_match("\n".join([f"{i}: {m.group(i)}" for i in range(1, len(m.groups())+1)]))
-                else:
-                    self._process_match(" ".join(m.groups()))
-            else:
-                self._process_match(self._search_buf)
+                return self._captured_str(m)
+            return search_buf
+        return None
 
-    def _regex_search_multiline(self) -> None:
-        m = self._regex.search(self._search_buf)
+    def _regex_search_multiline(self, text: str, start: int, end: int) -> (None, str):
+        search_buf = text[start:end]
+        m = self._regex.search(search_buf)
         if m:
             # Make sure we match starting on first line of multi line string
-            first_newline = self._search_buf.find('\n')
-            if m and m.start() < first_newline:
+            first_newline = search_buf.find(self._newline)
+            if m.start() < first_newline:
                 if self._show_captured_regex_only:
-                    if self._show_markers:
-                        self._process_match("\n".join([f"{i}: {m.group(i)}" for i in range(1, len(m.groups())+1)]))
-                    else:
-                        self._process_match(" ".join(m.groups()))
-                else:
-                    self._process_match(self._search_buf)
+                    return self._captured_str(m)
+                return search_buf
+        return None
+
+    def _first_line_regex_search(self, text: str, start: int, end: int) -> (None, str):
+        # Same as '_regex_search_multiline', only trying the positions of the first line instead of
+        # searching the whole window: each line is tried once, not once per window holding it
+        if text.find(self._newline, start, end) == -1:
+            return None
+        m = self._first_line_regex.match(text, start, end)
+        if m:
+            if self._show_captured_regex_only:
+                return self._captured_str(m)
+            return text[start:end]
+        return None
+
+    def _prefiltered_regex_search(self, text: str, start: int, end: int) -> (None, str):
+        if text.find(self._required_literal, start, end) == -1:
+            return None
+        return self._regex_search(text, start, end)
+
+    def _prefiltered_regex_search_multiline(self, text: str, start: int, end: int) -> (None, str):
+        if text.find(self._required_literal, start, end) == -1:
+            return None
+        return self._regex_search_multiline(text, start, end)
+
+    def _prefiltered_first_line_regex_search(self, text: str, start: int, end: int) -> (None, str):
+        if text.find(self._required_literal, start, end) == -1:
+            return None
+        return self._first_line_regex_search(text, start, end)
 
     def run(self) -> None:
+        """
+        Search the whole stream, matches are output or saved as they're found
+        :return:
+        """
+        start = time.perf_counter()
+        try:
+            for _ in self._run():
+                if self._max_count_reached():
+                    break
+            if not self._save_match_flag:
+                self._output(self._sink.finish)
+        finally:
+            if not self._save_match_flag:
+                self._output(self._sink.flush)
+            if self._hooks is not None:
+                self._hooks.on_search_end(time.perf_counter() - start)
+
+    def _output(self, output_func) -> None:
+        if self._hooks is None:
+            output_func()
+            return
+        start = time.perf_counter()
+        try:
+            output_func()
+        finally:
+            self._hooks.on_output(time.perf_counter() - start)
+
+    def count(self) -> int:
+        """
+        Search the whole stream, only counting the matches: they're neither output nor saved
+        and their context isn't built. Stops once 'max_count' matches were found.
+        :return: number of matches
+        """
+        self._count_only = True
+        start = time.perf_counter()
+        try:
+            for _ in self._run():
+                if self._max_count_reached():
+                    break
+        finally:
+            self._count_only = False
+            if self._hooks is not None:
+                self._hooks.on_search_end(time.perf_counter() - start)
+        if self._max_count is not None:
+            return min(self._nb_matches, self._max_count)
+        return self._nb_matches
+
+    def _run(self):
+        """
+        Search the whole stream, processing matches as they're found
+        :return: generator yielding after matches were processed, see 'matches'
+        """
         while True:
-            self._search_buf = self._search_ctx.buffer_str
-            self._grepper()
+            # Don't keep a reference on the buffers text, it would prevent growing it in place
+            match_str = self._grepper(*self._search_ctx.span)
+            if match_str is not None:
+                if self._count_only:
+                    self._emit(None, match_str, None)
+                else:
+                    self._emit(self._leading_ctx.buffer_str, match_str, self._trailing_ctx.buffer_str,
+                               self._parser.search_line + 1 if self._line_numbers else None)
+                yield
             self._parser.tick()
             if self._search_ctx.is_empty:
                 break
+
+        if self._stats is not None:
+            # Every window went through the matcher
+            self._stats.windows = self._stats.checked
+
+
+class BlockSgrep(Sgrep):
+    """
+    Alternative engine reading the stream in large blocks instead of line by line.
+
+    Literal patterns are searched over the whole block at once and lines are only
+    materialized around hits to rebuild the leading, search and trailing context.
+    Each candidate window is then confirmed with the same matchers as Sgrep so the
+    output is identical to Sgrep.run.
+    """
+    DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, stream, leading_ctx_size, search_ctx_size, trailing_ctx_size,
+                 encoding=None, errors="strict", block_size=DEFAULT_BLOCK_SIZE):
+        super(BlockSgrep, self).__init__(stream, leading_ctx_size, search_ctx_size, trailing_ctx_size,
+                                         encoding, errors)
+        if block_size <= 0:
+            raise Exception(f"Invalid block size: {block_size}")
+        self._stream = stream
+        self._block_size = block_size
+        self._leading_ctx_size = leading_ctx_size
+        self._search_ctx_size = search_ctx_size
+        self._trailing_ctx_size = trailing_ctx_size
+
+        # (offset, number of lines before it) in the current text, to count lines incrementally
+        self._line_count = (0, 0)
+        # Range being scanned, its newlines once indexed and the lines moved over before that
+        self._scan_range = None
+        self._newline_index = None
+        self._line_moves = 0
+
+    def set_hooks(self, hooks: SearchHooks) -> None:
+        super(BlockSgrep, self).set_hooks(hooks)
+        self._stream = HookedStream(self._stream, hooks)
+
+    def _prime(self) -> None:
+        # Blocks are read by 'run' directly from the stream
+        pass
+
+    def _count_newlines(self, text: str, start: int, end: int) -> int:
+        if self._newline_index is not None:
+            nb_newlines = self._newline_index.count(start, end)
+            if nb_newlines is not None:
+                return nb_newlines
+        if isinstance(text, mmap.mmap):
+            # Memory maps have no 'count', go through slices
+            chunk = self._block_size
+            return sum([text[i:min(i + chunk, end)].count(self._newline) for i in range(start, end, chunk)])
+        return text.count(self._newline, start, end)
+
+    def _line_number(self, text: str, pos: int) -> int:
+        """
+        :param pos: offset of a line start, close to the previous one asked for
+        :return: line number of the line starting at 'pos', starting at 1
+        """
+        counted_pos, nb_lines = self._line_count
+        if pos >= counted_pos:
+            nb_lines += self._count_newlines(text, counted_pos, pos)
+        else:
+            nb_lines -= self._count_newlines(text, pos, counted_pos)
+        self._line_count = (pos, nb_lines)
+        return nb_lines + 1
+
+    def _forward_lines(self, text: str, pos: int, nb_lines: int) -> int:
+        """
+        Move forward from 'pos' by 'nb_lines' lines, stopping at the end of the text
+        :return: offset of the line start reached
+        """
+        if nb_lines > 1 and self._indexed_newlines(text, nb_lines) is not None:
+            reached = self._newline_index.forward_lines(pos, nb_lines)
+            if reached is not None:
+                return reached
+        for _ in range(nb_lines):
+            newline = text.find(self._newline, pos)
+            if newline == -1:
+                return len(text)
+            pos = newline + 1
+        return pos
+
+    def _back_lines(self, text: str, pos: int, nb_lines: int, floor: int) -> int:
+        """
+        Move back from line start 'pos' by 'nb_lines' lines, not going before 'floor'
+        :return: offset of the line start reached
+        """
+        if nb_lines > 1 and self._indexed_newlines(text, nb_lines) is not None:
+            reached = self._newline_index.back_lines(pos, nb_lines, floor)
+            if reached is not None:
+                return reached
+        for _ in range(nb_lines):
+            if pos <= floor:
+                return floor
+            newline = text.rfind(self._newline, floor, pos - 1)
+            pos = newline + 1 if newline != -1 else floor
+        return pos
+
+    def _indexed_newlines(self, text: str, nb_lines: int) -> (None, NewlineIndex):
+        """
+        Count 'nb_lines' more lines moved over in the range being scanned, indexing its newlines
+        once the 'find' calls spent on them would have paid for it: only ranges dense in matches
+        to rebuild the context of are indexed
+        :return: index of the newlines of the range being scanned, None if not indexed
+        """
+        if self._newline_index is None and self._scan_range is not None:
+            self._line_moves += nb_lines
+            start, end = self._scan_range
+            if self._line_moves * NewlineIndex.LINE_MOVE_BYTES >= end - start:
+                self._newline_index = NewlineIndex(text, start, end)
+        return self._newline_index
+
+    def _check_window(self, text: str, start: int) -> int:
+        """
+        Run the matcher on the window starting at line start 'start', processing the match if any
+        :return: offset of the next window
+        """
+        end = self._forward_lines(text, start, self._search_ctx_size)
+        match_str = self._grepper(text, start, end)
+        if match_str is not None and self._count_only:
+            self._emit(None, match_str, None)
+        elif match_str is not None:
+            leading = text[self._back_lines(text, start, self._leading_ctx_size, 0):start]
+            trailing = text[end:self._forward_lines(text, end, self._trailing_ctx_size)]
+            self._emit(leading, match_str, trailing, self._line_number(text, start) if self._line_numbers else None)
+        return self._forward_lines(text, start, 1)
+
+    def _count_lines(self, text: str, start: int, end: int) -> int:
+        """
+        Count the lines starting in [start, end), 'start' being a line start
+        """
+        if start >= end:
+            return 0
+        nb_lines = self._count_newlines(text, start, end)
+        if end == len(text) and text[end - 1:end] != self._newline:
+            nb_lines += 1
+        return nb_lines
+
+    def _scan(self, text: str, pos: int, limit: int) -> None:
+        """
+        Check all windows starting in [pos, limit), 'pos' being a line start
+        """
+        self._scan_range, self._newline_index, self._line_moves = (pos, limit), None, 0
+        try:
+            self._scan_windows(text, pos, limit)
+        finally:
+            self._scan_range, self._newline_index = None, None
+
+    def _scan_windows(self, text: str, pos: int, limit: int) -> None:
+        if self._stats is not None:
+            self._stats.windows += self._count_lines(text, pos, limit)
+
+        if self._regex and self._required_literal:
+            self._scan_required_literal(text, pos, limit)
+            return
+
+        if not self._regex_flag:
+            backend_find = self._backend.find
+            # A literal must start on the first line of a matching window
+            search_end = min(len(text), limit + self._backend.max_length - 1)
+
+            def find(start, end):
+                return backend_find(text, start, end)
+        elif self._match_starts_regex:
+            # Jump to the lines where a match starts, their window is then checked: the match
+            # found over the whole block may not fit in it
+            match_starts = self._match_starts_regex
+            search_end = self._forward_lines(text, limit, self._search_ctx_size - 1)
+
+            def find(start, end):
+                m = match_starts.search(text, start, end)
+                return m.start() if m else -1
+        else:
+            # No way to rule out lines for this regex, check every window
+            while pos < limit:
+                pos = self._check_window(text, pos)
+            return
+
+        if self._count_only and self._search_ctx_size == 1 and self._hooks is None and not self._regex_flag and \
+                not any([self._newline in p for p in self._patterns]):
+            # Single line windows holding a hit all match, only count the lines with hits
+            while pos < limit:
+                hit = find(pos, search_end)
+                if hit == -1 or hit >= limit:
+                    break
+                self._nb_matches += 1
+                newline = text.find(self._newline, hit)
+                pos = newline + 1 if newline != -1 else len(text)
+            return
+
+        while pos < limit:
+            hit = find(pos, search_end)
+            if hit == -1:
+                break
+            line_start = text.rfind(self._newline, 0, hit) + 1
+            if line_start >= limit:
+                break
+            pos = self._check_window(text, line_start)
+
+    def _scan_required_literal(self, text: str, pos: int, limit: int) -> None:
+        """
+        Like '_scan', for a regex all matches of which contain '_required_literal'.
+        Only the windows holding a hit of the literal are checked: those starting on
+        the line of the hit, or up to 'search_ctx_size - 1' lines before it. When
+        windows are large, only those of them a match starts on are checked.
+        """
+        required_literal = self._required_literal
+        match_starts = self._match_starts_regex if self._search_ctx_size > 1 else None
+        # Hits on later lines only belong to windows starting after 'limit'
+        search_end = min(len(text), self._forward_lines(text, limit, self._search_ctx_size - 1) +
+                         len(required_literal) - 1)
+        while pos < limit:
+            hit = text.find(required_literal, pos, search_end)
+            if hit == -1:
+                break
+            line_start = text.rfind(self._newline, 0, hit) + 1
+            pos = max(pos, self._back_lines(text, line_start, self._search_ctx_size - 1, pos))
+            if match_starts is None:
+                while pos <= line_start and pos < limit:
+                    pos = self._check_window(text, pos)
+                continue
+
+            # Only check the windows of these lines a match starts on
+            windows_end = min(self._forward_lines(text, line_start, 1), limit)
+            match_end = self._forward_lines(text, line_start, self._search_ctx_size)
+            while pos < windows_end:
+                m = match_starts.search(text, pos, match_end)
+                if m is None or m.start() >= windows_end:
+                    pos = windows_end
+                    break
+                pos = self._check_window(text, text.rfind(self._newline, 0, m.start()) + 1)
+
+    def _run(self):
+        multiline_ctx = self._search_ctx_size + self._trailing_ctx_size - 1
+        text = self._newline[:0]
+        pos = 0
+        started = False
+        while True:
+            block = self._stream.read(self._block_size)
+            eof = not block
+            text += block
+
+            if eof:
+                limit = len(text)
+                if not started:
+                    pos = self._handle_short_stream(text)
+                    if pos is None:
+                        yield
+                        return
+            else:
+                # Only windows for which all search and trailing lines were read can be checked
+                limit = self._back_lines(text, text.rfind(self._newline) + 1, multiline_ctx, pos)
+                started = started or limit > pos
+
+            self._scan(text, pos, limit)
+            yield
+            if eof:
+                break
+
+            # Keep the leading context of the next window around
+            pos = limit
+            keep = self._back_lines(text, pos, self._leading_ctx_size, 0)
+            if self._line_numbers:
+                self._line_count = (0, self._line_number(text, keep) - 1)
+            text = text[keep:]
+            pos -= keep
+
+    def _handle_short_stream(self, text: str) -> (None, int):
+        """
+        Mimic what Sgrep does when the stream doesn't hold enough lines to fill
+        the search buffer on startup
+        :return: offset of the first window to check, None if there is nothing left to check
+        """
+        if not len(text):
+            # The empty search buffer is still given to the matcher once
+            self._check_window(text, 0)
+            return None
+
+        if self._trailing_ctx_size == 0 and \
+                self._forward_lines(text, 0, self._search_ctx_size - 1) == len(text):
+            # Priming ended up pushing the first line out of the search buffer
+            pos = self._forward_lines(text, 0, 1)
+            if pos == len(text):
+                self._check_window(text, pos)
+                return None
+            return pos
+
+        return 0
+
+
+class MmapSgrep(BlockSgrep):
+    """
+    Engine for regular files, searching the memory mapped file directly.
+
+    Patterns are compiled to bytes and matched against the mapped data without
+    reading or decoding it, context lines being found by scanning backward and
+    forward for newlines around each hit. Only the emitted lines are decoded.
+
+    Unlike the text engines, lines are matched as stored in the file: no newline
+    translation is done and regexes follow bytes semantics ('\\w' is ASCII only).
+    """
+    DEFAULT_ENCODING = "utf-8"
+
+    def __init__(self, stream, leading_ctx_size, search_ctx_size, trailing_ctx_size,
+                 encoding=DEFAULT_ENCODING, errors="replace"):
+        """
+        :param stream: file object opened on a regular file, in binary mode
+        """
+        super(MmapSgrep, self).__init__(stream, leading_ctx_size, search_ctx_size, trailing_ctx_size,
+                                        encoding, errors)
+        self._range = None
+        self._line_index = None
+        self._trigram_index = None
+
+    def set_range(self, start: int, end: int) -> None:
+        """
+        Only check the windows starting in the byte range [start, end) of the file, context
+        lines are still taken from the whole file. Used to split a file between processes.
+        :param start: offset of a line start
+        :param end: offset of a line start, or the file size
+        :return:
+        """
+        self._range = (start, end)
+
+    def set_line_index(self, line_index: LineIndex) -> None:
+        """
+        Use the line index of the file to find line numbers instead of counting lines
+        :param line_index: up to date index of the file searched
+        :return:
+        """
+        self._line_index = line_index
+
+    def set_trigram_index(self, trigram_index: TrigramIndex) -> None:
+        """
+        Only scan the blocks of the file the trigram index says can hold a match
+        :param trigram_index: up to date index of the file searched
+        :return:
+        """
+        self._trigram_index = trigram_index
+
+    def _required_literal_alternatives(self) -> []:
+        """
+        :return: list of lists of literals, a match holding all the literals of one of the lists
+        """
+        return [backend.required_literals() for backend in self._pattern_backends or [self._backend]]
+
+    def _candidate_ranges(self, data, start: int, end: int) -> []:
+        """
+        Use the trigram index to find the ranges of [start, end) where matching windows can start
+        :return: list of (start, end)
+        """
+        blocks = self._trigram_index.candidate_blocks(self._required_literal_alternatives())
+        if blocks is None:
+            return [(start, end)]
+
+        ranges = []
+        for block in blocks:
+            block_start, block_end = self._trigram_index.block_range(block)
+            # Windows starting up to 'search_ctx_size - 1' lines earlier may reach the block
+            range_start = self._back_lines(data, block_start, self._search_ctx_size - 1,
+                                           ranges[-1][1] if ranges else 0)
+            range_start, range_end = max(range_start, start), min(block_end, end)
+            if range_start >= range_end:
+                continue
+            if ranges and range_start == ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0], range_end)
+            else:
+                ranges.append((range_start, range_end))
+        return ranges
+
+    def _line_number(self, text: str, pos: int) -> int:
+        if self._line_index is not None and pos < self._line_index.size:
+            return self._line_index.line_number(pos) + 1
+        return super(MmapSgrep, self)._line_number(text, pos)
+
+    def _run(self):
+        fileno = self._stream.fileno()
+        if os.fstat(fileno).st_size == 0:
+            # Empty files can't be mapped
+            yield from self._search(b'')
+            return
+
+        with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapped:
+            yield from self._search(mapped)
+
+    def _search(self, data):
+        """
+        :return: generator yielding after each range of about 'block_size' bytes was scanned
+        """
+        start, end = self._range or (0, len(data))
+        end = min(end, len(data))
+        # An empty file is still given to the matcher once, an empty range isn't
+        ranges = [(start, end)] if start < end or not len(data) else []
+        if self._trigram_index is not None:
+            ranges = self._candidate_ranges(data, start, end)
+            if self._stats is not None:
+                # Windows of the skipped blocks
+                for gap_start, gap_end in zip([start] + [e for _, e in ranges], [s for s, _ in ranges] + [end]):
+                    self._stats.windows += self._count_lines(data, gap_start, gap_end)
+
+        for range_start, range_end in ranges:
+            if self._hooks is not None:
+                # Nothing is read, the mapped range is scanned in place
+                self._hooks.on_read(self._count_lines(data, range_start, range_end), range_end - range_start, 0.0)
+            if range_start == 0:
+                pos = self._handle_short_stream(data)
+            else:
+                pos = range_start
+            # Scanned in slices ending on line starts so the matches found can be handed over
+            while pos is not None and pos < range_end:
+                limit = data.find(self._newline, pos + self._block_size - 1, range_end)
+                limit = range_end if limit == -1 else limit + 1
+                self._scan(data, pos, limit)
+                pos = limit
+                yield
+            if pos is None:
+                yield
@@ -21,15 +21,66 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
-from abc import ABC
+from abc import ABC, abstractmethod
+from collections import deque
+
+
+class TextWindow:
+    """
+    Contiguous text holding the entries of all the stacked buffers, oldest first.
+    Binary windows hold bytes entries in a bytearray.
+
+    Offsets handed out by the window are absolute: they keep growing as entries
+    are appended and stay valid after the already consumed text is dropped.
+    """
+    # Don't bother compacting the text until this many characters are dead
+    COMPACT_THRESHOLD = 4096
+
+    def __init__(self, binary=False):
+        self._text = bytearray() if binary else ''
+        self._origin = 0
+        self._end = 0
+
+    @property
+    def end(self) -> int:
+        """
+        Absolute offset right after the newest entry
+        :return: int
+        """
+        return self._end
+
+    def append(self, entry: str) -> None:
+        # Drop our own reference first so CPython can grow the text in place
+        text = self._text
+        self._text = None
+        text += entry
+        self._text = text
+        self._end += len(entry)
+
+    def release(self, offset: int) -> None:
+        """
+        Signal that the text before 'offset' is no longer needed. The text is only
+        compacted once most of it is dead, making the cost amortized O(1) per entry.
+        :param offset: absolute offset
+        :return:
+        """
+        dead = offset - self._origin
+        if dead > self.COMPACT_THRESHOLD and dead > len(self._text) - dead:
+            self._text = self._text[dead:]
+            self._origin = offset
+
+    def slice(self, start: int, end: int) -> str:
+        return self._text[start - self._origin:end - self._origin]
+
+    def span(self, start: int, end: int) -> (str, int, int):
+        return self._text, start - self._origin, end - self._origin
 
 
 class BufferABC(ABC):
     """
     Buffer interface
     """
-    def __init__(self, buffer: [], buffer_size):
-        self._buffer = buffer
+    def __init__(self, buffer_size):
         self._size = buffer_size
 
     @property
@@ -41,38 +92,96 @@ class BufferABC(ABC):
         return self._size
 
     @property
+    @abstractmethod
     def is_full(self) -> bool:
-        return len(self._buffer) == self._size
+        pass
 
     @property
+    @abstractmethod
     def is_empty(self) -> bool:
-        return not bool(self._buffer)
+        pass
+
+    @property
+    @abstractmethod
+    def nb_entries(self) -> int:
+        pass
 
     @property
+    @abstractmethod
     def buffer_str(self) -> str:
-        return "".join(self._buffer)
+        pass
+
+    @property
+    @abstractmethod
+    def span(self) -> (str, int, int):
+        """
+        Zero copy access to the buffer content: 'text[start:end]' is equal to 'buffer_str'.
+        Only valid until the next push onto the buffers.
+        :return: (text, start, end)
+        """
 
 
 class Buffer(BufferABC):
     """
     Buffer implementation for internal use by StackedBuffers. Allows
     pushing data onto the buffer.
+
+    The buffer doesn't hold the entries themselves, only their lengths and the
+    range they cover in the TextWindow shared by all stacked buffers. Entry
+    lengths are kept in a deque used as a fixed capacity ring, so pushing and
+    popping costs O(1) regardless of the buffer size.
     """
-    def __init__(self, buffer_size):
-        self.buffer = []
-        super(Buffer, self).__init__(self.buffer, buffer_size)
+    def __init__(self, buffer_size, window: TextWindow):
+        super(Buffer, self).__init__(buffer_size)
+        self._window = window
+        self._lengths = deque()
+        self._start = window.end
+        self._end = window.end
+
+    @property
+    def start(self) -> int:
+        return self._start
 
-    def push(self, entry: str) -> (None, str):
+    @property
+    def is_full(self) -> bool:
+        return len(self._lengths) == self._size
+
+    @property
+    def is_empty(self) -> bool:
+        return not self._lengths
+
+    @property
+    def nb_entries(self) -> int:
+        return len(self._lengths)
+
+    @property
+    def buffer_str(self) -> str:
+        return self._window.slice(self._start, self._end)
+
+    @property
+    def span(self) -> (str, int, int):
+        return self._window.span(self._start, self._end)
+
+    def push(self, entry_len: int) -> (None, int):
         """
         Push a new entry onto the buffer, popping the oldest item if it went beyond its maximum size.
-        Pushing 'None' or '' simply pops the oldest entry in the buffer
-        :param entry: data string to push onto the buffer
-        :return: None or the oldest discarded entry when buffer was full.
+        The entry must directly follow the buffer content in the window.
+        Pushing 'None' or 0 simply pops the oldest entry in the buffer
+        :param entry_len: length of the entry pushed onto the buffer
+        :return: None or the length of the oldest discarded entry when buffer was full.
         """
-        if entry:
-            self.buffer.append(entry)
-        if (len(self.buffer) > self._size) or not self.is_empty and (entry is None or entry == ''):
-            return self.buffer.pop(0)
+        lengths = self._lengths
+        if entry_len:
+            lengths.append(entry_len)
+            self._end += entry_len
+            if len(lengths) > self._size:
+                popped = lengths.popleft()
+                self._start += popped
+                return popped
+        elif lengths:
+            popped = lengths.popleft()
+            self._start += popped
+            return popped
         return None
 
 
@@ -81,7 +190,28 @@ class PublicBuffer(BufferABC):
     Buffer implementation for client use by. No methods for changing the internal data.
     """
     def __init__(self, buffer: Buffer):
-        super(PublicBuffer, self).__init__(buffer.buffer, buffer.size)
+        super(PublicBuffer, self).__init__(buffer.size)
+        self._buffer = buffer
+
+    @property
+    def is_full(self) -> bool:
+        return self._buffer.is_full
+
+    @property
+    def is_empty(self) -> bool:
+        return self._buffer.is_empty
+
+    @property
+    def nb_entries(self) -> int:
+        return self._buffer.nb_entries
+
+    @property
+    def buffer_str(self) -> str:
+        return self._buffer.buffer_str
+
+    @property
+    def span(self) -> (str, int, int):
+        return self._buffer.span
 
 
 def buffer_index_checker(f):
@@ -101,20 +231,40 @@ def buffer_index_checker(f):
 class StackedBuffers:
     """
     The stacked buffer implementation pushes data from leading buffers onto the following
-    ones when they're full
+    ones when they're full.
+
+    All entries live in a single TextWindow, each buffer covering a contiguous range
+    of it, so moving an entry from one buffer to the next only shifts offsets.
+    Entries are either all str or, for binary stacks, all bytes.
     """
-    def __init__(self, buffers_size: []):
+    def __init__(self, buffers_size: [], binary=False):
+        self._window = TextWindow(binary)
         self._buffers = []
         self._public_buffers = []
         self._nb_buffers = len(buffers_size)
         for i in range(0, self._nb_buffers):
-            self._buffers.append(Buffer(buffers_size[i]))
+            self._buffers.append(Buffer(buffers_size[i], self._window))
             self._public_buffers.append(PublicBuffer(self._buffers[-1]))
 
+        # Buffers in push order, newest first, and number of entries held by all of them.
+        # Zero sized buffers would hand every entry straight to the next one, skip them.
+        self._push_order = [b for b in self._buffers[::-1] if b.size > 0]
+        self._nb_entries = 0
+        self._nb_pushed = 0
+
     def push(self, entry) -> None:
-        push_next = entry
-        for i in range(self._nb_buffers-1, 0-1, -1):
-            push_next = self._buffers[i].push(push_next)
+        if entry:
+            self._window.append(entry)
+            self._nb_entries += 1
+            self._nb_pushed += 1
+            push_next = len(entry)
+        else:
+            push_next = None
+        for buffer in self._push_order:
+            push_next = buffer.push(push_next)
+        if push_next:
+            self._nb_entries -= 1
+            self._window.release(self._push_order[-1].start if self._push_order else self._window.end)
 
     @property
     def size(self) -> int:
@@ -126,10 +276,15 @@ class StackedBuffers:
 
     @property
     def is_empty(self) -> bool:
-        for i in range(0, self._nb_buffers):
-            if not self._buffers[i].is_empty:
-                return False
-        return True
+        return self._nb_entries == 0
+
+    @property
+    def nb_pushed(self) -> int:
+        """
+        Return number of entries ever pushed onto the stack
+        :return: int
+        """
+        return self._nb_pushed
 
     @buffer_index_checker
     def get_buffer(self, index) -> PublicBuffer:
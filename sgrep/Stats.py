@@ -0,0 +1,210 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak memory isn't reported
+    resource = None
+
+import sys
+import time
+
+
+class SearchHooks:
+    """
+    Callbacks invoked while searching, see 'Sgrep.set_hooks'. Hooks are only wired in
+    when set: a search without hooks doesn't pay for them.
+    """
+    def on_read(self, nb_lines: int, nb_bytes: int, seconds: float) -> None:
+        """
+        Data was read from the stream. Sizes are in characters for text streams.
+        :param seconds: time spent reading
+        """
+        pass
+
+    def on_tick(self, seconds: float) -> None:
+        """
+        StreamParser moved its buffers by a line
+        :param seconds: time spent, reading the line included
+        """
+        pass
+
+    def on_matcher_call(self, text, start: int, end: int, match_str, seconds: float) -> None:
+        """
+        The matcher was run on the window text[start:end]
+        :param match_str: what the matcher returned, None if the window doesn't match
+        """
+        pass
+
+    def on_output(self, seconds: float) -> None:
+        """
+        A match was processed (decoded, formatted and output or saved), or the output flushed
+        """
+        pass
+
+    def on_search_end(self, seconds: float) -> None:
+        """
+        The search is over
+        :param seconds: time since it started
+        """
+        pass
+
+
+class HookedStream:
+    """
+    Stream reporting its reads to hooks, other attributes are the wrapped stream's
+    """
+    def __init__(self, stream, hooks: SearchHooks):
+        self._stream = stream
+        self._hooks = hooks
+        # The last block read ends in the middle of a line
+        self._partial_line = False
+
+    def readline(self):
+        start = time.perf_counter()
+        line = self._stream.readline()
+        self._hooks.on_read(1 if line else 0, len(line), time.perf_counter() - start)
+        return line
+
+    def read(self, size: int = -1):
+        start = time.perf_counter()
+        block = self._stream.read(size)
+        seconds = time.perf_counter() - start
+        newline = b"\n" if isinstance(block, bytes) else "\n"
+        nb_lines = block.count(newline)
+        if block:
+            self._partial_line = not block.endswith(newline)
+        elif self._partial_line:
+            # Last line, without a newline
+            nb_lines = 1
+            self._partial_line = False
+        self._hooks.on_read(nb_lines, len(block), seconds)
+        return block
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+
+def peak_memory() -> (None, int):
+    """
+    :return: peak resident memory of the process in bytes, None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Stats(SearchHooks):
+    """
+    Counters and timings gathered while searching, when enabled with 'Sgrep.enable_stats'.
+
+    'windows' is the number of search windows in the input, 'checked' the number handed
+    to the matcher, 'prefiltered' those of them ruled out by the required literal check
+    before running the regex. The other windows were skipped without looking at them.
+
+    Time is split in phases: reading the stream, moving the stream engine buffers, running
+    the matcher and outputting matches. What's left is spent scanning, like searching
+    blocks for literals and rebuilding contexts in the block engines.
+    """
+    def __init__(self):
+        self.windows = 0
+        self.checked = 0
+        self.prefiltered = 0
+        self.matches = 0
+        # Name of the backend finding the patterns, see 'MatcherBackends'
+        self.backend = None
+        # Literal the matcher checks before running its regex, if any
+        self.required_literal = None
+
+        self.lines_read = 0
+        self.bytes_read = 0
+        self.ticks = 0
+        self.read_time = 0.0
+        self.tick_time = 0.0
+        self.match_time = 0.0
+        self.output_time = 0.0
+        self.total_time = 0.0
+
+    def on_read(self, nb_lines: int, nb_bytes: int, seconds: float) -> None:
+        self.lines_read += nb_lines
+        self.bytes_read += nb_bytes
+        self.read_time += seconds
+
+    def on_tick(self, seconds: float) -> None:
+        self.ticks += 1
+        self.tick_time += seconds
+
+    def on_matcher_call(self, text, start: int, end: int, match_str, seconds: float) -> None:
+        self.checked += 1
+        self.match_time += seconds
+        if self.required_literal is not None and text.find(self.required_literal, start, end) == -1:
+            self.prefiltered += 1
+        if match_str is not None:
+            self.matches += 1
+
+    def on_output(self, seconds: float) -> None:
+        self.output_time += seconds
+
+    def on_search_end(self, seconds: float) -> None:
+        self.total_time += seconds
+
+    @property
+    def skip_ratio(self) -> float:
+        """
+        Ratio of windows the regex or literal search never ran on
+        """
+        if not self.windows:
+            return 0.0
+        return (self.windows - self.checked + self.prefiltered) / self.windows
+
+    @property
+    def phase_times(self) -> dict:
+        """
+        :return: seconds spent per phase, reading excluded from the buffers phase
+        """
+        buffers_time = max(0.0, self.tick_time - self.read_time) if self.ticks else 0.0
+        read_time = self.read_time
+        return {
+            "read": read_time,
+            "buffers": buffers_time,
+            "match": self.match_time,
+            "output": self.output_time,
+            "scan": max(0.0, self.total_time - read_time - buffers_time - self.match_time - self.output_time)
+        }
+
+    def report(self) -> str:
+        phases = ", ".join([f"{name} {seconds:.3f}s" for name, seconds in self.phase_times.items()])
+        report = f"windows: {self.windows}, checked: {self.checked}, prefiltered: {self.prefiltered}, " \
+                 f"matches: {self.matches}, skip ratio: {self.skip_ratio:.1%}, backend: {self.backend}, " \
+                 f"read: {self.lines_read} lines {self.bytes_read} bytes, ticks: {self.ticks}, " \
+                 f"time: {self.total_time:.3f}s ({phases})"
+        if self.total_time > 0:
+            report += f", throughput: {self.bytes_read / 1000000 / self.total_time:.1f} MB/s " \
+                      f"{self.windows / self.total_time:.0f} lines/s"
+        peak = peak_memory()
+        if peak is not None:
+            report += f", peak memory: {peak / 1000000:.1f} MB"
+        return report
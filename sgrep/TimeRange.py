@@ -0,0 +1,147 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import datetime
+import os
+import re
+
+
+class TimeRange:
+    """
+    Time window of a log whose lines are in timestamp order, like most logs are.
+
+    The byte range of the lines in the window is found by bisecting the file: each
+    probe seeks to an offset, moves to the next line start and reads lines until
+    one holds a timestamp. Only a few lines are read per probe, about 'log2(size)'
+    probes are made, so the range is found without reading the whole file.
+
+    Lines without a timestamp, like the lines of a stack trace, belong to the last
+    timestamped line before them. Lines before the first timestamped line of the
+    file are before any time.
+    """
+    # ISO 8601 like timestamps: '2023-02-12 10:00:01', '2023-02-12T10:00:01.123+02:00'...
+    DEFAULT_TIMESTAMP_REGEX = r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?"
+
+    def __init__(self, since: (None, str), until: (None, str), timestamp_regex: str = DEFAULT_TIMESTAMP_REGEX,
+                 timestamp_format: (None, str) = None):
+        """
+        :param since: time of the first lines in the window, from the start of the file if None
+        :param until: time of the last lines in the window, up to the end of the file if None
+        :param timestamp_regex: regex finding the timestamp in a line, its first group if it has
+            one, the whole match otherwise
+        :param timestamp_format: 'strptime' format of the timestamps, ISO 8601 if None. 'since'
+            and 'until' are parsed with it too, or as ISO 8601
+        """
+        try:
+            self._timestamp_regex = re.compile(timestamp_regex)
+        except re.error as e:
+            raise Exception(f"Invalid timestamp regex '{timestamp_regex}': {e}")
+        self._timestamp_format = timestamp_format
+        self._since = self._parse_bound(since)
+        self._until = self._parse_bound(until)
+
+    def _parse(self, text: str) -> datetime.datetime:
+        if self._timestamp_format is None:
+            return datetime.datetime.fromisoformat(text)
+        return datetime.datetime.strptime(text, self._timestamp_format)
+
+    def _parse_bound(self, text: (None, str)) -> (None, datetime.datetime):
+        if text is None:
+            return None
+        try:
+            return self._parse(text)
+        except ValueError:
+            pass
+        try:
+            return datetime.datetime.fromisoformat(text)
+        except ValueError:
+            raise Exception(f"Invalid time '{text}', expecting "
+                            f"{repr(self._timestamp_format) + ' or ' if self._timestamp_format else ''}ISO 8601")
+
+    def timestamp(self, line: bytes) -> (None, datetime.datetime):
+        """
+        :return: timestamp of 'line', None if it has none
+        """
+        m = self._timestamp_regex.search(line.decode("utf-8", errors="replace"))
+        if m is None:
+            return None
+        try:
+            return self._parse(m.group(1) if m.re.groups else m.group(0))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _is_before(timestamp: datetime.datetime, bound: datetime.datetime, inclusive: bool) -> bool:
+        try:
+            return timestamp < bound or (inclusive and timestamp == bound)
+        except TypeError:
+            raise Exception("Can't compare timestamps with and without a time zone, give both or neither")
+
+    def _next_timestamp(self, fd, offset: int, size: int) -> (int, (None, datetime.datetime)):
+        """
+        Find the first line holding a timestamp starting at or after 'offset'
+        :return: (offset of the line start, its timestamp), (size, None) if there is none
+        """
+        if offset > 0:
+            # Skip the rest of the line holding 'offset - 1'
+            fd.seek(offset - 1)
+            fd.readline()
+        else:
+            fd.seek(0)
+        pos = fd.tell()
+        while pos < size:
+            line = fd.readline()
+            if not line:
+                break
+            timestamp = self.timestamp(line)
+            if timestamp is not None:
+                return pos, timestamp
+            pos += len(line)
+        return size, None
+
+    def _bisect(self, fd, size: int, bound: datetime.datetime, inclusive: bool) -> int:
+        """
+        :param inclusive: lines timestamped 'bound' are before it
+        :return: offset of the first timestamped line not before 'bound', 'size' if there is none
+        """
+        # The first timestamped line from any offset before 'lo' is before 'bound', from 'hi' on it isn't
+        lo, hi = 0, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos, timestamp = self._next_timestamp(fd, mid, size)
+            if timestamp is not None and self._is_before(timestamp, bound, inclusive):
+                # No timestamped line starts between 'mid' and 'pos'
+                lo = pos + 1
+            else:
+                hi = mid
+        return self._next_timestamp(fd, lo, size)[0]
+
+    def byte_range(self, fd) -> (int, int):
+        """
+        :param fd: file object opened in binary mode on a regular file
+        :return: (start, end) byte range of the lines in the window, both line starts or the file size
+        """
+        size = os.fstat(fd.fileno()).st_size
+        start = 0 if self._since is None else self._bisect(fd, size, self._since, inclusive=False)
+        end = size if self._until is None else self._bisect(fd, size, self._until, inclusive=True)
+        return start, max(start, end)
@@ -0,0 +1,240 @@
+"""
+MIT License
+
+Copyright (c) 2023 Mathieu Comeau
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+
+import mmap
+import os
+import struct
+import sys
+
+
+def _trigram_key(trigram) -> int:
+    return (trigram[0] << 16) | (trigram[1] << 8) | trigram[2]
+
+
+def _index_blocks(path: str, block_starts: [], first_block: int) -> dict:
+    """
+    Find the trigrams of the blocks [block_starts[i], block_starts[i + 1]) of 'path'.
+    Runs in worker processes.
+    :return: {trigram key: array of block numbers}
+    """
+    postings = {}
+    with open(path, "rb") as fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for i in range(len(block_starts) - 1):
+            block = data[block_starts[i]:block_starts[i + 1]]
+            for key in [(x << 16) | (y << 8) | z for x, y, z in set(zip(block, block[1:], block[2:]))]:
+                if key not in postings:
+                    postings[key] = array("I")
+                postings[key].append(first_block + i)
+    return postings
+
+
+class TrigramIndex:
+    """
+    Index of the trigrams found in each block of a file, kept in a sidecar file next to it
+    ('archive.log.sgtri'). Meant for files which don't change anymore: the index is ignored
+    as soon as the file size or modification time differ from when it was built.
+
+    Blocks are ranges of whole lines of about 'block_size' bytes. Trigrams are taken from the
+    raw bytes of the file, so a literal can only be in the blocks holding all its trigrams.
+    """
+    SUFFIX = ".sgtri"
+    MAGIC = b"SGTRI\x01\x00\x00"
+    # Indexed file size, mtime in ns, number of blocks, number of trigrams
+    HEADER = struct.Struct("<QqQQ")
+    DEFAULT_BLOCK_SIZE = 256 * 1024
+
+    def __init__(self, path: str):
+        self._path = path
+        self._size = 0
+        self._mtime_ns = 0
+        # Block i is [block_starts[i], block_starts[i + 1])
+        self._block_starts = array("Q", [0])
+        # Sorted trigram keys, the blocks of keys[i] are postings[offsets[i]:offsets[i + 1]]
+        self._keys = array("I")
+        self._offsets = array("Q", [0])
+        self._postings = array("I")
+
+    @classmethod
+    def for_file(cls, path: str):
+        """
+        :return: index of 'path' if it has an up to date one, None otherwise
+        """
+        index = cls(path)
+        if not index.load():
+            return None
+        stat = os.stat(path)
+        if (stat.st_size, stat.st_mtime_ns) != (index._size, index._mtime_ns):
+            return None
+        return index
+
+    @classmethod
+    def build(cls, path: str, block_size: int = DEFAULT_BLOCK_SIZE, jobs: int = 1):
+        """
+        Index 'path', spreading the blocks over 'jobs' worker processes
+        :return: TrigramIndex, not saved yet
+        """
+        if block_size <= 0:
+            raise Exception(f"Invalid block size: {block_size}")
+        index = cls(path)
+        with open(path, "rb") as fd:
+            stat = os.fstat(fd.fileno())
+            index._size, index._mtime_ns = stat.st_size, stat.st_mtime_ns
+            if stat.st_size:
+                with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    index._block_starts = cls._block_bounds(data, block_size)
+
+        nb_blocks = len(index._block_starts) - 1
+        per_job = max(1, -(-nb_blocks // max(1, jobs)))
+        firsts = range(0, nb_blocks, per_job)
+        block_starts = [index._block_starts[first:first + per_job + 1] for first in firsts]
+        if jobs <= 1 or len(block_starts) <= 1:
+            results = map(_index_blocks, [path] * len(block_starts), block_starts, firsts)
+            index._merge(results)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                index._merge(executor.map(_index_blocks, [path] * len(block_starts), block_starts, firsts))
+        return index
+
+    @staticmethod
+    def _block_bounds(data, block_size: int) -> array:
+        bounds = array("Q", [0])
+        while bounds[-1] < len(data):
+            newline = data.find(b"\n", bounds[-1] + block_size - 1)
+            bounds.append(newline + 1 if newline != -1 else len(data))
+        return bounds
+
+    def _merge(self, results) -> None:
+        postings = {}
+        # Results come in block order, so are the merged postings
+        for result in results:
+            for key, blocks in result.items():
+                if key in postings:
+                    postings[key].extend(blocks)
+                else:
+                    postings[key] = blocks
+        self._keys = array("I", sorted(postings))
+        self._offsets = array("Q", [0])
+        self._postings = array("I")
+        for key in self._keys:
+            self._postings.extend(postings[key])
+            self._offsets.append(len(self._postings))
+
+    @property
+    def index_path(self) -> str:
+        return self._path + self.SUFFIX
+
+    @property
+    def nb_blocks(self) -> int:
+        return len(self._block_starts) - 1
+
+    @property
+    def nb_trigrams(self) -> int:
+        return len(self._keys)
+
+    def block_range(self, block: int) -> (int, int):
+        return self._block_starts[block], self._block_starts[block + 1]
+
+    def _blocks_with_trigram(self, key: int) -> array:
+        i = bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return array("I")
+        return self._postings[self._offsets[i]:self._offsets[i + 1]]
+
+    def blocks_with(self, literal: bytes) -> (None, set):
+        """
+        :return: blocks which may hold 'literal', None if it has no trigram to tell
+        """
+        best = None
+        # Trigrams spanning a newline may spread over two blocks, only look within lines
+        for part in literal.split(b"\n"):
+            if len(part) < 3:
+                continue
+            blocks = None
+            for key in sorted({_trigram_key(t) for t in zip(part, part[1:], part[2:])}):
+                with_trigram = set(self._blocks_with_trigram(key))
+                blocks = with_trigram if blocks is None else blocks & with_trigram
+                if not blocks:
+                    break
+            if best is None or len(blocks) < len(best):
+                best = blocks
+        return best
+
+    def candidate_blocks(self, alternatives: []) -> (None, []):
+        """
+        Find the blocks a match can be found in
+        :param alternatives: list of lists of literals, a match holding all the literals of one of the lists
+        :return: sorted block numbers, None if the trigrams can't rule out any block
+        """
+        blocks = set()
+        for literals in alternatives:
+            best = None
+            for literal in literals:
+                with_literal = self.blocks_with(literal)
+                if with_literal is not None and (best is None or len(with_literal) < len(best)):
+                    best = with_literal
+            if best is None:
+                return None
+            blocks |= best
+        return sorted(blocks)
+
+    def load(self) -> bool:
+        """
+        Load the sidecar file, if any
+        :return: True if it was loaded
+        """
+        try:
+            with open(self.index_path, "rb") as fd:
+                if fd.read(len(self.MAGIC)) != self.MAGIC:
+                    return False
+                size, mtime_ns, nb_blocks, nb_trigrams = self.HEADER.unpack(fd.read(self.HEADER.size))
+                arrays = [array("Q"), array("I"), array("Q"), array("I")]
+                for a, n in zip(arrays, [nb_blocks + 1, nb_trigrams, nb_trigrams + 1, None]):
+                    # The number of postings is the last posting offset
+                    a.fromfile(fd, n if n is not None else arrays[2][-1])
+                    if sys.byteorder == "big":
+                        a.byteswap()
+        except (OSError, EOFError, struct.error):
+            return False
+
+        self._size, self._mtime_ns = size, mtime_ns
+        self._block_starts, self._keys, self._offsets, self._postings = arrays
+        return True
+
+    def save(self) -> None:
+        arrays = [self._block_starts, self._keys, self._offsets, self._postings]
+        if sys.byteorder == "big":
+            arrays = [array(a.typecode, a) for a in arrays]
+            for a in arrays:
+                a.byteswap()
+        # Don't leave a partial index behind if interrupted
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as fd:
+            fd.write(self.MAGIC)
+            fd.write(self.HEADER.pack(self._size, self._mtime_ns, self.nb_blocks, self.nb_trigrams))
+            for a in arrays:
+                a.tofile(fd)
+        os.replace(tmp_path, self.index_path)
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Thin client of 'sgrep.py serve': takes the same arguments as 'sgrep.py' and has the
+server run the search, which saves the interpreter startup and imports of the tool.
+Only the standard library modules needed to talk to the server are imported.
+
+The socket is '$SGREP_SOCKET', or the default one of 'sgrep.py serve'. When no server
+is listening, or for searches it doesn't run like those of stdin, 'sgrep.py' is run
+instead, so this can always be used in place of it.
+"""
+from sgrep.Client import main
+
+import os
+import sys
+
+SGREP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sgrep.py")
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:], SGREP))
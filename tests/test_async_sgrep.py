@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import asyncio
+import contextlib
+import importlib
+import io
+import os
+import sys
+import unittest
+
+import utils
+
+append_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(append_path)
+sgrep = importlib.import_module("sgrep")
+from sgrep.AsyncSgrep import *
+
+
+async def chunks(data, size: int):
+    for i in range(0, len(data), size):
+        # Let other tasks run, like a socket would
+        await asyncio.sleep(0)
+        yield data[i:i + size]
+
+
+class TestAsyncSgrep(unittest.TestCase):
+    SEARCHES = [
+        ["line 6", False, False],
+        ["one\ntwo\nthree", False, False],
+        [r"(ctx\d)\n(line) 2", True, True],
+        [["ctx2", "two"], False, False]
+    ]
+
+    def _expected(self, buffer_sizes: [], search, regex: bool, captured: bool) -> []:
+        grepper = Sgrep(io.StringIO(utils.SAMPLE_CONTENT), *buffer_sizes)
+        grepper.set_show_markers(False)
+        grepper.set_line_numbers(True)
+        grepper.setup(search, regex, captured)
+        return [repr(m) for m in grepper.matches()]
+
+    def test_same_matches_as_sgrep(self):
+        async def matches(stream, buffer_sizes, search, regex, captured, **kwargs):
+            grepper = AsyncSgrep(stream, *buffer_sizes, **kwargs)
+            grepper.set_show_markers(False)
+            grepper.set_line_numbers(True)
+            grepper.setup(search, regex, captured)
+            return [repr(m) async for m in grepper.matches()]
+
+        for buffer_sizes in [[0, 1, 0], [1, 1, 1], [2, 3, 1], [0, 3, 0]]:
+            for search, regex, captured in self.SEARCHES:
+                expected = self._expected(buffer_sizes, search, regex, captured)
+                for chunk_size in [1, 4, 1000]:
+                    with self.subTest(buffer_sizes=buffer_sizes, search=search, chunk_size=chunk_size):
+                        self.assertEqual(asyncio.run(matches(chunks(utils.SAMPLE_CONTENT, chunk_size), buffer_sizes,
+                                                             search, regex, captured)), expected)
+                        # Bytes are decoded, or searched as is with an encoding
+                        data = utils.SAMPLE_CONTENT.replace("\n", "\r\n").encode()
+                        self.assertEqual(asyncio.run(matches(chunks(data, chunk_size), buffer_sizes,
+                                                             search, regex, captured)), expected)
+                        data = utils.SAMPLE_CONTENT.encode()
+                        self.assertEqual(asyncio.run(matches(chunks(data, chunk_size), buffer_sizes,
+                                                             search, regex, captured, encoding="utf-8")), expected)
+
+    def test_run_and_count(self):
+        async def search(count: bool, max_count=None):
+            grepper = AsyncSgrep(chunks(utils.SAMPLE_CONTENT, 7), 1, 1, 0)
+            grepper.set_show_markers(False)
+            grepper.set_max_count(max_count)
+            grepper.setup("line", False, False)
+            if count:
+                return await grepper.count()
+            await grepper.run()
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            asyncio.run(search(False, max_count=2))
+        self.assertEqual(output.getvalue(), "ctx3\nline 2 [\n\nline 2 [\nline 3\n\n")
+        self.assertEqual(asyncio.run(search(True)), 6)
+        self.assertEqual(asyncio.run(search(True, max_count=4)), 4)
+
+    def test_stats(self):
+        async def search():
+            grepper = AsyncSgrep(chunks(utils.SAMPLE_CONTENT, 5), 0, 1, 0)
+            stats = grepper.enable_stats()
+            grepper.set_matches_saving(True)
+            grepper.setup("two", False, False)
+            await grepper.run()
+            return stats
+
+        stats = asyncio.run(search())
+        self.assertEqual(stats.lines_read, 12)
+        self.assertEqual(stats.bytes_read, len(utils.SAMPLE_CONTENT))
+        self.assertEqual(stats.matches, 1)
+
+    def test_subprocess_pipes(self):
+        nb_processes = 20
+        script = "import sys, time\n" \
+                 "for i in range(50):\n" \
+                 "    print(f'process {sys.argv[1]} line {i}' + (' ERROR' if i % 10 == 3 else ''), flush=True)\n" \
+                 "    if i % 20 == 0:\n" \
+                 "        time.sleep(0.01)\n"
+
+        async def search():
+            processes = [await asyncio.create_subprocess_exec(sys.executable, "-c", script, str(n),
+                                                              stdout=asyncio.subprocess.PIPE)
+                         for n in range(nb_processes)]
+            greppers = {}
+            for n, process in enumerate(processes):
+                grepper = AsyncSgrep(process.stdout, 1, 1, 0, encoding="utf-8")
+                grepper.set_line_numbers(True)
+                grepper.setup("ERROR", False, False)
+                greppers[n] = grepper
+            try:
+                return [(key, match.leading, match.match, match.line_number)
+                        async for key, match in merged_matches(greppers, queue_size=4)]
+            finally:
+                for process in processes:
+                    await process.wait()
+
+        found = asyncio.run(search())
+        self.assertEqual(len(found), nb_processes * 5)
+        for n in range(nb_processes):
+            # In order for each stream
+            self.assertEqual([m[1:] for m in found if m[0] == n],
+                             [(f"process {n} line {i - 1}\n", f"process {n} line {i} ERROR\n", i + 1)
+                              for i in range(3, 50, 10)])
+
+    def test_merged_matches_errors(self):
+        async def failing():
+            yield "line\n"
+            raise OSError("connection reset")
+
+        async def endless():
+            while True:
+                await asyncio.sleep(0)
+                yield "line\n"
+
+        async def search(stop_early: bool):
+            greppers = {"ok": AsyncSgrep(chunks("line\n" * 1000, 10), 0, 1, 0),
+                        "other": AsyncSgrep(endless() if stop_early else failing(), 0, 1, 0)}
+            for grepper in greppers.values():
+                grepper.setup("line", False, False)
+            found = 0
+            async for _ in merged_matches(greppers, queue_size=2):
+                found += 1
+                if stop_early and found == 3:
+                    break
+            return found
+
+        with self.assertRaises(OSError):
+            asyncio.run(search(False))
+        self.assertEqual(asyncio.run(search(True)), 3)
+
+    def test_text_encoding(self):
+        async def search(text_encoding, errors="strict"):
+            grepper = AsyncSgrep(chunks("é 1\nx\né 2\n".encode("latin-1"), 2), 0, 1, 0, errors=errors,
+                                 text_encoding=text_encoding)
+            grepper.setup("é", False, False)
+            return [m.match async for m in grepper.matches()]
+
+        self.assertEqual(asyncio.run(search("latin-1")), ["é 1\n", "é 2\n"])
+        self.assertEqual(asyncio.run(search("utf-8", "replace")), [])
+        with self.assertRaises(UnicodeDecodeError):
+            asyncio.run(search("utf-8"))
+        with self.assertRaises(Exception, msg="Text encoding given to a bytes search!"):
+            AsyncSgrep(chunks(b"", 1), 0, 1, 0, encoding="utf-8", text_encoding="latin-1")
+
+    def test_text_read_as_bytes(self):
+        async def search():
+            grepper = AsyncSgrep(chunks("text", 2), 0, 1, 0, encoding="utf-8")
+            grepper.setup("text", False, False)
+            return [m async for m in grepper.matches()]
+
+        with self.assertRaises(Exception, msg="Text given to a bytes search!"):
+            asyncio.run(search())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -126,6 +126,58 @@ class TestMultiStackBuffer(BufferTest):
             stacked_buffer.push(None)
         self._confirm_stack_empty(stacked_buffer)
 
+    def test_large_stacked_buffer_wraps(self):
+        push_nb_items = 1000
+        buffer_sizes = [300, 1, 300]
+
+        stacked_buffer = StackedBuffers(buffer_sizes)
+        expected_content_format = utils.push_1_to_x_numbers(stacked_buffer, push_nb_items)
+
+        expected_content = [
+            "".join([expected_content_format.format(i) for i in range(400, 700)]),
+            expected_content_format.format(700),
+            "".join([expected_content_format.format(i) for i in range(701, 1001)])
+        ]
+        self._confirm_buffer_content(stacked_buffer, len(buffer_sizes), buffer_sizes, expected_content)
+
+        # Zero copy spans must cover the same content as buffer_str
+        for i in range(0, stacked_buffer.size):
+            text, start, end = stacked_buffer.get_buffer(i).span
+            self.assertEqual(text[start:end], expected_content[i])
+
+        # Drain everything, the stack must report empty once the last entry is popped
+        for i in range(0, sum(buffer_sizes)):
+            self.assertFalse(stacked_buffer.is_empty)
+            stacked_buffer.push(None)
+        self._confirm_stack_empty(stacked_buffer)
+
+
+class TestBinaryStackBuffer(BufferTest):
+    def test_triple_stacked_binary_buffer(self):
+        stacked_buffer = StackedBuffers([1, 2, 1], binary=True)
+        self._confirm_stack_empty(stacked_buffer)
+
+        for i in range(1, 6):
+            stacked_buffer.push(b"line: %d\n" % i)
+
+        self._confirm_buffer_content(stacked_buffer, 3, [1, 2, 1],
+                                     [b"line: 2\n", b"line: 3\nline: 4\n", b"line: 5\n"])
+
+        for i in range(0, 4):
+            stacked_buffer.push(b"")
+        self._confirm_stack_empty(stacked_buffer)
+
+
+
+class TestBufferInterface(unittest.TestCase):
+    def test_incomplete_buffer(self):
+        class IncompleteBuffer(BufferABC):
+            @property
+            def is_full(self) -> bool:
+                return False
+
+        with self.assertRaises(TypeError):
+            IncompleteBuffer(1)
 
 if __name__ == "__main__":
     unittest.main()
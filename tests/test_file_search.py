@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+import argparse
+import bz2
+import contextlib
+import glob
+import gzip
+import importlib
+import io
+import lzma
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+
+import utils
+
+append_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(append_path)
+sgrep = importlib.import_module("sgrep")
+from sgrep.FileSearch import *
+
+
+def make_options(**kwargs):
+    options = argparse.Namespace(engine="stream",
+                                 bytes_mode=False,
+                                 encoding=None,
+                                 errors=None,
+                                 leading_lines=0,
+                                 search_ctx_size=1,
+                                 trailing_lines=0,
+                                 context_tags=False,
+                                 grep_pattern="line 6",
+                                 regex=False,
+                                 captured_only=False,
+                                 ignore_case=False,
+                                 stats=False,
+                                 follow=False,
+                                 line_number=False,
+                                 index=False,
+                                 output_format="text",
+                                 group_contexts=False,
+                                 count=False,
+                                 files_with_matches=False,
+                                 max_count=None,
+                                 time_range=None)
+    for k, v in kwargs.items():
+        setattr(options, k, v)
+    return options
+
+
+class TestFileSearch(unittest.TestCase):
+    TEST_DIR = "file_search_dir"
+
+    @classmethod
+    def setUpClass(cls):
+        os.makedirs(os.path.join(cls.TEST_DIR, "sub"))
+        for name in ["b.log", "a.log", os.path.join("sub", "c.log")]:
+            with open(os.path.join(cls.TEST_DIR, name), "w") as fd:
+                fd.write(utils.SAMPLE_CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.TEST_DIR)
+
+    def test_expand_paths(self):
+        expected = [os.path.join(self.TEST_DIR, "a.log"),
+                    os.path.join(self.TEST_DIR, "b.log"),
+                    os.path.join(self.TEST_DIR, "sub", "c.log")]
+        self.assertEqual(expand_paths([self.TEST_DIR], recursive=True), expected)
+        self.assertEqual(expand_paths([os.path.join(self.TEST_DIR, "*.log")], recursive=False), expected[:2])
+
+        with self.assertRaises(Exception, msg="Directories need '--recursive'!"):
+            expand_paths([self.TEST_DIR], recursive=False)
+
+        with self.assertRaises(Exception, msg="Globs must match something!"):
+            expand_paths([os.path.join(self.TEST_DIR, "*.txt")], recursive=False)
+
+    def test_expand_paths_glob_like_file_name(self):
+        path = os.path.join(self.TEST_DIR, "x[1].log")
+        with open(path, "w") as fd:
+            fd.write(utils.SAMPLE_CONTENT)
+        try:
+            self.assertEqual(expand_paths([path], recursive=False), [path])
+            self.assertEqual(expand_paths([glob.escape(path)], recursive=False), [path])
+        finally:
+            os.remove(path)
+
+    def test_parallel_search_is_ordered(self):
+        paths = expand_paths([self.TEST_DIR], recursive=True)
+        options = make_options(trailing_lines=1)
+
+        serial = list(search_files(paths, options, jobs=1))
+        parallel = list(search_files(paths, options, jobs=3))
+        self.assertEqual(serial, parallel)
+
+        for path, output, error in parallel:
+            self.assertIsNone(error)
+            self.assertEqual(output, f"{path}:line 6 - 1\n{path}:line 6\n\n"
+                                     f"{path}:line 6\n{path}:line 3 * 2 + 1\n\n")
+
+    def test_output_not_captured(self):
+        paths = expand_paths([self.TEST_DIR], recursive=True)
+        options = make_options(trailing_lines=1)
+        captured = list(search_files(paths, options, jobs=1))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            results = list(search_files(paths, options, jobs=1, capture=False))
+        self.assertEqual(results, [(path, "", None) for path in paths])
+        self.assertEqual(output.getvalue(), "".join([output for _, output, _ in captured]))
+
+    def test_output_closed(self):
+        class ClosedOutput(io.StringIO):
+            def write(self, text: str) -> int:
+                raise BrokenPipeError()
+
+        paths = expand_paths([self.TEST_DIR], recursive=True)
+        with contextlib.redirect_stdout(ClosedOutput()):
+            with self.assertRaises(BrokenPipeError):
+                list(search_files(paths, make_options(), jobs=1, capture=False))
+
+    def test_count_and_files_with_matches(self):
+        paths = expand_paths([self.TEST_DIR], recursive=True)
+        results = list(search_files(paths, make_options(count=True, leading_lines=3), jobs=1))
+        self.assertEqual([output for _, output, _ in results], [f"{path}:2\n" for path in paths])
+
+        options = make_options(files_with_matches=True)
+        self.assertEqual(search_file(paths[0], options), (f"{paths[0]}\n", None))
+        self.assertEqual(search_file(paths[0], make_options(files_with_matches=True, grep_pattern="missing")),
+                         ("", None))
+
+    def test_errors_are_reported_per_file(self):
+        paths = [os.path.join(self.TEST_DIR, "a.log"), os.path.join(self.TEST_DIR, "missing.log")]
+        results = list(search_files(paths, make_options(), jobs=2))
+        self.assertIsNone(results[0][2])
+        self.assertIsNotNone(results[1][2])
+
+
+class TestFileSplit(unittest.TestCase):
+    TEXT_FILE = "split_sample.txt"
+
+    @classmethod
+    def setUpClass(cls):
+        with open(cls.TEXT_FILE, "w") as fd:
+            for i in range(0, 200):
+                fd.write(utils.SAMPLE_CONTENT + f" {i}\n")
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.TEXT_FILE)
+        if os.path.exists(cls.TEXT_FILE + LineIndex.SUFFIX):
+            os.remove(cls.TEXT_FILE + LineIndex.SUFFIX)
+
+    def test_split_file_on_line_starts(self):
+        with open(self.TEXT_FILE, "rb") as fd:
+            data = fd.read()
+
+        ranges = split_file(self.TEXT_FILE, 7)
+        self.assertEqual(len(ranges), 7)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(data))
+        for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+            self.assertEqual(data[end - 1:end], b"\n")
+
+        # Can't split in more ranges than there are lines
+        self.assertEqual(len(split_file(self.TEXT_FILE, len(data))), data.count(b"\n"))
+
+    def test_split_search_same_as_serial(self):
+        cases = [
+            make_options(leading_lines=2, trailing_lines=3, grep_pattern="line 6"),
+            make_options(leading_lines=1, search_ctx_size=3, trailing_lines=1, grep_pattern=r"\[.*]", regex=True),
+            make_options(search_ctx_size=2, grep_pattern="three 1", context_tags=True),
+            make_options(leading_lines=1, grep_pattern="ctx2", line_number=True, index=True)
+        ]
+        for options in cases:
+            expected, error = search_file(self.TEXT_FILE, options, prefix=False)
+            self.assertIsNone(error)
+            for jobs in [2, 5]:
+                with self.subTest(pattern=options.grep_pattern, jobs=jobs):
+                    results = list(search_file_split(self.TEXT_FILE, options, jobs))
+                    self.assertEqual(len(results), jobs)
+                    self.assertEqual("".join([output for output, _ in results]), expected)
+
+
+class TestCompressedFiles(unittest.TestCase):
+    TEXT_FILE = "compressed_sample.txt"
+    COMPRESSIONS = [[".gz", gzip], [".bz2", bz2], [".xz", lzma]]
+
+    @classmethod
+    def setUpClass(cls):
+        with open(cls.TEXT_FILE, "w") as fd:
+            fd.write(utils.SAMPLE_CONTENT)
+        for ext, module in cls.COMPRESSIONS:
+            with module.open(cls.TEXT_FILE + ext, "wt") as fd:
+                fd.write(utils.SAMPLE_CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.TEXT_FILE)
+        for ext, _ in cls.COMPRESSIONS:
+            os.remove(cls.TEXT_FILE + ext)
+
+    def test_detect_compression(self):
+        self.assertIsNone(detect_compression(self.TEXT_FILE))
+        for ext, module in self.COMPRESSIONS:
+            self.assertIs(detect_compression(self.TEXT_FILE + ext), module)
+
+    def test_same_output_as_uncompressed(self):
+        for engine in ["stream", "block", "mmap"]:
+            for bytes_mode in [False, True]:
+                options = make_options(engine=engine, bytes_mode=bytes_mode, leading_lines=1, trailing_lines=2)
+                expected, error = search_file(self.TEXT_FILE, options, prefix=False)
+                self.assertIsNone(error)
+                for ext, _ in self.COMPRESSIONS:
+                    with self.subTest(engine=engine, bytes_mode=bytes_mode, ext=ext):
+                        self.assertEqual(search_file(self.TEXT_FILE + ext, options, prefix=False), (expected, None))
+
+    def test_compressed_file_not_split(self):
+        with self.assertRaises(Exception, msg="Compressed files can't be split!"):
+            list(search_file_split(self.TEXT_FILE + ".gz", make_options(), 2))
+
+
+
+class TestCommandLine(unittest.TestCase):
+    TEST_DIR = "command_line_dir"
+    TOOL = os.path.join(append_path, "sgrep.py")
+
+    def setUp(self):
+        os.makedirs(self.TEST_DIR)
+        self.addCleanup(shutil.rmtree, self.TEST_DIR)
+
+    def _write(self, name: str, content: str) -> str:
+        path = os.path.join(self.TEST_DIR, name)
+        with open(path, "w", encoding="utf-8") as fd:
+            fd.write(content)
+        return path
+
+    def _run(self, args: []) -> subprocess.CompletedProcess:
+        return subprocess.run([sys.executable, self.TOOL] + args, capture_output=True, text=True, encoding="utf-8")
+
+    def test_glob_like_file_name(self):
+        path = self._write("x[1].log", utils.SAMPLE_CONTENT)
+        expected = self._run(["line 6", os.path.join(self.TEST_DIR, "x*.log")])
+        self.assertIn("line 6", expected.stdout)
+        for args in [["line 6", path], ["--log", path, "line 6"]]:
+            with self.subTest(args=args):
+                completed = self._run(args)
+                self.assertEqual((completed.returncode, completed.stdout), (0, expected.stdout))
+
+        # Only positional paths are globs
+        self.assertEqual(self._run(["--log", os.path.join(self.TEST_DIR, "*.log"), "line 6"]).returncode, 1)
+
+
+    def test_trigram_index_doesnt_change_matches(self):
+        path = self._write("indexed.log", "ERROR é\nINFO a\nERROR x\nerror é\n" * 50)
+        searches = [["-r", "-c", r"(ERROR) (\w+)", path], ["-i", "ERROR É", path], ["-n", "ERROR é", path]]
+        expected = [self._run(args) for args in searches]
+        self.assertEqual(self._run(["index", "--block-size", "64", path]).returncode, 0)
+        self.assertTrue(os.path.exists(path + TrigramIndex.SUFFIX))
+        for args, before in zip(searches, expected):
+            with self.subTest(args=args):
+                self.assertIn("é", before.stdout)
+                completed = self._run(args)
+                self.assertEqual((completed.returncode, completed.stdout), (0, before.stdout))
+
+    def test_compressed_file_not_indexed(self):
+        path = os.path.join(self.TEST_DIR, "indexed.log.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as fd:
+            fd.write("ERROR a\nINFO b\n" * 200)
+        searches = [["--bytes", "--count", "ERROR", path], ["--count", "ERROR", path]]
+        expected = [self._run(args) for args in searches]
+        self.assertTrue(expected[0].stdout.startswith("200\n"))
+
+        completed = self._run(["index", path])
+        self.assertEqual(completed.returncode, 1)
+        self.assertIn("compressed", completed.stdout)
+        self.assertFalse(os.path.exists(path + TrigramIndex.SUFFIX))
+
+        # An index of the raw compressed data, made before they were refused, isn't used either
+        TrigramIndex.build(path, 64).save()
+        for args, before in zip(searches, expected):
+            with self.subTest(args=args):
+                completed = self._run(args)
+                self.assertEqual((completed.returncode, completed.stdout), (0, before.stdout))
+
+    def test_grouped_contexts_not_split(self):
+        path = self._write("split.log", utils.SAMPLE_CONTENT * 20)
+        serial = self._run(["--engine", "mmap", "-g", "-l", "3", "-t", "3", "line", path])
+        self.assertEqual(serial.returncode, 0)
+        completed = self._run(["--split", "4", "-g", "-l", "3", "-t", "3", "line", path])
+        self.assertEqual(completed.returncode, 1)
+        self.assertIn("'-g' can't be used with '--split'", completed.stdout)
+
+if __name__ == "__main__":
+    unittest.main()
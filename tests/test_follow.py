@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import contextlib
+import importlib
+import io
+import os
+import sys
+import threading
+import time
+import unittest
+
+append_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(append_path)
+sgrep = importlib.import_module("sgrep")
+from sgrep.Follow import *
+
+
+class TestFollow(unittest.TestCase):
+    TEXT_FILE = "follow_sample.txt"
+    POLL_INTERVAL = 0.01
+
+    def setUp(self):
+        with open(self.TEXT_FILE, "w") as fd:
+            fd.write("old match\n")
+
+    def tearDown(self):
+        for path in [self.TEXT_FILE, self.TEXT_FILE + ".1"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _start(self, buffer_sizes: [], idle_timeout: float = 60, line_numbers: bool = False, **kwargs):
+        stream = FollowedFile(self.TEXT_FILE, poll_interval=self.POLL_INTERVAL, **kwargs)
+        grepper = FollowSgrep(stream, *buffer_sizes, idle_timeout=idle_timeout)
+        grepper.set_matches_saving(True)
+        grepper.set_line_numbers(line_numbers)
+        grepper.setup("match", regex_flag=False, show_captured_only=False)
+        thread = threading.Thread(target=grepper.run)
+        thread.start()
+        return grepper, stream, thread
+
+    def _append(self, text: str, path: str = TEXT_FILE) -> None:
+        with open(path, "a") as fd:
+            fd.write(text)
+
+    def _wait_for(self, condition) -> None:
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Timed out")
+            time.sleep(self.POLL_INTERVAL)
+
+    def _stop(self, stream, thread) -> None:
+        stream.stop()
+        thread.join()
+        stream.close()
+
+    def test_follow_appended_lines(self):
+        grepper, stream, thread = self._start([1, 1, 1])
+        self._append("a\nmatch 1\nb")
+        time.sleep(5 * self.POLL_INTERVAL)
+        # Still waiting for its trailing context to be complete
+        self.assertEqual(list(grepper.iter_matches()), [])
+        self._append("\nc\n")
+        self._wait_for(lambda: list(grepper.iter_matches()))
+        self._append("match 2\n")
+        self._stop(stream, thread)
+        self.assertEqual(list(grepper.iter_matches()), [["a\n", "match 1\n", "b\n"], ["c\n", "match 2\n", ""]])
+
+    def test_from_start(self):
+        grepper, stream, thread = self._start([0, 1, 0], from_start=True)
+        self._wait_for(lambda: list(grepper.iter_matches()))
+        self._stop(stream, thread)
+        self.assertEqual(list(grepper.iter_matches()), [["", "old match\n", ""]])
+
+    def test_idle_timeout(self):
+        grepper, stream, thread = self._start([1, 1, 2], idle_timeout=0.05)
+        self._append("a\nmatch 1\nb\n")
+        self._wait_for(lambda: list(grepper.iter_matches()))
+        self.assertEqual(list(grepper.iter_matches()), [["a\n", "match 1\n", "b\n"]])
+
+        # Emitted once only, even when the trailing context gets complete
+        self._append("c\nd\n")
+        self._stop(stream, thread)
+        self.assertEqual(list(grepper.iter_matches()), [["a\n", "match 1\n", "b\n"]])
+
+    def test_rotation_and_truncation(self):
+        grepper, stream, thread = self._start([0, 1, 0])
+        self._append("match 1\n")
+        self._wait_for(lambda: len(list(grepper.iter_matches())) == 1)
+
+        os.rename(self.TEXT_FILE, self.TEXT_FILE + ".1")
+        self._append("match 2\n", self.TEXT_FILE + ".1")
+        with open(self.TEXT_FILE, "w") as fd:
+            fd.write("match 3\n")
+        self._wait_for(lambda: stream.rotations == 1)
+        self._wait_for(lambda: len(list(grepper.iter_matches())) == 3)
+
+        with open(self.TEXT_FILE, "w"):
+            pass
+        self._wait_for(lambda: stream.truncations == 1)
+        self._append("match 4\n")
+        self._stop(stream, thread)
+        self.assertEqual([m[1] for m in grepper.iter_matches()], ["match 1\n", "match 2\n", "match 3\n", "match 4\n"])
+
+    def test_line_numbers(self):
+        self._append("a\nb")
+        # Following starts within line 3, which is only read from there
+        grepper, stream, thread = self._start([0, 1, 0], line_numbers=True, count_lines=True)
+        self._append(" match 1\nmatch 2\n")
+        self._wait_for(lambda: len(list(grepper.iter_matches())) == 2)
+
+        # Numbered from the start of the new file
+        os.rename(self.TEXT_FILE, self.TEXT_FILE + ".1")
+        with open(self.TEXT_FILE, "w") as fd:
+            fd.write("c\nmatch 3\n")
+        self._wait_for(lambda: len(list(grepper.iter_matches())) == 3)
+        self._stop(stream, thread)
+        self.assertEqual(list(grepper.iter_matches()), [["", " match 1\n", "", 3], ["", "match 2\n", "", 4],
+                                                        ["", "match 3\n", "", 2]])
+
+    def test_line_numbers_not_counted(self):
+        grepper, stream, thread = self._start([0, 1, 0], line_numbers=True)
+        self._append("a\nmatch 1\n")
+        self._wait_for(lambda: list(grepper.iter_matches()))
+        self._stop(stream, thread)
+        # Relative to where following started
+        self.assertEqual(list(grepper.iter_matches()), [["", "match 1\n", "", 2]])
+
+    def test_grouped_contexts(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            stream = FollowedFile(self.TEXT_FILE, poll_interval=self.POLL_INTERVAL, count_lines=True)
+            grepper = FollowSgrep(stream, 1, 1, 1, idle_timeout=0.05)
+            grepper.set_output_sink(GroupedTextSink())
+            grepper.set_line_numbers(True)
+            grepper.setup("ERR", regex_flag=False, show_captured_only=False)
+            thread = threading.Thread(target=grepper.run)
+            thread.start()
+            # The second match is in the trailing context of the first one
+            self._append("a\nERR 1\nERR 2\nb\n")
+            # Output once the file goes idle
+            self._wait_for(lambda: "5-b" in output.getvalue())
+            self._append("c\nERR 3\n")
+            self._stop(stream, thread)
+        self.assertEqual(output.getvalue(), "2-a\n3:ERR 1\n4:ERR 2\n5-b\n6-c\n7:ERR 3\n")
+
+    def test_bad_init(self):
+        with self.assertRaises(Exception, msg="Poll interval must be positive!"):
+            FollowedFile(self.TEXT_FILE, poll_interval=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
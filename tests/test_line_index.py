@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import importlib
+import os
+import sys
+import time
+import unittest
+
+import utils
+
+append_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(append_path)
+sgrep = importlib.import_module("sgrep")
+from sgrep.LineIndex import *
+
+
+class TestLineIndex(unittest.TestCase):
+    TEXT_FILE = "index_sample.txt"
+
+    def setUp(self):
+        with open(self.TEXT_FILE, "w") as fd:
+            fd.write(utils.SAMPLE_CONTENT)
+
+    def tearDown(self):
+        for path in [self.TEXT_FILE, self.TEXT_FILE + LineIndex.SUFFIX]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _expected_line_starts(self) -> []:
+        with open(self.TEXT_FILE, "rb") as fd:
+            data = fd.read()
+        return [0] + [i + 1 for i in range(len(data)) if data[i:i + 1] == b"\n"]
+
+    def _confirm_index(self, index: LineIndex) -> None:
+        line_starts = self._expected_line_starts()
+        with open(self.TEXT_FILE, "rb") as fd:
+            data = fd.read()
+        self.assertEqual(index.size, len(data))
+        self.assertEqual(index.nb_lines, len(data.splitlines()))
+        for line, start in enumerate(line_starts):
+            self.assertEqual(index.line_start(line), start)
+        for offset in range(len(data)):
+            self.assertEqual(index.line_number(offset), data[:offset].count(b"\n"))
+
+    def test_build_and_load(self):
+        LineIndex.READ_SIZE = 7
+        try:
+            index = LineIndex.for_file(self.TEXT_FILE)
+        finally:
+            LineIndex.READ_SIZE = 1024 * 1024
+        self._confirm_index(index)
+        self.assertTrue(os.path.exists(self.TEXT_FILE + LineIndex.SUFFIX))
+
+        loaded = LineIndex(self.TEXT_FILE)
+        self.assertTrue(loaded.load())
+        self.assertFalse(loaded.update())
+        self._confirm_index(loaded)
+
+    def test_extended_when_grown(self):
+        LineIndex.for_file(self.TEXT_FILE)
+        with open(self.TEXT_FILE, "a") as fd:
+            fd.write(" and more\nfour\nfive\n")
+
+        index = LineIndex(self.TEXT_FILE)
+        self.assertTrue(index.load())
+        indexed_size = index.size
+        self.assertTrue(index.update())
+        self.assertGreater(index.size, indexed_size)
+        self._confirm_index(index)
+
+    def test_rebuilt_when_rewritten(self):
+        LineIndex.for_file(self.TEXT_FILE)
+        # Same size or bigger, but not simply appended to
+        time.sleep(0.01)
+        with open(self.TEXT_FILE, "w") as fd:
+            fd.write("\n".join(reversed(utils.SAMPLE_CONTENT.split("\n"))) + "\nlast\n")
+        self._confirm_index(LineIndex.for_file(self.TEXT_FILE))
+
+        with open(self.TEXT_FILE, "w") as fd:
+            fd.write("short\n")
+        self._confirm_index(LineIndex.for_file(self.TEXT_FILE))
+
+    def test_corrupted_index_is_rebuilt(self):
+        with open(self.TEXT_FILE + LineIndex.SUFFIX, "wb") as fd:
+            fd.write(b"garbage")
+        self._confirm_index(LineIndex.for_file(self.TEXT_FILE))
+
+    def test_split(self):
+        index = LineIndex.for_file(self.TEXT_FILE)
+        ranges = index.split(4)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], index.size)
+        line_counts = [index.line_number(end - 1) - index.line_number(start) + 1 for start, end in ranges]
+        self.assertEqual(line_counts, [3, 3, 3, 3])
+        self.assertEqual(len(index.split(100)), index.nb_lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
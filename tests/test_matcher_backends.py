@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import importlib
+import os
+import re
+import sys
+import unittest
+
+append_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(append_path)
+sgrep = importlib.import_module("sgrep")
+from sgrep.MatcherBackends import *
+
+
+class TestMatcherBackends(unittest.TestCase):
+    def test_selection(self):
+        cases = [
+            [["abc"], False, False, "literal"],
+            [["abc", "de"], False, False, "literals"],
+            [["abc"], False, True, "literal ignore-case"],
+            [["abc", "de"], False, True, "literals ignore-case"],
+            # Nothing to lowercase
+            [["12-34"], False, True, "literal"],
+            [[b"ABC"], False, True, "literal ignore-case"],
+            [[r"a\d+"], True, False, "re"],
+            [[r"a\d+", "b"], True, True, "re"]
+        ]
+        for patterns, regex_flag, ignore_case, name in cases:
+            with self.subTest(patterns=patterns, regex_flag=regex_flag, ignore_case=ignore_case):
+                flags = re.IGNORECASE if ignore_case else 0
+                self.assertEqual(select_backend(patterns, regex_flag, ignore_case, flags).name, name)
+
+    def test_find(self):
+        text = "xx Foo bar FOO\nbaz"
+        cases = [
+            [["Foo"], False, False, [0, len(text), 3]],
+            [["FOO", "bar"], False, False, [4, len(text), 7]],
+            [["foo"], False, True, [0, len(text), 3], [4, len(text), 11], [4, 13, -1]],
+            [["BAZ", "BAR"], False, True, [0, len(text), 7], [8, len(text), 15]],
+            [[r"b\w+"], True, False, [0, len(text), 7], [8, len(text), 15]],
+            # Anchors only see the searched text
+            [[r"^baz"], True, False, [15, len(text), 15], [14, len(text), -1]],
+            [[r"(a)\1", "z$"], True, False, [0, len(text), 17]]
+        ]
+        for patterns, regex_flag, ignore_case, *finds in cases:
+            backend = select_backend(patterns, regex_flag, ignore_case)
+            for start, end, expected in finds:
+                with self.subTest(patterns=patterns, start=start, end=end):
+                    self.assertEqual(backend.find(text, start, end), expected)
+
+    def test_ignore_case_keeps_offsets(self):
+        text = "İSTANBUL istanbul Été"
+        backend = select_backend(["istanbul"], False, True)
+        self.assertEqual(backend.find(text, 0, len(text)), 0)
+        self.assertEqual(backend.find(text, 1, len(text)), 9)
+        self.assertEqual(select_backend(["éTÉ"], False, True).find(text, 0, len(text)), 18)
+
+    def test_ignore_case_final_sigma(self):
+        text = "ΟΔΟΣ οδος"
+        for pattern in ["Σ", "σ", "ς", "ΟΔΟΣ", "οδος"]:
+            backend = select_backend([pattern], False, True)
+            for start in [0, 4]:
+                with self.subTest(pattern=pattern, start=start):
+                    expected = re.compile(re.escape(pattern), re.IGNORECASE).search(text, start).start()
+                    self.assertEqual(backend.find(text, start, len(text)), expected)
+
+    def test_ignore_case_lowercased_once(self):
+        text = ("a" * 100 + "Needle\n") * 2000
+        backend = select_backend(["NEEDLE"], False, True)
+        hits = []
+        pos = 0
+        while True:
+            hit = backend.find(text, pos, len(text))
+            if hit == -1:
+                break
+            hits.append(hit)
+            pos = hit + 1
+        self.assertEqual(hits, [m.start() for m in re.finditer("Needle", text)])
+        # Other texts aren't mixed up with the one kept lowercased
+        self.assertEqual(backend.find(text[:50] + "NEEDLE", 0, 56), 50)
+
+    def test_incomplete_backend(self):
+        class IncompleteBackend(MatcherBackend):
+            NAME = "incomplete"
+
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
+
+    def test_required_literals(self):
+        self.assertEqual(select_backend(["abc"], False).required_literals(), ["abc"])
+        self.assertEqual(select_backend(["abc"], False, True).required_literals(), [])
+        self.assertEqual(select_backend([r"foo\d+bar"], True).required_literals(), ["foo", "bar"])
+
+    @unittest.skipIf(regex is None, "the 'regex' module isn't installed")
+    def test_regex_module(self):
+        backend = select_backend([r"\p{Lu}+"], True)
+        self.assertEqual(backend.name, "regex")
+        self.assertEqual(backend.find("abc DEF", 0, 7), 4)
+        self.assertIsNone(backend.match_starts_regex())
+
+    @unittest.skipIf(regex is not None, "the 'regex' module is installed")
+    def test_no_regex_module(self):
+        with self.assertRaises(re.error):
+            select_backend([r"\p{Lu}+"], True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import importlib
+import os
+import sys
+import unittest
+
+import utils
+
+append_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(append_path)
+sgrep = importlib.import_module("sgrep")
+from sgrep.NewlineIndex import *
+from sgrep.NewlineIndex import _numpy_line_starts, _split_line_starts
+
+
+def forward_lines(text, pos: int, nb_lines: int) -> int:
+    for _ in range(nb_lines):
+        newline = text.find("\n" if isinstance(text, str) else b"\n", pos)
+        if newline == -1:
+            return len(text)
+        pos = newline + 1
+    return pos
+
+
+def back_lines(text, pos: int, nb_lines: int, floor: int) -> int:
+    for _ in range(nb_lines):
+        if pos <= floor:
+            return floor
+        newline = text.rfind("\n" if isinstance(text, str) else b"\n", floor, pos - 1)
+        pos = newline + 1 if newline != -1 else floor
+    return pos
+
+
+class TestNewlineIndex(unittest.TestCase):
+    TEXTS = [utils.SAMPLE_CONTENT, utils.SAMPLE_CONTENT.encode(), "é\n\nà\nb", "no newline", "\n\n", ""]
+
+    def test_same_as_find(self):
+        for text in self.TEXTS:
+            newline = "\n" if isinstance(text, str) else b"\n"
+            line_starts = [0] + [i + 1 for i in range(len(text)) if text[i:i + 1] == newline]
+            for start, end in [(0, len(text)), (len(text) // 3, len(text) // 2), (len(text) // 2, len(text))]:
+                index = NewlineIndex(text, start, end)
+                with self.subTest(text=text[:20], start=start, end=end):
+                    for pos in line_starts:
+                        for nb_lines in [0, 1, 2, 5]:
+                            reached = index.forward_lines(pos, nb_lines)
+                            if reached is not None:
+                                self.assertEqual(reached, forward_lines(text, pos, nb_lines))
+                            for floor in [0, start, pos]:
+                                reached = index.back_lines(pos, nb_lines, min(floor, pos))
+                                if reached is not None:
+                                    self.assertEqual(reached, back_lines(text, pos, nb_lines, min(floor, pos)))
+                        counted = index.count(start, pos)
+                        if counted is not None:
+                            self.assertEqual(counted, text.count(newline, start, pos))
+
+    def test_outside_of_range(self):
+        text = "a\nb\nc\nd\ne\n"
+        index = NewlineIndex(text, 4, 8)
+        self.assertEqual(index.forward_lines(4, 2), 8)
+        self.assertIsNone(index.forward_lines(4, 3))
+        self.assertIsNone(index.forward_lines(2, 1))
+        self.assertEqual(index.back_lines(8, 1, 0), 6)
+        self.assertIsNone(index.back_lines(8, 2, 0))
+        self.assertEqual(index.back_lines(8, 3, 4), 4)
+        self.assertIsNone(index.count(0, 8))
+        self.assertEqual(index.count(4, 8), 2)
+
+        # Nothing follows the end of the text
+        index = NewlineIndex(text, 4, len(text))
+        self.assertEqual(index.forward_lines(6, 10), len(text))
+
+    @unittest.skipIf(numpy is None, "NumPy isn't installed")
+    def test_numpy(self):
+        for text in self.TEXTS + ["\udce9\n\U0001f600\n"]:
+            with self.subTest(text=text[:20]):
+                self.assertEqual(_numpy_line_starts(text, 1, len(text)), _split_line_starts(text, 1, len(text)))
+
+
+if __name__ == '__main__':
+    unittest.main()
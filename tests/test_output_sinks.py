@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import contextlib
+import importlib
+import io
+import json
+import os
+import select
+import subprocess
+import sys
+import unittest
+
+try:
+    import pty
+except ImportError:
+    # Not available on Windows
+    pty = None
+
+import utils
+
+append_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(append_path)
+sgrep = importlib.import_module("sgrep")
+from sgrep.Sgrep import *
+
+
+class TestOutputSinks(unittest.TestCase):
+    TEXT_FILE = "sinks_sample.txt"
+
+    @classmethod
+    def setUpClass(cls):
+        with open(cls.TEXT_FILE, "w") as fd:
+            fd.write(utils.SAMPLE_CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.TEXT_FILE)
+
+    def _grep(self, sink: (None, OutputSink), pattern, leading: int = 1, trailing: int = 1, **kwargs) -> str:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            with open(self.TEXT_FILE, "r") as fd:
+                grepper = Sgrep(fd, leading, 1, trailing)
+                if sink is not None:
+                    grepper.set_output_sink(sink)
+                grepper.set_show_markers(kwargs.get("markers", False))
+                grepper.set_line_numbers(kwargs.get("line_numbers", False))
+                grepper.setup(pattern, kwargs.get("regex", False), False)
+                grepper.run()
+        return output.getvalue()
+
+    def test_text_format(self):
+        self.assertEqual(self._grep(None, "line 6 - 1"), "line 2 + 2 ]\nline 6 - 1\nline 6\n\n")
+        self.assertEqual(self._grep(None, "line 6 - 1", markers=True),
+                         "<lead ctx>\nline 2 + 2 ]\n<search ctx>\nline 6 - 1\n<trailing ctx>\nline 6\n"
+                         "<end grep>\n\n")
+        self.assertEqual(self._grep(None, "ctx1", trailing=2, line_numbers=True), "1:ctx1\n2-ctx2\n3-ctx3\n\n")
+        self.assertEqual(self._grep(None, ["one", "two"], leading=0, trailing=0),
+                         "<patterns: 'one'>\none\n\n<patterns: 'two'>\ntwo\n\n")
+
+    def test_text_format_blank_contexts(self):
+        sink = TextSink()
+        sink.configure(show_markers=False, prefix="", same_line_number=False)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            sink.write_match("\n", "match\n", "\n")
+            sink.write_match("", "match\n", "")
+            sink.flush()
+        self.assertEqual(output.getvalue(), "\nmatch\n\n\nmatch\n\n")
+
+    def test_jsonl_format(self):
+        output = self._grep(JsonLinesSink(file_name=self.TEXT_FILE), "line 6 - 1", line_numbers=True)
+        self.assertEqual([json.loads(line) for line in output.splitlines()],
+                         [{"file": self.TEXT_FILE, "line": 7, "leading": "line 2 + 2 ]\n", "match": "line 6 - 1\n",
+                           "trailing": "line 6\n"}])
+
+        output = self._grep(JsonLinesSink(), ["one", "two"], leading=0, trailing=0)
+        self.assertEqual([json.loads(line) for line in output.splitlines()],
+                         [{"leading": "", "match": "one\n", "trailing": "", "patterns": ["one"]},
+                          {"leading": "", "match": "two\n", "trailing": "", "patterns": ["two"]}])
+
+    def test_nul_format(self):
+        self.assertEqual(self._grep(NulSink(), "line 6", leading=0, trailing=0), "line 6 - 1\n\0line 6\n\0")
+
+    def test_grouped_format(self):
+        self.assertEqual(self._grep(GroupedTextSink(), r"ctx2|line 6|two", regex=True, line_numbers=True),
+                         "1-ctx1\n2:ctx2\n3-ctx3\n--\n6-line 2 + 2 ]\n7:line 6 - 1\n8:line 6\n"
+                         "9-line 3 * 2 + 1\n10-one\n11:two\n12-three\n")
+        self.assertEqual(self._grep(GroupedTextSink(), r"ctx2|two", regex=True),
+                         "ctx1\nctx2\nctx3\n--\none\ntwo\nthree\n")
+        # Lines output as trailing context turning out to be search context of the next match
+        self.assertEqual(self._grep(GroupedTextSink(), "ctx", leading=0, trailing=2, line_numbers=True),
+                         "1:ctx1\n2:ctx2\n3:ctx3\n4-line 2 [\n5-line 3\n")
+
+    def test_grouped_bytes_saved(self):
+        sink = GroupedTextSink()
+        output = self._grep(sink, "line", leading=2, trailing=2)
+        self.assertEqual(sink.written_bytes, len(output.encode()))
+        self.assertEqual(sink.ungrouped_bytes, len(self._grep(None, "line", leading=2, trailing=2).encode()))
+        self.assertLess(sink.written_bytes, sink.ungrouped_bytes)
+        self.assertIn(f"saved: {sink.ungrouped_bytes - sink.written_bytes}", sink.report())
+
+    def test_grouped_line_numbers_not_saved(self):
+        with open(self.TEXT_FILE, "r") as fd:
+            grepper = Sgrep(fd, 0, 1, 0)
+            grepper.set_output_sink(GroupedTextSink())
+            grepper.set_matches_saving(True)
+            grepper.setup("one", False, False)
+            grepper.run()
+        self.assertEqual(list(grepper.iter_matches()), [["", "one\n", ""]])
+
+    def test_buffer_flushed_when_full(self):
+        sink = TextSink(buffer_size=8)
+        sink.configure(show_markers=False, prefix="", same_line_number=False)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            sink.write_match("", "short\n", "")
+            self.assertEqual(output.getvalue(), "")
+            sink.write_match("", "long enough\n", "")
+            self.assertEqual(output.getvalue(), "short\n\nlong enough\n\n")
+
+    def test_incomplete_sink(self):
+        class IncompleteSink(OutputSink):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteSink()
+
+    def test_line_buffered_stdout(self):
+        class LineBufferedOutput(io.StringIO):
+            line_buffering = True
+
+        sink = TextSink()
+        sink.configure(show_markers=False, prefix="", same_line_number=False)
+        output = LineBufferedOutput()
+        with contextlib.redirect_stdout(output):
+            sink.write_match("", "short\n", "")
+            self.assertEqual(output.getvalue(), "short\n\n")
+
+    @unittest.skipIf(pty is None, "needs pseudo terminals")
+    def test_terminal_gets_matches_before_end(self):
+        tool = os.path.join(append_path, "sgrep.py")
+        master, slave = pty.openpty()
+        process = subprocess.Popen([sys.executable, tool, "ERROR"], stdin=subprocess.PIPE, stdout=slave,
+                                   stderr=subprocess.DEVNULL)
+        os.close(slave)
+        try:
+            process.stdin.write(b"INFO a\nERROR b\n")
+            process.stdin.flush()
+            readable, _, _ = select.select([master], [], [], 10)
+            self.assertEqual(readable, [master])
+            self.assertEqual(os.read(master, 1024), b"ERROR b\r\n\r\n")
+        finally:
+            process.stdin.close()
+            process.wait()
+            os.close(master)
+
+    def test_broken_pipe(self):
+        big_file = "sinks_big_sample.txt"
+        with open(big_file, "w") as fd:
+            for i in range(0, 20000):
+                fd.write(utils.SAMPLE_CONTENT + "\n")
+        try:
+            tool = os.path.join(append_path, "sgrep.py")
+            process = subprocess.Popen([sys.executable, tool, "line 6", big_file],
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            process.stdout.readline()
+            process.stdout.close()
+            stderr = process.stderr.read()
+            process.stderr.close()
+            self.assertEqual(process.wait(), 141)
+            self.assertEqual(stderr, b"")
+        finally:
+            os.remove(big_file)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import importlib
+import os
+import re
+import sys
+import unittest
+
+append_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(append_path)
+sgrep = importlib.import_module("sgrep")
+from sgrep.Patterns import *
+
+
+class TestPatterns(unittest.TestCase):
+    def test_literals_regex(self):
+        literals = ["line", "li", "lime", "a.b", "x|y", "ctx"]
+        regex = literals_regex(literals)
+        for text in ["a line", "li", "lim", "a.b", "aab", "x|y", "y", "ctx1", ""]:
+            with self.subTest(text=text):
+                expected = [m.group() for m in re.finditer("|".join(sorted(map(re.escape, literals),
+                                                                           key=len, reverse=True)), text)]
+                self.assertEqual([m.group() for m in regex.finditer(text)], expected)
+
+        regex = literals_regex([b"ab", b"a"])
+        self.assertEqual(regex.search(b"xab").group(), b"ab")
+
+    def test_combine_regexes(self):
+        regex = combine_regexes([r"\d+", r"(?P<w>[a-z]+)"])
+        self.assertEqual(regex.search("AB cd 12").group(), "cd")
+
+        self.assertIsNone(combine_regexes([r"(a)\1", r"b"]))
+        self.assertIsNone(combine_regexes([r"(?P<n>a)", r"(?P<n>b)"]))
+        self.assertIsNone(combine_regexes([r"a", r"(?i)b"]))
+
+    def test_required_literals(self):
+        cases = [
+            [r"foo\d+bar", ["foo", "bar"]],
+            [r"(abc)+x?y", ["abc", "y"]],
+            [r"(?:hello){0,2}world", ["world"]],
+            [r"x(?i:ab)cd", ["x", "cd"]],
+            [r"a|b", []],
+            [r"(?i)abc", []],
+            [rb"ab\ncd", [b"ab\ncd"]]
+        ]
+        for pattern, expected in cases:
+            with self.subTest(pattern=pattern):
+                self.assertEqual(required_literals(re.compile(pattern)), expected)
+        self.assertEqual(required_literals(re.compile("abc", re.IGNORECASE)), [])
+
+    def test_first_line_regex(self):
+        text = "xx\nab\ncd\nab\n"
+        for pattern in [r"b\nc", r"(a)(b)?\n", r"(?i)AB\nCD", r"(?P<x>\w)\n(?P=x)", r"d\n$", r"^c", r"\n"]:
+            regex = re.compile(pattern, re.MULTILINE | re.DOTALL)
+            wrapped = first_line_regex(regex)
+            for start in [0, 3, 6, 9]:
+                with self.subTest(pattern=pattern, start=start):
+                    m = regex.search(text[start:])
+                    expected = m.groups() if m and m.start() < text.index("\n", start) - start else None
+                    m = wrapped.match(text, start, len(text))
+                    self.assertEqual(m.groups() if m else None, expected)
+
+        self.assertIsNotNone(first_line_regex(re.compile(rb"a\nb")))
+        for pattern in [r"\Aab", r"(?<=x)a", r"(?<!x)a", r"(?x) a \n b"]:
+            self.assertIsNone(first_line_regex(re.compile(pattern, re.MULTILINE)), pattern)
+        self.assertIsNone(first_line_regex(re.compile(r"^ab")))
+
+    def test_match_starts_regex(self):
+        self.assertEqual(match_starts_regex(re.compile(r"^a\d+")).flags & re.MULTILINE, re.MULTILINE)
+        for pattern in [r"a\n", r"\ba(?=b)", r"(?<=x)a", r"(a)\1"]:
+            self.assertIsNotNone(match_starts_regex(re.compile(pattern)), pattern)
+        for pattern in [r"a$", r"a\Z", r"\Aa", r"a\B", r"a(?!b)", r"(?<!x)a", r"(?>a+)", r"a++"]:
+            self.assertIsNone(match_starts_regex(re.compile(pattern)), pattern)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+import importlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+import utils
+
+append_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(append_path)
+sgrep = importlib.import_module("sgrep")
+from sgrep.FileCache import *
+from sgrep.Server import *
+
+
+class TestFileCache(unittest.TestCase):
+    TEXT_FILE = "cache_sample.txt"
+
+    def setUp(self):
+        with open(self.TEXT_FILE, "w") as fd:
+            fd.write(utils.SAMPLE_CONTENT)
+
+    def tearDown(self):
+        for path in [self.TEXT_FILE, self.TEXT_FILE + LineIndex.SUFFIX, self.TEXT_FILE + TrigramIndex.SUFFIX]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_line_index_kept_up_to_date(self):
+        cache = FileCache()
+        index = cache.line_index(self.TEXT_FILE)
+        self.assertEqual(index.size, len(utils.SAMPLE_CONTENT))
+        self.assertIs(cache.line_index(os.path.abspath(self.TEXT_FILE)), index)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        with open(self.TEXT_FILE, "a") as fd:
+            fd.write("appended\n")
+        self.assertIs(cache.line_index(self.TEXT_FILE), index)
+        self.assertEqual(index.size, len(utils.SAMPLE_CONTENT) + len("appended\n"))
+        # Saved for the other processes too
+        self.assertEqual(LineIndex.for_file(self.TEXT_FILE).size, index.size)
+
+    def test_trigram_index_reloaded(self):
+        cache = FileCache()
+        self.assertIsNone(cache.trigram_index(self.TEXT_FILE))
+        self.assertIsNone(cache.trigram_index(self.TEXT_FILE))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        TrigramIndex.build(self.TEXT_FILE, 64).save()
+        index = cache.trigram_index(self.TEXT_FILE)
+        self.assertIsNotNone(index)
+        self.assertIs(cache.trigram_index(self.TEXT_FILE), index)
+
+        # The index is outdated once the file changes
+        with open(self.TEXT_FILE, "a") as fd:
+            fd.write("appended\n")
+        self.assertIsNone(cache.trigram_index(self.TEXT_FILE))
+
+    def test_least_recently_used_evicted(self):
+        other_file = "cache_sample_2.txt"
+        with open(other_file, "w") as fd:
+            fd.write(utils.SAMPLE_CONTENT)
+        try:
+            cache = FileCache(size=1)
+            index = cache.line_index(self.TEXT_FILE)
+            cache.line_index(other_file)
+            self.assertEqual(len(cache), 1)
+            self.assertIsNot(cache.line_index(self.TEXT_FILE), index)
+            self.assertEqual(cache.misses, 3)
+        finally:
+            for path in [other_file, other_file + LineIndex.SUFFIX]:
+                os.remove(path)
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmp_dir, "sgrep.sock")
+        self.queries = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _run_query(self, argv: []) -> (None, int):
+        self.queries.append((argv, os.getcwd()))
+        if argv == ["local"]:
+            return None
+        if argv == ["large"]:
+            print("x" * 16 * 1024 * 1024)
+            return 0
+        print("out 1")
+        print("err 1", file=sys.stderr)
+        print("out 2")
+        return len(argv)
+
+    def _start(self, **kwargs) -> QueryServer:
+        server = QueryServer(self.socket_path, self._run_query, **kwargs)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_query(self):
+        self._start()
+        cwd = os.getcwd()
+        frames = list(query(["a", "b"], self.socket_path, self.tmp_dir))
+        self.assertEqual(frames, [{"stdout": "out 1\n"}, {"stderr": "err 1\n"}, {"stdout": "out 2\n"}, {"exit": 2}])
+        self.assertEqual(self.queries, [(["a", "b"], os.path.realpath(self.tmp_dir))])
+        self.assertEqual(os.getcwd(), cwd)
+
+        self.assertEqual(list(query(["local"], self.socket_path)), [{"local": True}])
+        self.assertEqual(self.queries[-1], (["local"], cwd))
+
+    def _confirm_query_runs(self) -> None:
+        thread = threading.Thread(target=lambda: self.assertEqual(list(query(["a"], self.socket_path))[-1],
+                                                                  {"exit": 1}))
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive(), "Held back by another client")
+
+    def test_idle_client(self):
+        self._start(query_timeout=0.1)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socket_path)
+            self._confirm_query_runs()
+            # Disconnected once its query is late
+            sock.settimeout(5)
+            self.assertEqual(sock.recv(1), b"")
+
+    def test_client_not_reading(self):
+        self._start(output_timeout=0.1)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps({"argv": ["large"], "cwd": self.tmp_dir}).encode() + b"\n")
+            self._wait_for(lambda: len(self.queries) == 1)
+            self._confirm_query_runs()
+
+    def _wait_for(self, condition) -> None:
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Timed out")
+            time.sleep(0.01)
+
+    def test_invalid_query(self):
+        self._start()
+        for request in [b"not json\n", b'{"argv": "a", "cwd": "."}\n', b'{"argv": []}\n']:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(self.socket_path)
+                sock.sendall(request)
+                with sock.makefile("rb") as rfile:
+                    frames = [json.loads(line) for line in rfile]
+            self.assertTrue(frames[0]["stderr"].startswith("ERROR: Invalid query"))
+            self.assertEqual(frames[1:], [{"exit": 2}])
+        self.assertEqual(self.queries, [])
+
+    def test_socket_directory(self):
+        env = {k: v for k, v in os.environ.items() if k != "SGREP_SOCKET"}
+        env["XDG_RUNTIME_DIR"] = self.tmp_dir
+        with unittest.mock.patch.dict(os.environ, env, clear=True):
+            self.socket_path = default_socket_path()
+        self.assertEqual(os.path.dirname(os.path.dirname(self.socket_path)), self.tmp_dir)
+
+        self._start()
+        self.assertEqual(os.stat(os.path.dirname(self.socket_path)).st_mode & 0o777, 0o700)
+        self.assertEqual(list(query(["a"], self.socket_path))[-1], {"exit": 1})
+
+    @unittest.skipIf(os.getuid() != 0, "files of another user can't be created")
+    def test_socket_of_another_user(self):
+        self._start()
+        os.chown(self.socket_path, 12345, 12345)
+        with self.assertRaises(PermissionError):
+            list(query(["a"], self.socket_path))
+        self.assertEqual(self.queries, [])
+
+        directory = os.path.join(self.tmp_dir, "other")
+        os.mkdir(directory)
+        os.chown(directory, 12345, 12345)
+        with self.assertRaises(Exception, msg="Socket directories of another user aren't used!"):
+            QueryServer(os.path.join(directory, "sgrep.sock"), self._run_query)
+
+    def test_socket(self):
+        with open(self.socket_path, "w"):
+            pass
+        with self.assertRaises(Exception):
+            QueryServer(self.socket_path, self._run_query)
+        os.remove(self.socket_path)
+
+        # Left over by a server which is gone
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(self.socket_path)
+        server = QueryServer(self.socket_path, self._run_query)
+        try:
+            self.assertEqual(os.stat(self.socket_path).st_mode & 0o077, 0)
+            with self.assertRaises(Exception):
+                QueryServer(self.socket_path, self._run_query)
+        finally:
+            server.server_close()
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+class TestServeCommand(unittest.TestCase):
+    TEXT_FILE = "serve_sample.txt"
+    TOOL = os.path.join(append_path, "sgrep.py")
+    CLIENT = os.path.join(append_path, "sgrepc.py")
+
+    @classmethod
+    def setUpClass(cls):
+        with open(cls.TEXT_FILE, "w") as fd:
+            fd.write(utils.SAMPLE_CONTENT)
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.env = dict(os.environ, SGREP_SOCKET=os.path.join(cls.tmp_dir, "sgrep.sock"))
+        cls.server = subprocess.Popen([sys.executable, cls.TOOL, "serve"], env=cls.env, stdout=subprocess.PIPE,
+                                      text=True)
+        cls.server.stdout.readline()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.wait()
+        cls.server.stdout.close()
+        os.remove(cls.TEXT_FILE)
+        shutil.rmtree(cls.tmp_dir)
+
+    def _run(self, tool: str, args: [], stdin: (None, str) = None) -> subprocess.CompletedProcess:
+        return subprocess.run([sys.executable, tool] + args, env=self.env, input=stdin, capture_output=True, text=True)
+
+    def _confirm_same(self, args: [], stdin: (None, str) = None) -> None:
+        local = self._run(self.TOOL, args, stdin)
+        served = self._run(self.CLIENT, args, stdin)
+        self.assertEqual((served.returncode, served.stdout, served.stderr),
+                         (local.returncode, local.stdout, local.stderr))
+
+    def test_same_as_tool(self):
+        for args in [["line 2", self.TEXT_FILE],
+                     ["-r", "-l", "1", "-t", "2", "-n", r"line \d+", self.TEXT_FILE],
+                     ["--engine", "mmap", "--count", "-e", "ctx", "-e", "line", self.TEXT_FILE, self.TEXT_FILE],
+                     ["--output-format", "jsonl", "-g", "line", self.TEXT_FILE],
+                     ["line", "missing.txt"],
+                     ["-r", "(", self.TEXT_FILE],
+                     ["--unknown", "line", self.TEXT_FILE]]:
+            self._confirm_same(args)
+
+    def test_stdin_searched_by_client(self):
+        self._confirm_same(["line 2"], stdin=utils.SAMPLE_CONTENT)
+
+    def test_no_server(self):
+        env = dict(self.env, SGREP_SOCKET=os.path.join(self.tmp_dir, "none.sock"))
+        completed = subprocess.run([sys.executable, self.CLIENT, "line 2", self.TEXT_FILE], env=env,
+                                   capture_output=True, text=True)
+        self.assertEqual(completed.stdout, self._run(self.TOOL, ["line 2", self.TEXT_FILE]).stdout)
+
+    def test_stop(self):
+        server = subprocess.Popen([sys.executable, self.TOOL, "serve", "--socket",
+                                   os.path.join(self.tmp_dir, "stop.sock")], stdout=subprocess.PIPE, text=True)
+        with server.stdout:
+            server.stdout.readline()
+            self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, "stop.sock")))
+            server.terminate()
+            self.assertEqual(server.wait(5), 0)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, "stop.sock")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,9 +4,12 @@ Author: mcomeau
 Date: 2023/02/12
 """
 
+import contextlib
 import importlib
+import io
 import os
 import sys
+import tracemalloc
 import unittest
 
 import utils
@@ -118,6 +121,18 @@ class TestParser(unittest.TestCase):
 
             self.assertEqual(repr(matched), repr(expected_matches))
 
+    def test_multiline_match_starts_on_first_line(self):
+        for engine in [Sgrep, BlockSgrep]:
+            with self.subTest(engine=engine.__name__):
+                with open(self.TEXT_FILE, "r") as fd:
+                    grepper = engine(fd, 0, 3, 0)
+                    grepper.set_show_markers(False)
+                    grepper.set_matches_saving(True)
+                    # Windows starting on 'ctx1' and 'ctx2' hold a match, starting on a later line
+                    grepper.setup(r"(ctx\d)\n(line) 2", regex_flag=True, show_captured_only=True)
+                    grepper.run()
+                    self.assertEqual(list(grepper.iter_matches()), [['', 'ctx3 line', '']])
+
     def test_single_1_liner_buffer_grep(self):
         self.one_liner_buffer_search(nb_buffers=1, regex=False)
 
@@ -143,5 +158,424 @@ class TestParser(unittest.TestCase):
         self.three_liner_buffer_search(nb_buffers=3, regex=True)
 
 
+class TestBlockParser(unittest.TestCase):
+    TEXT_FILE = "sample.txt"
+
+    @classmethod
+    def setUpClass(cls):
+        with open(cls.TEXT_FILE, "w") as fd:
+            fd.write(utils.SAMPLE_CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.TEXT_FILE)
+
+    def _matches(self, engine, buffer_sizes: [], search: str, regex: bool, captured: bool, **kwargs):
+        with open(self.TEXT_FILE, "r") as fd:
+            grepper = engine(fd, *buffer_sizes, **kwargs)
+            grepper.set_show_markers(False)
+            grepper.set_matches_saving(True)
+            grepper.setup(search, regex_flag=regex, show_captured_only=captured)
+            grepper.run()
+            return list(grepper.iter_matches())
+
+    def test_same_matches_as_stream(self):
+        searches = [
+            ["line 6", False, False],
+            ["ctx", False, False],
+            ["one\ntwo\nthree", False, False],
+            ["3\nline", False, False],
+            [r"\[.*]", True, False],
+            [r"(ctx\d\n)(ctx\d\n)", True, True],
+            [r"^line \d$", True, False],
+            [r"[a-z]+ \d\n", True, False],
+            [r"(\d)\n.*(line)", True, True],
+            [r"(?<=\n)line 3", True, False],
+            [r"(?i)LINE \d \+ .*\n.*\n", True, False]
+        ]
+        buffer_cases = [
+            [0, 1, 0],
+            [1, 1, 1],
+            [3, 3, 3],
+            [0, 2, 0],
+            [2, 20, 0],
+            [0, 20, 1]
+        ]
+        for block_size in [1, 5, BlockSgrep.DEFAULT_BLOCK_SIZE]:
+            for buffer_sizes in buffer_cases:
+                for search, regex, captured in searches:
+                    with self.subTest(block_size=block_size, buffer_sizes=buffer_sizes, search=search):
+                        expected = self._matches(Sgrep, buffer_sizes, search, regex, captured)
+                        got = self._matches(BlockSgrep, buffer_sizes, search, regex, captured, block_size=block_size)
+                        self.assertEqual(repr(got), repr(expected))
+
+    def test_ignore_case(self):
+        searches = [
+            ["LINE 6", "line 6", False],
+            ["One\nTWO", "one\ntwo", False],
+            [["CTX2", "Line 3"], ["ctx2", "line 3"], False],
+            [r"LINE \d", r"line \d", True]
+        ]
+        for buffer_sizes in [[0, 1, 0], [1, 2, 1]]:
+            for search, lowercased, regex in searches:
+                with self.subTest(buffer_sizes=buffer_sizes, search=search):
+                    with open(self.TEXT_FILE, "r") as fd:
+                        grepper = Sgrep(fd, *buffer_sizes)
+                        grepper.set_matches_saving(True)
+                        grepper.setup(search, regex_flag=regex, show_captured_only=False, ignore_case=True)
+                        grepper.run()
+                    expected = self._matches(Sgrep, buffer_sizes, lowercased, regex, False)
+                    if isinstance(search, list):
+                        for match in expected:
+                            match[3] = [search[lowercased.index(p)] for p in match[3]]
+                    self.assertEqual(list(grepper.iter_matches()), expected)
+
+                    for engine, kwargs in [[BlockSgrep, {"block_size": 5}], [MmapSgrep, {}]]:
+                        with open(self.TEXT_FILE, "rb" if engine is MmapSgrep else "r") as fd:
+                            grepper = engine(fd, *buffer_sizes, **kwargs)
+                            grepper.set_matches_saving(True)
+                            grepper.setup(search, regex_flag=regex, show_captured_only=False, ignore_case=True)
+                            grepper.run()
+                        self.assertEqual(list(grepper.iter_matches()), expected)
+
+    def test_empty_stream(self):
+        with open(self.TEXT_FILE + ".empty", "w"):
+            pass
+        try:
+            for engine in [Sgrep, BlockSgrep]:
+                with open(self.TEXT_FILE + ".empty", "r") as fd:
+                    grepper = engine(fd, 1, 1, 1)
+                    grepper.set_matches_saving(True)
+                    grepper.setup("x*", regex_flag=True, show_captured_only=False)
+                    grepper.run()
+                    self.assertEqual(list(grepper.iter_matches()), [['', '', '']])
+        finally:
+            os.remove(self.TEXT_FILE + ".empty")
+
+    def test_mmap_same_matches_as_stream(self):
+        buffer_cases = [
+            [0, 1, 0],
+            [3, 3, 3],
+            [2, 20, 0]
+        ]
+        for buffer_sizes in buffer_cases:
+            for search, regex, captured in [["line 6", False, False],
+                                            [r"\[.*]", True, False],
+                                            [r"(ctx2)", True, True]]:
+                with self.subTest(buffer_sizes=buffer_sizes, search=search):
+                    expected = self._matches(Sgrep, buffer_sizes, search, regex, captured)
+                    with open(self.TEXT_FILE, "rb") as fd:
+                        grepper = MmapSgrep(fd, *buffer_sizes)
+                        grepper.set_show_markers(False)
+                        grepper.set_matches_saving(True)
+                        grepper.setup(search, regex_flag=regex, show_captured_only=captured)
+                        grepper.run()
+                    self.assertEqual(repr(list(grepper.iter_matches())), repr(expected))
+
+    def test_mmap_undecodable_bytes(self):
+        with open(self.TEXT_FILE + ".bin", "wb") as fd:
+            fd.write(b"\xff\xfe bad\nmatch \xe9t\xe9\n\x00\x01\n")
+        try:
+            with open(self.TEXT_FILE + ".bin", "rb") as fd:
+                grepper = MmapSgrep(fd, 1, 1, 1)
+                grepper.set_matches_saving(True)
+                grepper.setup("match", regex_flag=False, show_captured_only=False)
+                grepper.run()
+            self.assertEqual(list(grepper.iter_matches()),
+                             [["\ufffd\ufffd bad\n", "match \ufffdt\ufffd\n", "\x00\x01\n"]])
+        finally:
+            os.remove(self.TEXT_FILE + ".bin")
+
+    def test_bytes_mode_same_matches_as_text(self):
+        for engine in [Sgrep, BlockSgrep]:
+            for buffer_sizes in [[0, 1, 0], [3, 3, 3]]:
+                for search, regex, captured in [["line 6", False, False],
+                                                [r"\[.*]", True, False],
+                                                [r"(ctx2)", True, True]]:
+                    with self.subTest(engine=engine, buffer_sizes=buffer_sizes, search=search):
+                        expected = self._matches(Sgrep, buffer_sizes, search, regex, captured)
+                        with open(self.TEXT_FILE, "rb") as fd:
+                            grepper = engine(fd, *buffer_sizes, encoding="utf-8")
+                            grepper.set_show_markers(False)
+                            grepper.set_matches_saving(True)
+                            grepper.setup(search, regex_flag=regex, show_captured_only=captured)
+                            grepper.run()
+                        self.assertEqual(repr(list(grepper.iter_matches())), repr(expected))
+
+    def test_bytes_mode_undecodable_bytes(self):
+        with open(self.TEXT_FILE + ".bin", "wb") as fd:
+            fd.write(b"\xff\xfe bad\nmatch \xe9t\xe9\n\x00\x01\n")
+        try:
+            for engine in [Sgrep, BlockSgrep]:
+                with open(self.TEXT_FILE + ".bin", "rb") as fd:
+                    grepper = engine(fd, 1, 1, 1, encoding="utf-8", errors="backslashreplace")
+                    grepper.set_matches_saving(True)
+                    grepper.setup("match", regex_flag=False, show_captured_only=False)
+                    grepper.run()
+                self.assertEqual(list(grepper.iter_matches()),
+                                 [["\\xff\\xfe bad\n", "match \\xe9t\\xe9\n", "\x00\x01\n"]])
+        finally:
+            os.remove(self.TEXT_FILE + ".bin")
+
+    def test_stats(self):
+        for engine, checked in [[Sgrep, 12], [BlockSgrep, 6]]:
+            with self.subTest(engine=engine):
+                with open(self.TEXT_FILE, "r") as fd:
+                    grepper = engine(fd, 0, 1, 0)
+                    stats = grepper.enable_stats()
+                    grepper.set_matches_saving(True)
+                    grepper.setup(r"line \d$", regex_flag=True, show_captured_only=False)
+                    grepper.run()
+                self.assertEqual(len(list(grepper.iter_matches())), 2)
+                self.assertEqual(stats.windows, 12)
+                self.assertEqual(stats.checked, checked)
+                self.assertEqual(stats.matches, 2)
+                # Only the 6 lines holding 'line ' go through the regex
+                self.assertAlmostEqual(stats.skip_ratio, 0.5)
+
+                self.assertEqual(stats.lines_read, 12)
+                self.assertEqual(stats.bytes_read, len(utils.SAMPLE_CONTENT))
+                self.assertEqual(stats.ticks > 0, engine is Sgrep)
+                self.assertGreater(stats.total_time, 0.0)
+                phases = stats.phase_times
+                self.assertTrue(all([t >= 0.0 for t in phases.values()]))
+                self.assertLessEqual(sum(phases.values()), stats.total_time * 1.01)
+                self.assertIn("matches: 2", stats.report())
+
+    def test_hooks(self):
+        class RecordingHooks(SearchHooks):
+            def __init__(self):
+                self.calls = []
+
+            def on_matcher_call(self, text, start: int, end: int, match_str, seconds: float) -> None:
+                self.calls.append([text[start:end], match_str])
+
+            def on_output(self, seconds: float) -> None:
+                self.calls.append("output")
+
+        for engine in [Sgrep, BlockSgrep]:
+            with self.subTest(engine=engine):
+                with open(self.TEXT_FILE, "r") as fd:
+                    grepper = engine(fd, 0, 1, 0)
+                    hooks = RecordingHooks()
+                    grepper.set_hooks(hooks)
+                    grepper.set_matches_saving(True)
+                    grepper.setup("three", regex_flag=False, show_captured_only=False)
+                    grepper.run()
+                self.assertEqual(hooks.calls[-2:], [["three", "three"], "output"])
+
+    def test_line_numbers(self):
+        expected = [['line 2 + 2 ]\n', 'line 6 - 1\n', 'line 6\n', 7], ['line 6 - 1\n', 'line 6\n', 'line 3 * 2 + 1\n', 8]]
+        for engine in [Sgrep, BlockSgrep, MmapSgrep]:
+            with self.subTest(engine=engine):
+                with open(self.TEXT_FILE, "rb" if engine is MmapSgrep else "r") as fd:
+                    grepper = engine(fd, 1, 1, 1)
+                    grepper.set_line_numbers(True)
+                    grepper.set_matches_saving(True)
+                    grepper.setup("line 6", regex_flag=False, show_captured_only=False)
+                    grepper.run()
+                self.assertEqual(list(grepper.iter_matches()), expected)
+
+        output = io.StringIO()
+        with open(self.TEXT_FILE, "r") as fd, contextlib.redirect_stdout(output):
+            grepper = Sgrep(fd, 2, 2, 1)
+            grepper.set_show_markers(False)
+            grepper.set_line_numbers(True)
+            grepper.setup("ctx3", regex_flag=False, show_captured_only=False)
+            grepper.run()
+        self.assertEqual(output.getvalue(), "1-ctx1\n2-ctx2\n3:ctx3\n4:line 2 [\n5-line 3\n\n")
+
+    def test_blank_contexts(self):
+        for line_numbers, expected in [[False, "\nmatch\n\n\n"], [True, "1-\n2:match\n3-\n\n"]]:
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                grepper = Sgrep(io.StringIO("\nmatch\n\n"), 1, 1, 1)
+                grepper.set_show_markers(False)
+                grepper.set_line_numbers(line_numbers)
+                grepper.setup("match", regex_flag=False, show_captured_only=False)
+                grepper.run()
+            self.assertEqual(output.getvalue(), expected)
+
+    def test_count_and_max_count(self):
+        searches = [
+            ["line", False, 1],
+            ["ctx2\nctx3", False, 2],
+            [r"line \d$", True, 1],
+            [["one", "line 6"], False, 1]
+        ]
+        for engine, mode in [[Sgrep, "r"], [BlockSgrep, "r"], [MmapSgrep, "rb"]]:
+            for search, regex, search_ctx_size in searches:
+                expected = self._matches(Sgrep, [1, search_ctx_size, 2], search, regex, False)
+                for max_count in [None, 0, 2]:
+                    with self.subTest(engine=engine.__name__, search=search, max_count=max_count):
+                        expected_count = len(expected) if max_count is None else min(len(expected), max_count)
+                        with open(self.TEXT_FILE, mode) as fd:
+                            grepper = engine(fd, 1, search_ctx_size, 2)
+                            grepper.set_max_count(max_count)
+                            grepper.setup(search, regex_flag=regex, show_captured_only=False)
+                            self.assertEqual(grepper.count(), expected_count)
+
+                        with open(self.TEXT_FILE, mode) as fd:
+                            grepper = engine(fd, 1, search_ctx_size, 2)
+                            grepper.set_matches_saving(True)
+                            grepper.set_max_count(max_count)
+                            grepper.setup(search, regex_flag=regex, show_captured_only=False)
+                            grepper.run()
+                            self.assertEqual(list(grepper.iter_matches()), expected[:expected_count])
+
+    def test_indexed_newlines(self):
+        # Newlines indexed as soon as lines are moved over
+        line_move_bytes = NewlineIndex.LINE_MOVE_BYTES
+        NewlineIndex.LINE_MOVE_BYTES = len(utils.SAMPLE_CONTENT)
+        try:
+            for buffer_sizes in [[3, 1, 3], [2, 3, 0], [5, 1, 5]]:
+                for search, regex in [["line", False], ["ctx", False], [r"\d\n.*", True]]:
+                    expected = None
+                    for engine, kwargs in [[Sgrep, {}], [BlockSgrep, {"block_size": 64}], [MmapSgrep, {}]]:
+                        with self.subTest(engine=engine, buffer_sizes=buffer_sizes, search=search):
+                            with open(self.TEXT_FILE, "rb" if engine is MmapSgrep else "r") as fd:
+                                grepper = engine(fd, *buffer_sizes, **kwargs)
+                                grepper.set_matches_saving(True)
+                                grepper.set_line_numbers(True)
+                                grepper.setup(search, regex_flag=regex, show_captured_only=False)
+                                grepper.run()
+                            expected = expected or list(grepper.iter_matches())
+                            self.assertEqual(list(grepper.iter_matches()), expected)
+        finally:
+            NewlineIndex.LINE_MOVE_BYTES = line_move_bytes
+
+    def test_bad_block_size(self):
+        with open(self.TEXT_FILE, "r") as fd:
+            with self.assertRaises(Exception, msg="Block size must be positive!"):
+                BlockSgrep(fd, 0, 1, 0, block_size=0)
+
+
+class TestMultiPatterns(unittest.TestCase):
+    TEXT_FILE = "sample.txt"
+
+    @classmethod
+    def setUpClass(cls):
+        with open(cls.TEXT_FILE, "w") as fd:
+            fd.write(utils.SAMPLE_CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.TEXT_FILE)
+
+    def _matches(self, engine, buffer_sizes: [], search, regex: bool, **kwargs):
+        with open(self.TEXT_FILE, "rb" if kwargs else "r") as fd:
+            grepper = engine(fd, *buffer_sizes, **kwargs)
+            grepper.set_matches_saving(True)
+            grepper.setup(search, regex_flag=regex, show_captured_only=False)
+            grepper.run()
+            return list(grepper.iter_matches())
+
+    def test_matches_are_tagged(self):
+        expected = [
+            ['ctx1\n', 'ctx2\n', 'ctx3\n', ['ctx2']],
+            ['line 2 + 2 ]\n', 'line 6 - 1\n', 'line 6\n', ['line 6', 'line 6 -']],
+            ['line 6 - 1\n', 'line 6\n', 'line 3 * 2 + 1\n', ['line 6']]
+        ]
+        for engine in [Sgrep, BlockSgrep]:
+            with self.subTest(engine=engine):
+                self.assertEqual(self._matches(engine, [1, 1, 1], ["line 6", "ctx2", "line 6 -"], False), expected)
+
+    def test_union_of_single_pattern_matches(self):
+        searches = [
+            [["line", "li", "ne 3", "ctx"], False],
+            [["one\ntwo", "6\nline 3"], False],
+            [[r"\d \+", r"c(t)x[13]", r"^t\w+$"], True],
+            [[r"(a)\1", r"line 6$"], True],
+            [[r"(?i)LINE 2", r"two"], True]
+        ]
+        for search, regex in searches:
+            for engine in [Sgrep, BlockSgrep]:
+                for buffer_sizes in [[0, 1, 0], [1, 2, 1]]:
+                    with self.subTest(engine=engine, buffer_sizes=buffer_sizes, search=search):
+                        singles = {}
+                        for pattern in search:
+                            for match in self._matches(Sgrep, buffer_sizes, pattern, regex):
+                                singles.setdefault(tuple(match), []).append(pattern)
+                        got = self._matches(engine, buffer_sizes, search, regex)
+                        self.assertEqual(sorted([tuple(m[:3]) for m in got]), sorted(singles.keys()))
+                        for match in got:
+                            self.assertEqual(sorted(match[3]), sorted(singles[tuple(match[:3])]))
+
+    def test_bytes_mode_tags(self):
+        got = self._matches(BlockSgrep, [0, 1, 0], ["ctx1", "ctx3"], False, encoding="utf-8")
+        self.assertEqual(got, [['', 'ctx1\n', '', ['ctx1']], ['', 'ctx3\n', '', ['ctx3']]])
+
+    def test_bad_patterns(self):
+        with open(self.TEXT_FILE, "r") as fd:
+            grepper = Sgrep(fd, 0, 1, 0)
+            with self.assertRaises(Exception, msg="Captured only needs a single pattern!"):
+                grepper.setup([r"(a)", r"(b)"], regex_flag=True, show_captured_only=True)
+            with self.assertRaises(Exception, msg="Patterns can't be empty!"):
+                grepper.setup(["a", ""], regex_flag=False, show_captured_only=False)
+
+
+class TestMatchIterator(unittest.TestCase):
+    TEXT_FILE = "iterator_sample.txt"
+
+    @classmethod
+    def setUpClass(cls):
+        with open(cls.TEXT_FILE, "w") as fd:
+            fd.write(utils.SAMPLE_CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.TEXT_FILE)
+
+    def test_same_matches_as_saved(self):
+        engines = [[Sgrep, "r", {}], [BlockSgrep, "r", {"block_size": 5}], [MmapSgrep, "rb", {}]]
+        for engine, mode, kwargs in engines:
+            for search in ["line 6", ["ctx1", "one"]]:
+                with self.subTest(engine=engine.__name__, search=search):
+                    with open(self.TEXT_FILE, mode) as fd:
+                        grepper = engine(fd, 1, 1, 1, **kwargs)
+                        grepper.set_matches_saving(True)
+                        grepper.set_line_numbers(True)
+                        grepper.setup(search, regex_flag=False, show_captured_only=False)
+                        grepper.run()
+                        expected = list(grepper.iter_matches())
+
+                    with open(self.TEXT_FILE, mode) as fd:
+                        grepper = engine(fd, 1, 1, 1, **kwargs)
+                        grepper.set_line_numbers(True)
+                        grepper.setup(search, regex_flag=False, show_captured_only=False)
+                        matches = [[m.leading, m.match, m.trailing] +
+                                   ([m.patterns] if m.patterns is not None else []) + [m.line_number]
+                                   for m in grepper.matches()]
+                    self.assertEqual(matches, expected)
+
+    def _peak_memory(self, engine, nb_lines: int, saving: bool, **kwargs) -> int:
+        stream = io.StringIO("".join([f"match {i} with some context\n" for i in range(nb_lines)]))
+        grepper = engine(stream, 2, 1, 2, **kwargs)
+        grepper.setup("match", regex_flag=False, show_captured_only=False)
+        tracemalloc.start()
+        try:
+            if saving:
+                grepper.set_matches_saving(True)
+                grepper.run()
+                nb_matches = sum(1 for _ in grepper.iter_matches())
+            else:
+                nb_matches = sum(1 for _ in grepper.matches())
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(nb_matches, nb_lines)
+        return peak
+
+    def test_constant_memory(self):
+        # Blocks smaller than the text, their matches are held until the block is searched
+        for engine, kwargs in [[Sgrep, {}], [BlockSgrep, {"block_size": 16 * 1024}]]:
+            with self.subTest(engine=engine.__name__):
+                # Growing with the number of matches when saving them, not when iterating
+                self.assertGreater(self._peak_memory(engine, 20000, saving=True, **kwargs),
+                                   2 * self._peak_memory(engine, 5000, saving=True, **kwargs))
+                self.assertLess(self._peak_memory(engine, 20000, saving=False, **kwargs),
+                                1.5 * self._peak_memory(engine, 5000, saving=False, **kwargs))
+
+
 if __name__ == "__main__":
     unittest.main()
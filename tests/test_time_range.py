@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import datetime
+import importlib
+import os
+import sys
+import unittest
+
+append_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(append_path)
+sgrep = importlib.import_module("sgrep")
+from sgrep.FileSearch import *
+from test_file_search import make_options
+
+
+class TestTimeRange(unittest.TestCase):
+    TEXT_FILE = "time_range_sample.txt"
+    START = datetime.datetime(2023, 2, 12, 10, 0, 0)
+
+    @classmethod
+    def setUpClass(cls):
+        # A line every 10 seconds, a stack trace after every 7th line and repeated timestamps
+        cls.lines = []
+        for i in range(300):
+            when = cls.START + datetime.timedelta(seconds=10 * (i // 2))
+            cls.lines.append((when, f"{when.isoformat(sep=' ')} INFO event {i}\n"))
+            if i % 7 == 0:
+                cls.lines.append((when, f"  at frame {i}\n"))
+        with open(cls.TEXT_FILE, "w") as fd:
+            fd.write("preamble without timestamp\n")
+            fd.write("".join([line for _, line in cls.lines]))
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.TEXT_FILE)
+
+    def _expected_range(self, since, until) -> (int, int):
+        start = end = len("preamble without timestamp\n")
+        for when, line in self.lines:
+            if since is not None and when < since:
+                start += len(line)
+            if until is None or when <= until:
+                end += len(line)
+        return (0 if since is None else start), max(start, end)
+
+    def test_byte_range(self):
+        with open(self.TEXT_FILE, "rb") as fd:
+            size = len(fd.read())
+            for since, until in [(None, None), (0, None), (None, 0), (125, 650), (650, 125), (-10, 10000),
+                                 (10000, None), (None, -10), (1495, 1495), (1496, 1499)]:
+                since = None if since is None else self.START + datetime.timedelta(seconds=since)
+                until = None if until is None else self.START + datetime.timedelta(seconds=until)
+                time_range = TimeRange(since and since.isoformat(), until and until.isoformat())
+                with self.subTest(since=since, until=until):
+                    start, end = time_range.byte_range(fd)
+                    self.assertEqual((start, end), self._expected_range(since, until))
+                    self.assertLessEqual(end, size)
+
+    def test_timestamp_format(self):
+        time_range = TimeRange("12/Feb/2023:10:00:05", None, timestamp_regex=r"\[([^]]+)\]",
+                               timestamp_format="%d/%b/%Y:%H:%M:%S")
+        self.assertEqual(time_range.timestamp(b"host - [12/Feb/2023:10:00:01] GET /"),
+                         datetime.datetime(2023, 2, 12, 10, 0, 1))
+        self.assertIsNone(time_range.timestamp(b"host - [not a time] GET /"))
+        self.assertIsNone(time_range.timestamp(b"no timestamp"))
+        # Bounds can also be given as ISO 8601
+        TimeRange("2023-02-12 10:00", None, timestamp_format="%d/%b/%Y:%H:%M:%S")
+
+        with self.assertRaises(Exception, msg="Invalid time!"):
+            TimeRange("yesterday", None)
+        with self.assertRaises(Exception, msg="Invalid timestamp regex!"):
+            TimeRange(None, "2023-02-12", timestamp_regex="[")
+
+    def test_search_window(self):
+        # Matches in the window only, with leading and trailing context read across its bounds
+        options = make_options(leading_lines=2, trailing_lines=1, grep_pattern="event (9|10|17|18)$", regex=True,
+                               time_range=TimeRange("2023-02-12 10:00:50", "2023-02-12 10:01:25"))
+        output, error = search_file(self.TEXT_FILE, options, prefix=False)
+        self.assertIsNone(error)
+        self.assertEqual(output,
+                         "2023-02-12 10:00:40 INFO event 8\n2023-02-12 10:00:40 INFO event 9\n"
+                         "2023-02-12 10:00:50 INFO event 10\n2023-02-12 10:00:50 INFO event 11\n\n"
+                         "2023-02-12 10:01:10 INFO event 15\n2023-02-12 10:01:20 INFO event 16\n"
+                         "2023-02-12 10:01:20 INFO event 17\n2023-02-12 10:01:30 INFO event 18\n\n")
+
+    def test_search_same_as_filtered(self):
+        time_range = TimeRange("2023-02-12 10:03:00", "2023-02-12 10:09:00")
+        start, end = self._expected_range(self.START + datetime.timedelta(seconds=180),
+                                          self.START + datetime.timedelta(seconds=540))
+        for options in [make_options(grep_pattern="frame", line_number=True),
+                        make_options(grep_pattern="event", count=True),
+                        make_options(leading_lines=1, trailing_lines=1, search_ctx_size=2,
+                                     grep_pattern=r"event \d+\n  at", regex=True)]:
+            expected, error = search_file(self.TEXT_FILE, make_options(**dict(vars(options), engine="mmap")),
+                                          file_range=(start, end), prefix=False)
+            self.assertIsNone(error)
+            options.time_range = time_range
+            with self.subTest(pattern=options.grep_pattern):
+                self.assertEqual(search_file(self.TEXT_FILE, options, prefix=False), (expected, None))
+                results = list(search_file_split(self.TEXT_FILE, options, 3))
+                self.assertEqual(len(results), 3)
+                if options.count:
+                    self.assertEqual(sum([int(output) for output, _ in results]), int(expected))
+                else:
+                    self.assertEqual("".join([output for output, _ in results]), expected)
+
+    def test_needs_regular_file(self):
+        options = make_options(time_range=TimeRange("2023-02-12", None))
+        output, error = search_file(None, options, prefix=False)
+        self.assertIn("uncompressed regular file", error)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import importlib
+import os
+import sys
+import unittest
+
+append_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(append_path)
+sgrep = importlib.import_module("sgrep")
+from sgrep.Sgrep import *
+
+
+class TestTrigramIndex(unittest.TestCase):
+    TEXT_FILE = "trigram_sample.txt"
+    BLOCK_SIZE = 64
+
+    @classmethod
+    def setUpClass(cls):
+        with open(cls.TEXT_FILE, "w") as fd:
+            for i in range(0, 100):
+                fd.write(f"line {i} common text\n")
+                if i in (10, 55):
+                    fd.write(f"rare event {i}\nnext line\n")
+
+    @classmethod
+    def tearDownClass(cls):
+        for path in [cls.TEXT_FILE, cls.TEXT_FILE + TrigramIndex.SUFFIX]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _matches(self, search, regex: bool, buffer_sizes: [], trigram_index=None):
+        with open(self.TEXT_FILE, "rb") as fd:
+            grepper = MmapSgrep(fd, *buffer_sizes)
+            if trigram_index is not None:
+                grepper.set_trigram_index(trigram_index)
+            stats = grepper.enable_stats()
+            grepper.set_matches_saving(True)
+            grepper.setup(search, regex_flag=regex, show_captured_only=False)
+            grepper.run()
+        return list(grepper.iter_matches()), stats
+
+    def test_blocks(self):
+        index = TrigramIndex.build(self.TEXT_FILE, self.BLOCK_SIZE, jobs=2)
+        with open(self.TEXT_FILE, "rb") as fd:
+            data = fd.read()
+        self.assertEqual(index.block_range(0)[0], 0)
+        self.assertEqual(index.block_range(index.nb_blocks - 1)[1], len(data))
+        for block in range(index.nb_blocks):
+            start, end = index.block_range(block)
+            self.assertEqual(data[end - 1:end], b"\n")
+            self.assertGreaterEqual(end - start, min(self.BLOCK_SIZE, len(data) - start))
+
+        rare_blocks = index.blocks_with(b"rare event")
+        self.assertEqual(len(rare_blocks), 2)
+        for block in rare_blocks:
+            self.assertIn(b"rare event", data[slice(*index.block_range(block))])
+        self.assertIsNone(index.blocks_with(b"ra"))
+        self.assertEqual(index.blocks_with(b"missing"), set())
+        self.assertIsNone(index.candidate_blocks([[b"rare"], [b"no"]]))
+
+    def test_save_and_load(self):
+        index = TrigramIndex.build(self.TEXT_FILE, self.BLOCK_SIZE)
+        index.save()
+        loaded = TrigramIndex.for_file(self.TEXT_FILE)
+        self.assertIsNotNone(loaded)
+        self.assertEqual(loaded.nb_blocks, index.nb_blocks)
+        self.assertEqual(loaded.nb_trigrams, index.nb_trigrams)
+        self.assertEqual(loaded.blocks_with(b"rare event"), index.blocks_with(b"rare event"))
+
+        # Stale once the file changes
+        os.utime(self.TEXT_FILE, ns=(0, 0))
+        self.assertIsNone(TrigramIndex.for_file(self.TEXT_FILE))
+
+    def test_same_matches_as_full_scan(self):
+        index = TrigramIndex.build(self.TEXT_FILE, self.BLOCK_SIZE)
+        searches = [
+            ["rare event", False],
+            ["event 55\nnext", False],
+            [r"rare \w+ \d+\nnext", True],
+            [["rare", "line 99 "], False],
+            [["common", "rare"], False],
+            [r"e\d", True]
+        ]
+        for search, regex in searches:
+            for buffer_sizes in [[0, 1, 0], [2, 3, 1]]:
+                with self.subTest(search=search, buffer_sizes=buffer_sizes):
+                    expected, _ = self._matches(search, regex, buffer_sizes)
+                    got, _ = self._matches(search, regex, buffer_sizes, index)
+                    self.assertEqual(got, expected)
+
+        _, stats = self._matches("rare event", False, [0, 1, 0], index)
+        self.assertEqual(stats.windows, 104)
+        self.assertLess(stats.checked, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()